@@ -16,14 +16,24 @@ Prerequisites:
     - Having set the pi pulse amplitude and duration in the configuration
 """
 
+import os
+import sys
 from qm.qua import *
 from qm import QuantumMachinesManager
 from qm import SimulationConfig
-from scipy.optimize import curve_fit
 from configuration import *
 import matplotlib.pyplot as plt
-import numpy as np
-from qualang_tools.bakery.randomized_benchmark_c1 import c1_table
+
+# the single qubit RB macros and analysis are shared by several folders, see Quantum-Control-Applications/Shared
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Shared"))
+from single_qubit_rb import (
+    generate_sequence,
+    play_sequence,
+    play_truncated_sequences,
+    get_depths,
+    plot_rb_live,
+    analyze_rb,
+)
 
 
 ##############################
@@ -35,117 +45,12 @@ max_circuit_depth = 1000  # Maximum circuit depth
 delta_clifford = 10  #  Play each sequence with a depth step equals to 'delta_clifford - Must be > 1
 assert (max_circuit_depth / delta_clifford).is_integer(), "max_circuit_depth / delta_clifford must be an integer."
 seed = 345324  # Pseudo-random number generator seed
-# List of recovery gates from the lookup table
-inv_gates = [int(np.where(c1_table[i, :] == 0)[0][0]) for i in range(24)]
-
-
-def power_law(power, a, b, p):
-    return a * (p**power) + b
-
-
-def generate_sequence():
-    cayley = declare(int, value=c1_table.flatten().tolist())
-    inv_list = declare(int, value=inv_gates)
-    current_state = declare(int)
-    step = declare(int)
-    sequence = declare(int, size=max_circuit_depth + 1)
-    inv_gate = declare(int, size=max_circuit_depth + 1)
-    i = declare(int)
-    rand = Random(seed=seed)
-
-    assign(current_state, 0)
-    with for_(i, 0, i < max_circuit_depth, i + 1):
-        assign(step, rand.rand_int(24))
-        assign(current_state, cayley[current_state * 24 + step])
-        assign(sequence[i], step)
-        assign(inv_gate[i], inv_list[current_state])
-
-    return sequence, inv_gate
-
-
-def play_sequence(sequence_list, depth):
-    i = declare(int)
-    with for_(i, 0, i <= depth, i + 1):
-        with switch_(sequence_list[i], unsafe=True):
-            with case_(0):
-                wait(pi_len_NV * u.ns, "NV")
-            with case_(1):
-                play("x180", "NV")
-            with case_(2):
-                play("y180", "NV")
-            with case_(3):
-                play("y180", "NV")
-                play("x180", "NV")
-            with case_(4):
-                play("x90", "NV")
-                play("y90", "NV")
-            with case_(5):
-                play("x90", "NV")
-                play("-y90", "NV")
-            with case_(6):
-                play("-x90", "NV")
-                play("y90", "NV")
-            with case_(7):
-                play("-x90", "NV")
-                play("-y90", "NV")
-            with case_(8):
-                play("y90", "NV")
-                play("x90", "NV")
-            with case_(9):
-                play("y90", "NV")
-                play("-x90", "NV")
-            with case_(10):
-                play("-y90", "NV")
-                play("x90", "NV")
-            with case_(11):
-                play("-y90", "NV")
-                play("-x90", "NV")
-            with case_(12):
-                play("x90", "NV")
-            with case_(13):
-                play("-x90", "NV")
-            with case_(14):
-                play("y90", "NV")
-            with case_(15):
-                play("-y90", "NV")
-            with case_(16):
-                play("-x90", "NV")
-                play("y90", "NV")
-                play("x90", "NV")
-            with case_(17):
-                play("-x90", "NV")
-                play("-y90", "NV")
-                play("x90", "NV")
-            with case_(18):
-                play("x180", "NV")
-                play("y90", "NV")
-            with case_(19):
-                play("x180", "NV")
-                play("-y90", "NV")
-            with case_(20):
-                play("y180", "NV")
-                play("x90", "NV")
-            with case_(21):
-                play("y180", "NV")
-                play("-x90", "NV")
-            with case_(22):
-                play("x90", "NV")
-                play("y90", "NV")
-                play("x90", "NV")
-            with case_(23):
-                play("-x90", "NV")
-                play("y90", "NV")
-                play("-x90", "NV")
 
 
 ###################
 # The QUA program #
 ###################
 with program() as rb:
-    depth = declare(int)  # QUA variable for the varying depth
-    depth_target = declare(int)  # QUA variable for the the current depth (changes in steps of delta_clifford)
-    # QUA variable to store the last Clifford gate of the current sequence which is replaced by the recovery gate
-    saved_gate = declare(int)
     m = declare(int)  # QUA variable for the loop over random sequences
     n = declare(int)  # QUA variable for the averaging loop
     counts = declare(int)  # saves number of photon counts
@@ -155,37 +60,27 @@ with program() as rb:
     counts_st = declare_stream()
     times_st = declare_stream()
 
-    with for_(m, 0, m < num_of_sequences, m + 1):  # QUA for_ loop over the random sequences
-        sequence_list, inv_gate_list = generate_sequence()  # Generate the random sequence of length max_circuit_depth
-
-        assign(depth_target, 0)  # Initialize the current depth to 0
-        with for_(depth, 1, depth <= max_circuit_depth, depth + 1):
-            # Replacing the last gate in the sequence with the sequence's inverse gate
-            # The original gate is saved in 'saved_gate' and is being restored at the end
-            assign(saved_gate, sequence_list[depth])
-            assign(sequence_list[depth], inv_gate_list[depth - 1])
-            # Only played the depth corresponding to target_depth
-            with if_((depth == 1) | (depth == depth_target)):
-                # Spin initialization
-                play("laser_ON", "AOM1")
-                wait(wait_for_initialization * u.ns, "AOM1")
-
-                with for_(n, 0, n < n_avg, n + 1):
-                    # The strict_timing ensures that the sequence will be played without gaps
-                    with strict_timing_():
-                        play_sequence(sequence_list, depth)
-                    align()  # Play the laser pulse after the Echo sequence
-                    # Measure and detect the photons on SPCM1
-                    play("laser_ON", "AOM1")
-                    measure("readout", "SPCM1", None, time_tagging.analog(times, meas_len_1, counts))
-                    save(counts, counts_st)  # save counts
-                    wait(wait_between_runs * u.ns)  # wait in between iterations
+    def play_and_measure(sequence_list, depth):
+        # Spin initialization
+        play("laser_ON", "AOM1")
+        wait(wait_for_initialization * u.ns, "AOM1")
+
+        with for_(n, 0, n < n_avg, n + 1):
+            # The strict_timing ensures that the sequence will be played without gaps
+            with strict_timing_():
+                play_sequence(sequence_list, depth, "NV", x180_len_NV)
+            align()  # Play the laser pulse after the Echo sequence
+            # Measure and detect the photons on SPCM1
+            play("laser_ON", "AOM1")
+            measure("readout", "SPCM1", None, time_tagging.analog(times, meas_len_1, counts))
+            save(counts, counts_st)  # save counts
+            wait(wait_between_runs * u.ns)  # wait in between iterations
 
-                # Go to the next depth
-                assign(depth_target, depth_target + delta_clifford)
-            # Reset the last gate of the sequence back to the original Clifford gate
-            # (that was replaced by the recovery gate at the beginning)
-            assign(sequence_list[depth], saved_gate)
+    with for_(m, 0, m < num_of_sequences, m + 1):  # QUA for_ loop over the random sequences
+        # Generate the random sequence of length max_circuit_depth
+        sequence_list, inv_gate_list = generate_sequence(max_circuit_depth, seed)
+        # Play the sequence truncated at every depth, followed by its recovery gate
+        play_truncated_sequences(sequence_list, inv_gate_list, max_circuit_depth, delta_clifford, play_and_measure)
         # Save the counter for the progress bar
         save(m, m_st)
 
@@ -226,65 +121,20 @@ else:
     fig = plt.figure()
     interrupt_on_close(fig, job)  # Interrupts the job when closing the figure
     # data analysis
-    x = np.arange(0, max_circuit_depth + 0.1, delta_clifford)
-    x[0] = 1  # to set the first value of 'x' to be depth = 1 as in the experiment
+    x = get_depths(max_circuit_depth, delta_clifford)
     while results.is_processing():
         # data analysis
         counts_avg, iteration = results.fetch_all()
         # Progress bar
         progress_counter(iteration, num_of_sequences, start_time=results.get_start_time())
         # Plot averaged values
-        plt.cla()
-        plt.plot(x, counts_avg, marker=".")
-        plt.xlabel("Number of Clifford gates")
-        plt.ylabel("Sequence Fidelity")
-        plt.title("Single qubit RB")
+        plot_rb_live(x, counts_avg)
         plt.pause(0.1)
     # At the end of the program, fetch the non-averaged results to get the error-bars
 
     results = fetching_tool(job, data_list=["counts"])
     counts = results.fetch_all()[0]
-    value_avg = np.mean(counts, axis=0)
-    error_avg = np.std(counts, axis=0)
-    # data analysis
-    pars, cov = curve_fit(
-        f=power_law,
-        xdata=x,
-        ydata=value_avg,
-        p0=[0.5, 0.5, 0.9],
-        bounds=(-np.inf, np.inf),
-        maxfev=2000,
-    )
-    stdevs = np.sqrt(np.diag(cov))
-
-    print("#########################")
-    print("### Fitted Parameters ###")
-    print("#########################")
-    print(f"A = {pars[0]:.3} ({stdevs[0]:.1}), B = {pars[1]:.3} ({stdevs[1]:.1}), p = {pars[2]:.3} ({stdevs[2]:.1})")
-    print("Covariance Matrix")
-    print(cov)
-
-    one_minus_p = 1 - pars[2]
-    r_c = one_minus_p * (1 - 1 / 2**1)
-    r_g = r_c / 1.875  # 1.875 is the average number of gates in clifford operation
-    r_c_std = stdevs[2] * (1 - 1 / 2**1)
-    r_g_std = r_c_std / 1.875
-
-    print("#########################")
-    print("### Useful Parameters ###")
-    print("#########################")
-    print(
-        f"Error rate: 1-p = {np.format_float_scientific(one_minus_p, precision=2)} ({stdevs[2]:.1})\n"
-        f"Clifford set infidelity: r_c = {np.format_float_scientific(r_c, precision=2)} ({r_c_std:.1})\n"
-        f"Gate infidelity: r_g = {np.format_float_scientific(r_g, precision=2)}  ({r_g_std:.1})"
-    )
-
-    # Plots
-    plt.figure()
-    plt.errorbar(x, value_avg, yerr=error_avg, marker=".")
-    plt.plot(x, power_law(x, *pars), linestyle="--", linewidth=2)
-    plt.xlabel("Number of Clifford gates")
-    plt.ylabel("Sequence Fidelity")
-    plt.title("Single qubit RB")
+    # data analysis: fit, print the fitted parameters and plot
+    pars, cov = analyze_rb(x, counts)
 
     # np.savez("rb_values", value)
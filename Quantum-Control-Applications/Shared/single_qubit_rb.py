@@ -0,0 +1,649 @@
+"""
+This file contains the QUA macros and the analysis shared by the single-qubit randomized benchmarking scripts.
+
+The Clifford gates are played from a decomposition table into the operations defined in the configuration, which can be
+replaced for a different native gate set, and the random sequences can be interleaved with a chosen Clifford gate.
+The sequences are either generated on the FPGA, which loops over all the depths of a sequence to find the recovery
+gates, or generated on the host and sent through input streams with the recovery gates of the played depths only.
+Pairs of short gates can be baked into single operations, whose waveforms are cached on disk.
+The single-qubit RB scripts of every folder import this file, by adding the `Shared` folder to the python path.
+"""
+
+import copy
+import hashlib
+import itertools
+import json
+import warnings
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import matplotlib.pyplot as plt
+import numpy as np
+from qm.qua import *
+from qualang_tools.bakery import baking
+from qualang_tools.bakery.randomized_benchmark_c1 import c1_table
+from scipy.optimize import OptimizeWarning, curve_fit
+
+# Decomposition of the 24 single-qubit Clifford gates, in the order of `c1_table`, into the operations of the qubit
+# element. "I" is played as a wait of the duration of a pi pulse.
+c1_ops = [
+    ("I",),
+    ("x180",),
+    ("y180",),
+    ("y180", "x180"),
+    ("x90", "y90"),
+    ("x90", "-y90"),
+    ("-x90", "y90"),
+    ("-x90", "-y90"),
+    ("y90", "x90"),
+    ("y90", "-x90"),
+    ("-y90", "x90"),
+    ("-y90", "-x90"),
+    ("x90",),
+    ("-x90",),
+    ("y90",),
+    ("-y90",),
+    ("-x90", "y90", "x90"),
+    ("-x90", "-y90", "x90"),
+    ("x180", "y90"),
+    ("x180", "-y90"),
+    ("y180", "x90"),
+    ("y180", "-x90"),
+    ("x90", "y90", "x90"),
+    ("-x90", "y90", "-x90"),
+]
+# Index of the recovery gate of every Clifford gate, from the Cayley table
+inv_gates = [int(np.where(c1_table[i, :] == 0)[0][0]) for i in range(24)]
+
+
+def clifford_name(index: int, decomposition: Sequence[Tuple[str, ...]] = c1_ops) -> str:
+    """Returns the name of a Clifford gate from its decomposition, e.g. 'y180' for index 2."""
+    return " ".join(decomposition[index])
+
+
+##############
+# QUA macros #
+##############
+def generate_sequence(max_circuit_depth: int, seed: int, interleaved_gate_index: Optional[int] = None):
+    """
+    Generates a random sequence of `max_circuit_depth` Clifford gates on the FPGA, along with the recovery gate to play
+    after every gate of the sequence, found from the Cayley table.
+
+    :param max_circuit_depth: number of random Clifford gates in the sequence.
+    :param seed: seed of the pseudo-random number generator.
+    :param interleaved_gate_index: if given, the index of the Clifford gate interleaved after every random gate, which
+        doubles the length of the sequence.
+    :return: the QUA arrays of the sequence and of the recovery gates.
+    """
+    step_size = 1 if interleaved_gate_index is None else 2
+    cayley = declare(int, value=c1_table.flatten().tolist())
+    inv_list = declare(int, value=inv_gates)
+    current_state = declare(int)
+    step = declare(int)
+    sequence = declare(int, size=step_size * max_circuit_depth + 1)
+    inv_gate = declare(int, size=step_size * max_circuit_depth + 1)
+    i = declare(int)
+    rand = Random(seed=seed)
+
+    assign(current_state, 0)
+    with for_(i, 0, i < step_size * max_circuit_depth, i + step_size):
+        assign(step, rand.rand_int(24))
+        assign(current_state, cayley[current_state * 24 + step])
+        assign(sequence[i], step)
+        assign(inv_gate[i], inv_list[current_state])
+        if interleaved_gate_index is not None:
+            assign(step, interleaved_gate_index)
+            assign(current_state, cayley[current_state * 24 + step])
+            assign(sequence[i + 1], step)
+            assign(inv_gate[i + 1], inv_list[current_state])
+
+    return sequence, inv_gate
+
+
+def play_sequence(sequence_list, depth, element: str, pi_len: int, decomposition: Sequence[Tuple[str, ...]] = c1_ops):
+    """
+    Plays the Clifford gates of `sequence_list` up to index `depth` (included) on `element`.
+
+    :param sequence_list: the QUA array of Clifford gate indices.
+    :param depth: the QUA int of the index of the last gate to play.
+    :param element: the qubit element.
+    :param pi_len: the duration of the pi pulse in ns, which is the duration of the identity gate.
+    :param decomposition: the operations of every Clifford gate, defaults to `c1_ops`.
+    """
+    i = declare(int)
+    with for_(i, 0, i <= depth, i + 1):
+        with switch_(sequence_list[i], unsafe=True):
+            for index, operations in enumerate(decomposition):
+                with case_(index):
+                    for operation in operations:
+                        if operation == "I":
+                            wait(pi_len // 4, element)
+                        else:
+                            play(operation, element)
+
+
+def play_truncated_sequences(
+    sequence_list,
+    inv_gate_list,
+    max_circuit_depth: int,
+    delta_clifford: int,
+    play_and_measure: Callable,
+    interleaved: bool = False,
+):
+    """
+    Loops over the truncations of a random sequence: at depth 1 and then every `delta_clifford` depths, the gate
+    following the truncated sequence is replaced by the recovery gate and `play_and_measure(sequence_list, depth)` is
+    called to play the sequence up to the recovery gate `depth` and measure the qubit.
+
+    :param sequence_list: the QUA array of the random sequence, from `generate_sequence`.
+    :param inv_gate_list: the QUA array of the recovery gates, from `generate_sequence`.
+    :param max_circuit_depth: the number of random Clifford gates in the sequence.
+    :param delta_clifford: the step between the played depths.
+    :param play_and_measure: a python function writing the QUA code that plays and measures the truncated sequence.
+    :param interleaved: whether the sequence was generated with an interleaved gate, in which case the gates are
+        played by pairs [(random_gate-interleaved_gate)^depth-inv_gate].
+    """
+    step_size = 1 if not interleaved else 2
+    depth = declare(int)  # QUA variable for the varying depth
+    depth_target = declare(int)  # QUA variable for the current depth (changes in steps of delta_clifford)
+    # QUA variable to store the last Clifford gate of the current sequence which is replaced by the recovery gate
+    saved_gate = declare(int)
+
+    assign(depth_target, 0)  # Initialize the current depth to 0
+    with for_(depth, 1, depth <= step_size * max_circuit_depth, depth + 1):  # Loop over the depths
+        # Replacing the last gate in the sequence with the sequence's inverse gate
+        # The original gate is saved in 'saved_gate' and is being restored at the end
+        assign(saved_gate, sequence_list[depth])
+        assign(sequence_list[depth], inv_gate_list[depth - 1])
+        # Only played the depth corresponding to target_depth
+        with if_((depth == step_size) | (depth == depth_target)):
+            play_and_measure(sequence_list, depth)
+            # Go to the next depth
+            assign(depth_target, depth_target + step_size * delta_clifford)
+        # Reset the last gate of the sequence back to the original Clifford gate
+        # (that was replaced by the recovery gate at the beginning)
+        assign(sequence_list[depth], saved_gate)
+
+
+def play_sequence_at_depths(
+    max_circuit_depth: int,
+    depths: Sequence[int],
+    seed: int,
+    play_and_measure: Callable,
+    interleaved_gate_index: Optional[int] = None,
+):
+    """
+    Generates a random sequence on the FPGA and plays its truncations at the given depths only, e.g. log-spaced ones.
+    The random gates are drawn, and the running Clifford product updated from the Cayley table, only between two
+    consecutive depths, then the recovery gate of the running product is written after the truncated sequence and
+    `play_and_measure(sequence_list, depth)` is called as in `play_truncated_sequences`. The recovery gate is
+    overwritten by the next random gate, so nothing needs to be restored.
+
+    :param max_circuit_depth: the number of random Clifford gates of the longest sequence.
+    :param depths: the increasing number of gates of every truncated sequence, e.g. from `get_depths` or
+        `get_log_depths`.
+    :param seed: seed of the pseudo-random number generator.
+    :param play_and_measure: a python function writing the QUA code that plays and measures the truncated sequence.
+    :param interleaved_gate_index: if given, the index of the Clifford gate interleaved after every random gate, in
+        which case the depths count both the random and the interleaved gates and must be even.
+    """
+    step_size = 1 if interleaved_gate_index is None else 2
+    depths = [int(d) for d in depths]
+    if depths != sorted(set(depths)) or depths[0] < step_size or depths[-1] > step_size * max_circuit_depth:
+        raise ValueError(f"depths must be increasing and between {step_size} and {step_size * max_circuit_depth}")
+    if interleaved_gate_index is not None and any(d % 2 for d in depths):
+        raise ValueError("depths must be even with an interleaved gate")
+    cayley = declare(int, value=c1_table.flatten().tolist())
+    inv_list = declare(int, value=inv_gates)
+    current_state = declare(int)  # QUA variable for the running Clifford product of the sequence
+    step = declare(int)
+    sequence = declare(int, size=step_size * max_circuit_depth + 1)
+    i = declare(int)  # QUA variable for the number of gates generated so far
+    depth = declare(int)  # QUA variable for the number of gates before the recovery gate
+    rand = Random(seed=seed)
+
+    assign(current_state, 0)
+    assign(i, 0)
+    with for_each_(depth, depths):
+        # Extend the sequence up to the current depth
+        with while_(i < depth):
+            assign(step, rand.rand_int(24))
+            assign(current_state, cayley[current_state * 24 + step])
+            assign(sequence[i], step)
+            if interleaved_gate_index is not None:
+                assign(step, interleaved_gate_index)
+                assign(current_state, cayley[current_state * 24 + step])
+                assign(sequence[i + 1], step)
+            assign(i, i + step_size)
+        # Append the recovery gate, which will be replaced by the next random gate
+        assign(sequence[depth], inv_list[current_state])
+        play_and_measure(sequence, depth)
+
+
+def declare_sequence_input_streams(max_circuit_depth: int, num_depths: int, interleaved: bool = False):
+    """
+    Declares the input streams through which `stream_sequences` sends the random sequences: one with the Clifford gates
+    of a sequence, and one with the recovery gates of its truncations played by `play_streamed_sequences`.
+
+    :return: the QUA arrays of the sequence and of the recovery gates.
+    """
+    step_size = 1 if not interleaved else 2
+    sequence = declare_input_stream(int, name="rb_sequence", size=step_size * max_circuit_depth + 1)
+    recovery_gates = declare_input_stream(int, name="rb_recovery_gates", size=num_depths)
+    return sequence, recovery_gates
+
+
+def play_streamed_sequences(sequence_stream, recovery_stream, depths: Sequence[int], play_and_measure: Callable):
+    """
+    Receives the next random sequence and its recovery gates from the input streams and plays its truncations at the
+    given depths only, with `play_and_measure(sequence_list, depth)` as in `play_truncated_sequences`. Unlike with
+    `generate_sequence`, the Cayley table and the recovery gate after every depth are not stored on the FPGA, and the
+    depths which are not played are not looped over.
+
+    :param sequence_stream: the input stream of the sequence, from `declare_sequence_input_streams`.
+    :param recovery_stream: the input stream of the recovery gates, from `declare_sequence_input_streams`.
+    :param depths: the number of gates of every truncated sequence, as returned by `get_depths`.
+    :param play_and_measure: a python function writing the QUA code that plays and measures the truncated sequence.
+    """
+    depth = declare(int)  # QUA variable for the number of gates before the recovery gate
+    index = declare(int)  # QUA variable for the index of the depth in 'depths'
+    # QUA variable to store the Clifford gate of the sequence which is replaced by the recovery gate
+    saved_gate = declare(int)
+
+    advance_input_stream(sequence_stream)
+    advance_input_stream(recovery_stream)
+    assign(index, 0)
+    with for_each_(depth, [int(d) for d in depths]):
+        # Replacing the gate following the truncated sequence with its recovery gate, and restoring it afterwards
+        assign(saved_gate, sequence_stream[depth])
+        assign(sequence_stream[depth], recovery_stream[index])
+        play_and_measure(sequence_stream, depth)
+        assign(sequence_stream[depth], saved_gate)
+        assign(index, index + 1)
+
+
+def generate_sequence_on_host(
+    max_circuit_depth: int, rng: np.random.Generator, interleaved_gate_index: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Host counterpart of `generate_sequence`, drawing the random Clifford gates from `rng`.
+
+    :return: the sequence, with a trailing identity, and the recovery gate to play after every gate of the sequence.
+    """
+    step_size = 1 if interleaved_gate_index is None else 2
+    sequence = np.zeros(step_size * max_circuit_depth + 1, dtype=int)
+    sequence[0 : step_size * max_circuit_depth : step_size] = rng.integers(0, 24, max_circuit_depth)
+    if interleaved_gate_index is not None:
+        sequence[1 : step_size * max_circuit_depth : step_size] = interleaved_gate_index
+    states = np.empty(step_size * max_circuit_depth, dtype=int)
+    current_state = 0
+    for i, gate in enumerate(sequence[:-1].tolist()):
+        current_state = c1_table[current_state, gate]
+        states[i] = current_state
+    return sequence, np.array(inv_gates)[states]
+
+
+def stream_sequences(
+    job,
+    num_of_sequences: int,
+    max_circuit_depth: int,
+    depths: Sequence[int],
+    seed: Optional[int] = None,
+    interleaved_gate_index: Optional[int] = None,
+):
+    """
+    Generates the random sequences on the host and inserts them, with the recovery gates of the given depths, into the
+    input streams of the job running `play_streamed_sequences`.
+    """
+    rng = np.random.default_rng(seed)
+    recovery_indices = np.asarray(depths, dtype=int) - 1
+    for _ in range(num_of_sequences):
+        sequence, inv_gate = generate_sequence_on_host(max_circuit_depth, rng, interleaved_gate_index)
+        job.insert_input_stream("rb_sequence", sequence.tolist())
+        job.insert_input_stream("rb_recovery_gates", inv_gate[recovery_indices].tolist())
+
+
+####################
+# Baked gate pairs #
+####################
+def _gate_pairs_cache_key(config: dict, element: str, gates: Sequence[str], pi_len: int) -> str:
+    """Hash of the gates and of the pulses and waveforms they play, which identifies the baked waveforms."""
+    operations = config["elements"][element]["operations"]
+    pulses = {gate: config["pulses"][operations[gate]] for gate in gates if gate != "I"}
+    waveforms = {name: config["waveforms"][name] for pulse in pulses.values() for name in pulse["waveforms"].values()}
+    content = json.dumps(
+        [element, list(gates), pi_len, pulses, waveforms], sort_keys=True, default=lambda x: np.asarray(x).tolist()
+    )
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+
+def _bake_gate_pairs(config: dict, element: str, gates: Sequence[str], pi_len: int) -> Dict[str, List[np.ndarray]]:
+    """Bakes every pair of gates and returns the samples of every input of the element, in the order of the pairs."""
+    scratch_config = copy.deepcopy(config)
+    samples = {}
+    for first, second in itertools.product(gates, repeat=2):
+        with baking(scratch_config, padding_method="right") as b:
+            for gate in (first, second):
+                if gate == "I":
+                    b.wait(pi_len, element)
+                else:
+                    b.play(gate, element)
+        pulse = scratch_config["pulses"][scratch_config["elements"][element]["operations"][b.get_op_name(element)]]
+        for port, waveform in pulse["waveforms"].items():
+            samples.setdefault(port, []).append(np.asarray(scratch_config["waveforms"][waveform]["samples"]))
+    return samples
+
+
+def bake_gate_pairs(
+    config: dict, element: str, gates: Sequence[str], pi_len: int, cache_dir: Optional[Union[str, Path]] = None
+) -> List[Tuple[str]]:
+    """
+    Bakes every pair of single-qubit gates into a single operation of `element`, added to the config, so that a pair of
+    short gates is played by a single play statement. The baked waveforms are cached in `cache_dir` (by default the
+    folder "baked_gate_pairs" of the working directory), under a hash of the pulses of the gates in the config, and are
+    only baked again when these pulses change.
+
+    :param config: the configuration, to which the baked operations are added.
+    :param element: the qubit element.
+    :param gates: the operations of the single-qubit gates, "I" being a wait of duration `pi_len`.
+    :param pi_len: the duration of the pi pulse in ns, which is the duration of the identity gate.
+    :param cache_dir: the folder of the cached waveforms.
+    :return: the baked operation of every pair (gates[i], gates[j]) at index `i * len(gates) + j`, in the format of the
+        decomposition table of `play_sequence`.
+    """
+    cache_dir = Path(cache_dir) if cache_dir is not None else Path().absolute() / "baked_gate_pairs"
+    cache_file = cache_dir / f"{element}_{_gate_pairs_cache_key(config, element, gates, pi_len)}.npz"
+    if cache_file.exists():
+        with np.load(cache_file) as cached:
+            ports = [name[: -len("_offsets")] for name in cached.files if name.endswith("_offsets")]
+            samples = {port: np.split(cached[port], cached[f"{port}_offsets"][1:-1]) for port in ports}
+    else:
+        samples = _bake_gate_pairs(config, element, gates, pi_len)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        arrays = {}
+        for port, port_samples in samples.items():
+            arrays[port] = np.concatenate(port_samples)
+            arrays[f"{port}_offsets"] = np.cumsum([0] + [len(s) for s in port_samples])
+        np.savez(cache_file, **arrays)
+
+    baked_operations = []
+    for index, (first, second) in enumerate(itertools.product(gates, repeat=2)):
+        operation = f"baked_{first}_{second}"
+        pulse = f"{element}_{operation}_pulse"
+        config["pulses"][pulse] = {
+            "operation": "control",
+            "length": len(samples[next(iter(samples))][index]),
+            "waveforms": {port: f"{pulse}_wf_{port}" for port in samples},
+        }
+        for port in samples:
+            config["waveforms"][f"{pulse}_wf_{port}"] = {"type": "arbitrary", "samples": samples[port][index].tolist()}
+        config["elements"][element]["operations"][operation] = pulse
+        baked_operations.append((operation,))
+    return baked_operations
+
+
+#################
+# Data analysis #
+#################
+def get_depths(max_circuit_depth: int, delta_clifford: int, interleaved: bool = False) -> np.ndarray:
+    """
+    Returns the number of gates of every truncated sequence played by `play_truncated_sequences`, i.e. 1 and then
+    every `delta_clifford` (twice as many gates if interleaved).
+    """
+    x = np.arange(0, max_circuit_depth + 0.1, delta_clifford)
+    x[0] = 1  # to set the first value of 'x' to be depth = 1 as in the experiment
+    return x if not interleaved else 2 * x
+
+
+def get_log_depths(max_circuit_depth: int, num_depths: int, interleaved: bool = False) -> np.ndarray:
+    """
+    Returns up to `num_depths` log-spaced numbers of gates between 1 and `max_circuit_depth` (twice as many gates if
+    interleaved), to be played by `play_sequence_at_depths` or `play_streamed_sequences`.
+    """
+    x = np.unique(np.round(np.geomspace(1, max_circuit_depth, num_depths)).astype(int))
+    return x if not interleaved else 2 * x
+
+
+def power_law(power, a, b, p):
+    return a * (p**power) + b
+
+
+def rb_error_rates(p):
+    """
+    Returns the Clifford set infidelity r_c and the gate infidelity r_g of the depolarizing parameter p, which can be
+    an array.
+    """
+    r_c = (1 - np.asarray(p)) * (1 - 1 / 2**1)
+    r_g = r_c / 1.875  # 1.875 is the average number of gates in clifford operation
+    return r_c, r_g
+
+
+def interleaved_gate_error(p_ref, p_interleaved):
+    """
+    Returns the error of the interleaved gate, from the depolarizing parameter p_ref of the reference RB and
+    p_interleaved of the interleaved RB, both per Clifford gate (Magesan et al., PRL 109, 080505 (2012)). They can be
+    arrays.
+
+    Note that if the interleaved RB is fitted against the number of gates including the interleaved ones, as given by
+    `get_depths(..., interleaved=True)`, the decay per random Clifford gate is the square of the fitted p.
+    """
+    return (1 - 1 / 2**1) * (1 - np.asarray(p_interleaved) / np.asarray(p_ref))
+
+
+def fit_rb(x, value_avg, p0=(0.5, 0.5, 0.9), sigma=None):
+    """
+    Fits the averaged sequence fidelity to `power_law`, weighted by the uncertainty `sigma` of every depth if given.
+    Returns the fitted parameters (a, b, p) and covariance.
+    """
+    pars, cov = curve_fit(
+        f=power_law,
+        xdata=x,
+        ydata=value_avg,
+        p0=list(p0),
+        sigma=sigma,
+        absolute_sigma=sigma is not None,
+        bounds=(-np.inf, np.inf),
+        maxfev=2000,
+    )
+    return pars, cov
+
+
+def _depth_weights(mean, mean_of_squares, num_of_sequences: int):
+    """The inverse of the variance of the mean over the sequences, at every depth (along the last axis)."""
+    variance = (mean_of_squares - mean**2) * num_of_sequences / max(num_of_sequences - 1, 1)
+    # depths whose values are the same for all sequences (e.g. the first ones) are weighted as the least noisy depth
+    floor = np.max(variance, axis=-1, keepdims=True) * 1e-6 + np.finfo(float).tiny
+    return num_of_sequences / np.maximum(variance, floor)
+
+
+def fit_rb_sequences(x, values, weights=None, p0=(0.5, 0.5, 0.9)):
+    """
+    Fits all the random sequences jointly, i.e. fits the mean over the sequences (`values` has the shape
+    (num_of_sequences, len(x))) weighted at every depth by the inverse of the variance of the mean, or by `weights`.
+    Returns the fitted parameters (a, b, p) and covariance.
+    """
+    values = np.asarray(values, dtype=float)
+    value_avg = np.mean(values, axis=0)
+    if weights is None:
+        weights = _depth_weights(value_avg, np.mean(values**2, axis=0), len(values))
+    return fit_rb(x, value_avg, p0, sigma=1 / np.sqrt(weights))
+
+
+def _fit_power_law_batch(x, y, weights, pars, num_iterations: int = 30):
+    """
+    Weighted least-squares fits of `power_law` to every row of y, all at once, by Gauss-Newton iterations from the
+    parameters of every row (pars has the shape (len(y), 3)). Returns the fitted parameters of every row.
+    """
+    x = np.asarray(x, dtype=float)
+    a, b, p = np.array(pars, dtype=float).T
+    damping = 1e-9 * np.eye(3)
+    for _ in range(num_iterations):
+        p_x = p[:, np.newaxis] ** x
+        residuals = y - (a[:, np.newaxis] * p_x + b[:, np.newaxis])
+        jacobian = np.stack([p_x, np.ones_like(p_x), a[:, np.newaxis] * x * p_x / p[:, np.newaxis]], axis=-1)
+        weighted_jacobian = jacobian * weights[..., np.newaxis]
+        jtj = np.einsum("ndi,ndj->nij", weighted_jacobian, jacobian)
+        jtr = np.einsum("ndi,nd->ni", weighted_jacobian, residuals)
+        step = np.linalg.solve(jtj + damping * np.trace(jtj, axis1=1, axis2=2)[:, np.newaxis, np.newaxis], jtr)
+        a, b = a + step[:, 0], b + step[:, 1]
+        p = np.clip(p + step[:, 2], 1e-6, None)
+    return np.stack([a, b, p], axis=-1)
+
+
+def _bootstrap_fits(x, values, num_resamples: int, rng: np.random.Generator, weights=None):
+    """
+    Fits `num_resamples` resamples (with replacement) of the random sequences, all at once, as `fit_rb_sequences`.
+    Returns the fitted parameters of the full data and of every resample.
+    """
+    values = np.asarray(values, dtype=float)
+    num_of_sequences = len(values)
+    pars, _ = fit_rb_sequences(x, values, weights)
+    # the number of times every sequence is drawn in every resample
+    draws = rng.integers(0, num_of_sequences, (num_resamples, num_of_sequences))
+    draws += num_of_sequences * np.arange(num_resamples)[:, np.newaxis]
+    counts = np.bincount(draws.ravel(), minlength=num_resamples * num_of_sequences)
+    counts = counts.reshape(num_resamples, num_of_sequences) / num_of_sequences
+    mean = counts @ values
+    if weights is None:
+        weights = _depth_weights(mean, counts @ values**2, num_of_sequences)
+    weights = np.broadcast_to(weights, mean.shape)
+    return pars, _fit_power_law_batch(x, mean, weights, np.tile(pars, (num_resamples, 1)))
+
+
+def _confidence_interval(samples, confidence: float):
+    return np.nanquantile(samples, [(1 - confidence) / 2, (1 + confidence) / 2])
+
+
+def bootstrap_rb(x, values, num_resamples: int = 1000, confidence: float = 0.95, weights=None, seed=None):
+    """
+    Bootstrap confidence intervals of the depolarizing parameter p, the Clifford set infidelity r_c and the gate
+    infidelity r_g, from the values of every random sequence (an array of shape (num_of_sequences, len(x))). The
+    sequences are resampled with replacement and all the resamples are fitted at once as in `fit_rb_sequences`.
+
+    :return: a dictionary from "p", "r_c" and "r_g" to their estimate and the bounds of their confidence interval.
+    """
+    rng = np.random.default_rng(seed)
+    pars, resampled_pars = _bootstrap_fits(x, values, num_resamples, rng, weights)
+    estimates = dict(zip(["r_c", "r_g"], rb_error_rates(pars[2])), p=pars[2])
+    samples = dict(zip(["r_c", "r_g"], rb_error_rates(resampled_pars[:, 2])), p=resampled_pars[:, 2])
+    return {
+        name: (float(estimates[name]), *_confidence_interval(samples[name], confidence)) for name in ["p", "r_c", "r_g"]
+    }
+
+
+def bootstrap_interleaved_rb(
+    x_ref,
+    values_ref,
+    x_interleaved,
+    values_interleaved,
+    num_resamples: int = 1000,
+    confidence: float = 0.95,
+    seed=None,
+):
+    """
+    Bootstrap confidence interval of the error of the interleaved gate (see `interleaved_gate_error`), from the values
+    of every random sequence of the reference and of the interleaved RB, which are resampled independently.
+    `x_interleaved` is the number of random Clifford gates, i.e. without the interleaved ones.
+
+    :return: a dictionary from "p_ref", "p_interleaved" and "r_gate" to their estimate and the bounds of their
+        confidence interval.
+    """
+    rng = np.random.default_rng(seed)
+    pars_ref, resampled_ref = _bootstrap_fits(x_ref, values_ref, num_resamples, rng)
+    pars_int, resampled_int = _bootstrap_fits(x_interleaved, values_interleaved, num_resamples, rng)
+    estimates = {
+        "p_ref": pars_ref[2],
+        "p_interleaved": pars_int[2],
+        "r_gate": interleaved_gate_error(pars_ref[2], pars_int[2]),
+    }
+    samples = {
+        "p_ref": resampled_ref[:, 2],
+        "p_interleaved": resampled_int[:, 2],
+        "r_gate": interleaved_gate_error(resampled_ref[:, 2], resampled_int[:, 2]),
+    }
+    return {name: (float(estimates[name]), *_confidence_interval(samples[name], confidence)) for name in estimates}
+
+
+def print_rb_parameters(pars, cov):
+    """Prints the fitted parameters and the error rates derived from them."""
+    stdevs = np.sqrt(np.diag(cov))
+
+    print("#########################")
+    print("### Fitted Parameters ###")
+    print("#########################")
+    print(f"A = {pars[0]:.3} ({stdevs[0]:.1}), B = {pars[1]:.3} ({stdevs[1]:.1}), p = {pars[2]:.3} ({stdevs[2]:.1})")
+    print("Covariance Matrix")
+    print(cov)
+
+    one_minus_p = 1 - pars[2]
+    r_c, r_g = rb_error_rates(pars[2])
+    # the error rates are linear in p, so their standard deviations are the one of p times the same factors
+    r_c_std = stdevs[2] * (1 - 1 / 2**1)
+    r_g_std = r_c_std / 1.875
+
+    print("#########################")
+    print("### Useful Parameters ###")
+    print("#########################")
+    print(
+        f"Error rate: 1-p = {np.format_float_scientific(one_minus_p, precision=2)} ({stdevs[2]:.1})\n"
+        f"Clifford set infidelity: r_c = {np.format_float_scientific(r_c, precision=2)} ({r_c_std:.1})\n"
+        f"Gate infidelity: r_g = {np.format_float_scientific(r_g, precision=2)}  ({r_g_std:.1})"
+    )
+
+
+def print_confidence_intervals(intervals, confidence: float = 0.95):
+    """Prints the confidence intervals returned by `bootstrap_rb` or `bootstrap_interleaved_rb`."""
+    print(f"{confidence:.0%} bootstrap confidence intervals:")
+    for name, (estimate, low, high) in intervals.items():
+        print(f"{name} = {estimate:.6g} [{low:.6g}, {high:.6g}]")
+
+
+def plot_rb_live(x, value_avg, title="Single qubit RB"):
+    """
+    Plots the averaged values on the current figure, for live plotting, with their fit to `power_law` once it converges.
+
+    Only the average over the sequences measured so far is fetched while the program runs, so the fit is `fit_rb` of
+    that average, i.e. the joint fit of `fit_rb_sequences` with all the depths weighted equally. The weighted fit and
+    the confidence intervals are computed from the values of every sequence by `analyze_rb`, once the program is done.
+    """
+    plt.cla()
+    plt.plot(x, value_avg, marker=".")
+    value_avg = np.asarray(value_avg, dtype=float)
+    if len(x) > 3 and np.all(np.isfinite(value_avg)):
+        try:
+            with warnings.catch_warnings():
+                # the fit of the first, noisy averages may not converge or may leave the covariance undefined
+                warnings.simplefilter("ignore", OptimizeWarning)
+                pars, _ = fit_rb(x, value_avg, p0=(value_avg[0] - value_avg[-1], value_avg[-1], 0.9))
+        except (RuntimeError, ValueError):
+            pass
+        else:
+            plt.plot(x, power_law(np.asarray(x), *pars), linestyle="--", label=f"p = {pars[2]:.4}")
+            plt.legend()
+    plt.xlabel("Number of Clifford gates")
+    plt.ylabel("Sequence Fidelity")
+    plt.title(title)
+
+
+def analyze_rb(x, values, title="Single qubit RB", num_resamples: int = 1000):
+    """
+    Fits the values measured for every random sequence (an array of shape (num_of_sequences, len(x))) jointly to
+    `power_law` with `fit_rb_sequences`, prints the fitted parameters and their bootstrap confidence intervals and plots
+    the data with the fit.
+
+    :return: the fitted parameters (a, b, p) and their covariance.
+    """
+    value_avg = np.mean(values, axis=0)
+    error_avg = np.std(values, axis=0)
+    pars, cov = fit_rb_sequences(x, values)
+    print_rb_parameters(pars, cov)
+    if len(values) > 1 and num_resamples:
+        print_confidence_intervals(bootstrap_rb(x, values, num_resamples))
+
+    plt.figure()
+    plt.errorbar(x, value_avg, yerr=error_avg, marker=".")
+    plt.plot(x, power_law(x, *pars), linestyle="--", linewidth=2)
+    plt.xlabel("Number of Clifford gates")
+    plt.ylabel("Sequence Fidelity")
+    plt.title(title)
+    return pars, cov
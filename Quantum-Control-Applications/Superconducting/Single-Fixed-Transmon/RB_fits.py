@@ -1,10 +1,19 @@
-from scipy.optimize import curve_fit
+import os
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 
-
-def power_law(m, a, b, p):
-    return a * (p**m) + b
+# the single qubit RB macros and analysis are shared by several folders, see Quantum-Control-Applications/Shared
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Shared"))
+from single_qubit_rb import (
+    power_law,
+    fit_rb,
+    fit_rb_sequences,
+    bootstrap_rb,
+    bootstrap_interleaved_rb,
+    print_rb_parameters,
+    print_confidence_intervals,
+)
 
 
 # Generate dummy dataset
@@ -21,37 +30,27 @@ plt.title("Dummy data")
 plt.xlabel("Number of Clifford gates")
 plt.ylabel("Sequence Fidelity")
 
-pars, cov = curve_fit(
-    f=power_law,
-    xdata=x_dummy,
-    ydata=y_dummy,
-    p0=[0.5, 0.5, 1],
-    bounds=(-np.inf, np.inf),
-    maxfev=2000,
-)
+pars, cov = fit_rb(x_dummy, y_dummy, p0=[0.5, 0.5, 1])
 
 plt.plot(x_dummy, power_law(x_dummy, *pars), linestyle="--", linewidth=2)
 
-stdevs = np.sqrt(np.diag(cov))
-
-print("#########################")
-print("### Fitted Parameters ###")
-print("#########################")
-print(f"A = {pars[0]:.3} ({stdevs[0]:.1}), B = {pars[1]:.3} ({stdevs[1]:.1}), p = {pars[2]:.3} ({stdevs[2]:.1})")
-print("Covariance Matrix")
-print(cov)
-
-one_minus_p = 1 - pars[2]
-r_c = one_minus_p * (1 - 1 / 2**1)
-r_g = r_c / 1.875  # 1.875 is the average number of gates in clifford operation
-r_c_std = stdevs[2] * (1 - 1 / 2**1)
-r_g_std = r_c_std / 1.875
-
-print("#########################")
-print("### Useful Parameters ###")
-print("#########################")
-print(
-    f"Error rate: 1-p = {np.format_float_scientific(one_minus_p, precision=2)} ({stdevs[2]:.1})\n"
-    f"Clifford set infidelity: r_c = {np.format_float_scientific(r_c, precision=2)} ({r_c_std:.1})\n"
-    f"Gate infidelity: r_g = {np.format_float_scientific(r_g, precision=2)}  ({r_g_std:.1})"
-)
+print_rb_parameters(pars, cov)
+
+# Generate a dummy dataset of 50 random sequences, whose spread grows with the depth
+num_of_sequences = 50
+spread = 0.02 * np.sqrt(x_dummy / x_dummy.max())
+sequences_dummy = y_dummy - noise + spread * np.random.normal(size=(num_of_sequences, x_dummy.size))
+
+# Fit all the sequences jointly, weighted by the spread of the sequences at every depth
+pars, cov = fit_rb_sequences(x_dummy, sequences_dummy)
+print_rb_parameters(pars, cov)
+# Confidence intervals of p, r_c and r_g from 1000 resamples of the sequences
+print_confidence_intervals(bootstrap_rb(x_dummy, sequences_dummy, num_resamples=1000))
+
+# Generate a dummy interleaved RB dataset, whose decay per random Clifford gate is the product of the reference decay
+# and of the decay of the interleaved gate
+p_gate = 1 - 1e-3
+interleaved_dummy = power_law(x_dummy, 0.46, 0.53, (1 - 1.80e-3) * p_gate)
+interleaved_dummy = interleaved_dummy + spread * np.random.normal(size=(num_of_sequences, x_dummy.size))
+# Error of the interleaved gate, expected to be (1 - p_gate) / 2 = 5e-4
+print_confidence_intervals(bootstrap_interleaved_rb(x_dummy, sequences_dummy, x_dummy, interleaved_dummy))
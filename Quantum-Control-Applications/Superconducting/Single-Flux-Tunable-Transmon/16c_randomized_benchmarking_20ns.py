@@ -4,6 +4,8 @@ Because of the latency of the switch/case commands (40ns), we cannot play a rand
 using the standard RB script.
 The trick is to convert the random sequence made of Clifford operations into a sequence of single qubit gates
 (X, Y, X/2...) and play them by pairs. This way we can have gap-less RB with gates as short as 20ns, because 20ns+20ns=40ns.
+Every pair of gates is baked into a single operation, whose waveforms are cached in the folder 'baked_gate_pairs' and
+only baked again when the pulses of the gates change in the configuration.
 The drawback is that the max depth is currently limited to 2600 Clifford gates due to data memory.
 
 Here again, each random sequence is derived on the FPGA for the maximum depth (specified as an input) and played for each depth
@@ -24,6 +26,8 @@ Prerequisites:
     - Set the desired flux bias.
 """
 
+import os
+import sys
 from qm.qua import *
 from qm import QuantumMachinesManager
 from qm import SimulationConfig
@@ -32,7 +36,10 @@ from qualang_tools.results import progress_counter, fetching_tool
 from qualang_tools.plot import interrupt_on_close
 from qualang_tools.bakery.randomized_benchmark_c1 import c1_table
 from macros import readout_macro
-from scipy.optimize import curve_fit
+
+# the single qubit RB macros and analysis are shared by several folders, see Quantum-Control-Applications/Shared
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Shared"))
+from single_qubit_rb import bake_gate_pairs, c1_ops, inv_gates, play_sequence, get_depths, plot_rb_live, analyze_rb
 import matplotlib.pyplot as plt
 
 
@@ -47,40 +54,11 @@ assert (max_circuit_depth / delta_clifford).is_integer(), "max_circuit_depth / d
 seed = 345324  # Pseudo-random number generator seed
 # Flag to enable state discrimination if the readout has been calibrated (rotated blobs and threshold)
 state_discrimination = False
-# List of recovery gates from the lookup table
-inv_gates = [int(np.where(c1_table[i, :] == 0)[0][0]) for i in range(24)]
 
 
 ###################################
 # Helper functions and QUA macros #
 ###################################
-# Single qubit Clifford operations
-c1_ops = [
-    ("I",),
-    ("x180",),
-    ("y180",),
-    ("y180", "x180"),
-    ("x90", "y90"),
-    ("x90", "-y90"),
-    ("-x90", "y90"),
-    ("-x90", "-y90"),
-    ("y90", "x90"),
-    ("y90", "-x90"),
-    ("-y90", "x90"),
-    ("-y90", "-x90"),
-    ("x90",),
-    ("-x90",),
-    ("y90",),
-    ("-y90",),
-    ("-x90", "y90", "x90"),
-    ("-x90", "-y90", "x90"),
-    ("x180", "y90"),
-    ("x180", "-y90"),
-    ("y180", "x90"),
-    ("y180", "-x90"),
-    ("x90", "y90", "x90"),
-    ("-x90", "y90", "-x90"),
-]
 # Single qubit gates
 single_qubit_gates = [
     "I",
@@ -96,10 +74,8 @@ single_qubit_gate_pairs = []
 for i in range(len(single_qubit_gates)):
     for j in range(len(single_qubit_gates)):
         single_qubit_gate_pairs.append(((single_qubit_gates[i],) + (single_qubit_gates[j],)))
-
-
-def power_law(power, a, b, p):
-    return a * (p**power) + b
+# Baked operation of every pair of single qubit gates, in the order of single_qubit_gate_pairs
+baked_gate_pairs = bake_gate_pairs(config, "qubit", single_qubit_gates, x180_len)
 
 
 def single_gate_indices_from_clifford(clifford_index):
@@ -301,19 +277,6 @@ def generate_sequence():
     return sequence, sequence_pairs_lengths, inv_gate
 
 
-def play_sequence(sequence_list, number_of_gates):
-    i = declare(int)
-    with for_(i, 0, i < number_of_gates, i + 1):
-        with switch_(sequence_list[i], unsafe=True):
-            for ii in range(len(single_qubit_gate_pairs)):
-                with case_(ii):
-                    for iii in range(len(single_qubit_gate_pairs[ii])):
-                        if single_qubit_gate_pairs[ii][iii] == "I":
-                            wait(x180_len // 4, "qubit")
-                        else:
-                            play(single_qubit_gate_pairs[ii][iii], "qubit")
-
-
 # ###################
 # # The QUA program #
 # ###################
@@ -363,7 +326,7 @@ with program() as rb:
                     align("resonator", "qubit")
                     # The strict_timing ensures that the sequence will be played without gaps
                     with strict_timing_():
-                        play_sequence(sequence_pairs, seq_length)
+                        play_sequence(sequence_pairs, seq_length - 1, "qubit", x180_len, baked_gate_pairs)
                     # Align the two elements to measure after playing the circuit.
                     align("qubit", "resonator")
                     # Make sure you updated the ge_threshold and angle if you want to use state discrimination
@@ -437,8 +400,7 @@ else:
     fig = plt.figure()
     interrupt_on_close(fig, job)  # Interrupts the job when closing the figure
     # data analysis
-    x = np.arange(0, max_circuit_depth + 0.1, delta_clifford)
-    x[0] = 1  # to set the first value of 'x' to be depth = 1 as in the experiment
+    x = get_depths(max_circuit_depth, delta_clifford)
     while results.is_processing():
         # data analysis
         if state_discrimination:
@@ -451,64 +413,18 @@ else:
         # Progress bar
         progress_counter(iteration, num_of_sequences, start_time=results.get_start_time())
         # Plot averaged values
-        plt.cla()
-        plt.plot(x, value_avg, marker=".")
-        plt.xlabel("Number of Clifford gates")
-        plt.ylabel("Sequence Fidelity")
-        plt.title("Single qubit RB")
+        plot_rb_live(x, value_avg)
         plt.pause(0.1)
 
     # At the end of the program, fetch the non-averaged results to get the error-bars
     if state_discrimination:
         results = fetching_tool(job, data_list=["state"])
-        state = results.fetch_all()[0]
-        value_avg = np.mean(state, axis=0)
-        error_avg = np.std(state, axis=0)
+        value = results.fetch_all()[0]
     else:
         results = fetching_tool(job, data_list=["I", "Q"])
-        I, Q = results.fetch_all()
-        value_avg = np.mean(I, axis=0)
-        error_avg = np.std(I, axis=0)
-    # data analysis
-    pars, cov = curve_fit(
-        f=power_law,
-        xdata=x,
-        ydata=value_avg,
-        p0=[0.5, 0.5, 0.9],
-        bounds=(-np.inf, np.inf),
-        maxfev=2000,
-    )
-    stdevs = np.sqrt(np.diag(cov))
-
-    print("#########################")
-    print("### Fitted Parameters ###")
-    print("#########################")
-    print(f"A = {pars[0]:.3} ({stdevs[0]:.1}), B = {pars[1]:.3} ({stdevs[1]:.1}), p = {pars[2]:.3} ({stdevs[2]:.1})")
-    print("Covariance Matrix")
-    print(cov)
-
-    one_minus_p = 1 - pars[2]
-    r_c = one_minus_p * (1 - 1 / 2**1)
-    r_g = r_c / 1.875  # 1.875 is the average number of gates in clifford operation
-    r_c_std = stdevs[2] * (1 - 1 / 2**1)
-    r_g_std = r_c_std / 1.875
-
-    print("#########################")
-    print("### Useful Parameters ###")
-    print("#########################")
-    print(
-        f"Error rate: 1-p = {np.format_float_scientific(one_minus_p, precision=2)} ({stdevs[2]:.1})\n"
-        f"Clifford set infidelity: r_c = {np.format_float_scientific(r_c, precision=2)} ({r_c_std:.1})\n"
-        f"Gate infidelity: r_g = {np.format_float_scientific(r_g, precision=2)}  ({r_g_std:.1})"
-    )
-
-    # Plots
-    plt.figure()
-    plt.errorbar(x, value_avg, yerr=error_avg, marker=".")
-    plt.plot(x, power_law(x, *pars), linestyle="--", linewidth=2)
-    plt.xlabel("Number of Clifford gates")
-    plt.ylabel("Sequence Fidelity")
-    plt.title("Single qubit RB")
+        value, Q = results.fetch_all()
+    # data analysis: fit, print the fitted parameters and plot
+    pars, cov = analyze_rb(x, value)
 
     # np.savez("rb_values", value)
     # Close the quantum machines at the end in order to put all flux biases to 0 so that the fridge doesn't heat-up
@@ -21,22 +21,33 @@ Prerequisites:
     - Set the desired flux bias.
 """
 
+import os
+import sys
 from qm.qua import *
 from qm import QuantumMachinesManager
 from qm import SimulationConfig
-from scipy.optimize import curve_fit
 from configuration import *
 import matplotlib.pyplot as plt
-import numpy as np
-from qualang_tools.bakery.randomized_benchmark_c1 import c1_table
 from qualang_tools.results import fetching_tool, progress_counter
 from qualang_tools.plot import interrupt_on_close
 from macros import multiplexed_readout
 
-
-#############################################
-# Program dependent variables and functions #
-#############################################
+# the single qubit RB macros and analysis are shared by several folders, see Quantum-Control-Applications/Shared
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "Shared"))
+from single_qubit_rb import (
+    clifford_name,
+    generate_sequence,
+    play_sequence,
+    play_truncated_sequences,
+    get_depths,
+    plot_rb_live,
+    analyze_rb,
+)
+
+
+##############################
+# Program-specific variables #
+##############################
 qubit = 1
 
 if qubit == 1:
@@ -54,147 +65,17 @@ assert (max_circuit_depth / delta_clifford).is_integer(), "max_circuit_depth / d
 seed = 345324  # Pseudo-random number generator seed
 # Flag to enable state discrimination if the readout has been calibrated (rotated blobs and threshold)
 state_discrimination = False
-# List of recovery gates from the lookup table
-inv_gates = [int(np.where(c1_table[i, :] == 0)[0][0]) for i in range(24)]
-# index of the gate to interleave from the play_sequence() function defined below
+# index of the gate to interleave, in the order of the Clifford decomposition table `c1_ops` of single_qubit_rb.py
 # Correspondence table:
 #  0: identity |  1: x180 |  2: y180
 # 12: x90      | 13: -x90 | 14: y90 | 15: -y90 |
 interleaved_gate_index = 2
 
 
-###################################
-# Helper functions and QUA macros #
-###################################
-def get_interleaved_gate(gate_index):
-    if gate_index == 0:
-        return "I"
-    elif gate_index == 1:
-        return "x180"
-    elif gate_index == 2:
-        return "y180"
-    elif gate_index == 12:
-        return "x90"
-    elif gate_index == 13:
-        return "-x90"
-    elif gate_index == 14:
-        return "y90"
-    elif gate_index == 15:
-        return "-y90"
-
-
-def power_law(power, a, b, p):
-    return a * (p**power) + b
-
-
-def generate_sequence(interleaved_gate_index):
-    cayley = declare(int, value=c1_table.flatten().tolist())
-    inv_list = declare(int, value=inv_gates)
-    current_state = declare(int)
-    step = declare(int)
-    sequence = declare(int, size=2 * max_circuit_depth + 1)
-    inv_gate = declare(int, size=2 * max_circuit_depth + 1)
-    i = declare(int)
-    rand = Random(seed=seed)
-
-    assign(current_state, 0)
-    with for_(i, 0, i < 2 * max_circuit_depth, i + 2):
-        assign(step, rand.rand_int(24))
-        assign(current_state, cayley[current_state * 24 + step])
-        assign(sequence[i], step)
-        assign(inv_gate[i], inv_list[current_state])
-        # interleaved gate
-        assign(step, interleaved_gate_index)
-        assign(current_state, cayley[current_state * 24 + step])
-        assign(sequence[i + 1], step)
-        assign(inv_gate[i + 1], inv_list[current_state])
-
-    return sequence, inv_gate
-
-
-def play_sequence(sequence_list, depth, qubit):
-    i = declare(int)
-    with for_(i, 0, i <= depth, i + 1):
-        with switch_(sequence_list[i], unsafe=True):
-            with case_(0):
-                wait(pi_len // 4, f"q{qubit}_xy")
-            with case_(1):
-                play("x180", f"q{qubit}_xy")
-            with case_(2):
-                play("y180", f"q{qubit}_xy")
-            with case_(3):
-                play("y180", f"q{qubit}_xy")
-                play("x180", f"q{qubit}_xy")
-            with case_(4):
-                play("x90", f"q{qubit}_xy")
-                play("y90", f"q{qubit}_xy")
-            with case_(5):
-                play("x90", f"q{qubit}_xy")
-                play("-y90", f"q{qubit}_xy")
-            with case_(6):
-                play("-x90", f"q{qubit}_xy")
-                play("y90", f"q{qubit}_xy")
-            with case_(7):
-                play("-x90", f"q{qubit}_xy")
-                play("-y90", f"q{qubit}_xy")
-            with case_(8):
-                play("y90", f"q{qubit}_xy")
-                play("x90", f"q{qubit}_xy")
-            with case_(9):
-                play("y90", f"q{qubit}_xy")
-                play("-x90", f"q{qubit}_xy")
-            with case_(10):
-                play("-y90", f"q{qubit}_xy")
-                play("x90", f"q{qubit}_xy")
-            with case_(11):
-                play("-y90", f"q{qubit}_xy")
-                play("-x90", f"q{qubit}_xy")
-            with case_(12):
-                play("x90", f"q{qubit}_xy")
-            with case_(13):
-                play("-x90", f"q{qubit}_xy")
-            with case_(14):
-                play("y90", f"q{qubit}_xy")
-            with case_(15):
-                play("-y90", f"q{qubit}_xy")
-            with case_(16):
-                play("-x90", f"q{qubit}_xy")
-                play("y90", f"q{qubit}_xy")
-                play("x90", f"q{qubit}_xy")
-            with case_(17):
-                play("-x90", f"q{qubit}_xy")
-                play("-y90", f"q{qubit}_xy")
-                play("x90", f"q{qubit}_xy")
-            with case_(18):
-                play("x180", f"q{qubit}_xy")
-                play("y90", f"q{qubit}_xy")
-            with case_(19):
-                play("x180", f"q{qubit}_xy")
-                play("-y90", f"q{qubit}_xy")
-            with case_(20):
-                play("y180", f"q{qubit}_xy")
-                play("x90", f"q{qubit}_xy")
-            with case_(21):
-                play("y180", f"q{qubit}_xy")
-                play("-x90", f"q{qubit}_xy")
-            with case_(22):
-                play("x90", f"q{qubit}_xy")
-                play("y90", f"q{qubit}_xy")
-                play("x90", f"q{qubit}_xy")
-            with case_(23):
-                play("-x90", f"q{qubit}_xy")
-                play("y90", f"q{qubit}_xy")
-                play("-x90", f"q{qubit}_xy")
-
-
 ###################
 # The QUA program #
 ###################
 with program() as rb:
-    depth = declare(int)  # QUA variable for the varying depth
-    depth_target = declare(int)  # QUA variable for the the current depth (changes in steps of delta_clifford)
-    # QUA variable to store the last Clifford gate of the current sequence which is replaced by the recovery gate
-    saved_gate = declare(int)
     m = declare(int)  # QUA variable for the loop over random sequences
     n = declare(int)  # QUA variable for the averaging loop
     I = declare(fixed)  # QUA variable for the 'I' quadrature
@@ -207,42 +88,35 @@ with program() as rb:
     if state_discrimination:
         state_st = declare_stream()
 
+    def play_and_measure(sequence_list, depth):
+        with for_(n, 0, n < n_avg, n + 1):  # Averaging loop
+            # Can replace by active reset
+            wait(thermalization_time * u.ns, f"rr{qubit}")
+            # Align the two elements to play the sequence after qubit initialization
+            align()
+            # The strict_timing ensures that the sequence will be played without gaps
+            with strict_timing_():
+                # Play the random sequence of desired depth
+                play_sequence(sequence_list, depth, f"q{qubit}_xy", pi_len)
+            # Align the two elements to measure after playing the circuit.
+            align()
+            # Play through the 2nd resonator to be in the same condition as when the readout was optimized
+            measure("readout", f"rr{qubit%2 + 1}", None)
+            # Make sure you updated the ge_threshold and angle if you want to use state discrimination
+            multiplexed_readout([I], [I_st], [Q], [Q_st], resonators=[qubit], weights="rotated_")
+            # Make sure you updated the ge_threshold
+            if state_discrimination:
+                assign(state, I > threshold)
+                save(state, state_st)
+
     with for_(m, 0, m < num_of_sequences, m + 1):  # QUA for_ loop over the random sequences
         # Generates the RB sequence with a gate interleaved after each Clifford
-        sequence_list, inv_gate_list = generate_sequence(interleaved_gate_index=interleaved_gate_index)
-        # Depth_target is used to always play the gates by pairs [(random_gate-interleaved_gate)^depth/2-inv_gate]
-        assign(depth_target, 0)
-        with for_(depth, 1, depth <= 2 * max_circuit_depth, depth + 1):
-            # Replacing the last gate in the sequence with the sequence's inverse gate
-            # The original gate is saved in 'saved_gate' and is being restored at the end
-            assign(saved_gate, sequence_list[depth])
-            assign(sequence_list[depth], inv_gate_list[depth - 1])
-            # Only played the depth corresponding to target_depth
-            with if_((depth == 2) | (depth == depth_target)):
-                with for_(n, 0, n < n_avg, n + 1):  # Averaging loop
-                    # Can replace by active reset
-                    wait(thermalization_time * u.ns, f"rr{qubit}")
-                    # Align the two elements to play the sequence after qubit initialization
-                    align()
-                    # The strict_timing ensures that the sequence will be played without gaps
-                    with strict_timing_():
-                        # Play the random sequence of desired depth
-                        play_sequence(sequence_list, depth, qubit)
-                    # Align the two elements to measure after playing the circuit.
-                    align()
-                    # Play through the 2nd resonator to be in the same condition as when the readout was optimized
-                    measure("readout", f"rr{qubit%2 + 1}", None)
-                    # Make sure you updated the ge_threshold and angle if you want to use state discrimination
-                    multiplexed_readout([I], [I_st], [Q], [Q_st], resonators=[qubit], weights="rotated_")
-                    if state_discrimination:
-                        assign(state, I > threshold)
-                        save(state, state_st)
-                # always play the random gate followed by the interleaved gate. The factor of 2 is there to always
-                # play the gates by pairs [(random_gate-interleaved_gate)^depth/2-inv_gate]
-                assign(depth_target, depth_target + 2 * delta_clifford)
-            # Reset the last gate of the sequence back to the original Clifford gate
-            # (that was replaced by the recovery gate at the beginning)
-            assign(sequence_list[depth], saved_gate)
+        sequence_list, inv_gate_list = generate_sequence(max_circuit_depth, seed, interleaved_gate_index)
+        # Play the sequence truncated at every depth, followed by its recovery gate. The gates are always played by
+        # pairs [(random_gate-interleaved_gate)^depth/2-inv_gate]
+        play_truncated_sequences(
+            sequence_list, inv_gate_list, max_circuit_depth, delta_clifford, play_and_measure, interleaved=True
+        )
         # Save the counter for the progress bar
         save(m, m_st)
 
@@ -303,8 +177,7 @@ else:
     fig = plt.figure()
     interrupt_on_close(fig, job)  # Interrupts the job when closing the figure
     # data analysis
-    x = np.arange(0, max_circuit_depth + 0.1, delta_clifford)
-    x[0] = 1  # to set the first value of 'x' to be depth = 1 as in the experiment
+    x = get_depths(max_circuit_depth, delta_clifford, interleaved=True)
     while results.is_processing():
         # data analysis
         if state_discrimination:
@@ -317,64 +190,18 @@ else:
         # Progress bar
         progress_counter(iteration, num_of_sequences, start_time=results.get_start_time())
         # Plot averaged values
-        plt.cla()
-        plt.plot(x, value_avg, marker=".")
-        plt.xlabel("Number of Clifford gates")
-        plt.ylabel("Sequence Fidelity")
-        plt.title(f"Single qubit interleaved RB {get_interleaved_gate(interleaved_gate_index)}")
+        plot_rb_live(x, value_avg, title=f"Single qubit interleaved RB {clifford_name(interleaved_gate_index)}")
         plt.pause(0.1)
 
     # At the end of the program, fetch the non-averaged results to get the error-bars
     if state_discrimination:
         results = fetching_tool(job, data_list=["state"])
-        state = results.fetch_all()[0]
-        value_avg = np.mean(state, axis=0)
-        error_avg = np.std(state, axis=0)
+        value = results.fetch_all()[0]
     else:
         results = fetching_tool(job, data_list=["I", "Q"])
-        I, Q = results.fetch_all()
-        value_avg = np.mean(I, axis=0)
-        error_avg = np.std(I, axis=0)
-    # data analysis
-    pars, cov = curve_fit(
-        f=power_law,
-        xdata=x,
-        ydata=value_avg,
-        p0=[0.5, 0.5, 0.9],
-        bounds=(-np.inf, np.inf),
-        maxfev=2000,
-    )
-    stdevs = np.sqrt(np.diag(cov))
-
-    print("#########################")
-    print("### Fitted Parameters ###")
-    print("#########################")
-    print(f"A = {pars[0]:.3} ({stdevs[0]:.1}), B = {pars[1]:.3} ({stdevs[1]:.1}), p = {pars[2]:.3} ({stdevs[2]:.1})")
-    print("Covariance Matrix")
-    print(cov)
-
-    one_minus_p = 1 - pars[2]
-    r_c = one_minus_p * (1 - 1 / 2**1)
-    r_g = r_c / 1.875  # 1.875 is the average number of gates in clifford operation
-    r_c_std = stdevs[2] * (1 - 1 / 2**1)
-    r_g_std = r_c_std / 1.875
-
-    print("#########################")
-    print("### Useful Parameters ###")
-    print("#########################")
-    print(
-        f"Error rate: 1-p = {np.format_float_scientific(one_minus_p, precision=2)} ({stdevs[2]:.1})\n"
-        f"Clifford set infidelity: r_c = {np.format_float_scientific(r_c, precision=2)} ({r_c_std:.1})\n"
-        f"Gate infidelity: r_g = {np.format_float_scientific(r_g, precision=2)}  ({r_g_std:.1})"
-    )
-
-    # Plots
-    plt.figure()
-    plt.errorbar(x, value_avg, yerr=error_avg, marker=".")
-    plt.plot(x, power_law(x, *pars), linestyle="--", linewidth=2)
-    plt.xlabel("Number of Clifford gates")
-    plt.ylabel("Sequence Fidelity")
-    plt.title(f"Single qubit interleaved RB {get_interleaved_gate(interleaved_gate_index)}")
+        value, Q = results.fetch_all()
+    # data analysis: fit, print the fitted parameters and plot
+    pars, cov = analyze_rb(x, value, title=f"Single qubit interleaved RB {clifford_name(interleaved_gate_index)}")
 
     # np.savez("rb_values", value)
 
@@ -1,15 +1,39 @@
+import concurrent.futures
+import contextlib
 import copy
-import json
-from typing import Callable, Dict, Optional, List
+import multiprocessing
+import pickle
+from pathlib import Path
+from typing import Callable, Dict, Optional, List, Tuple, Union
 
 import cirq
+import numpy as np
 from cirq import GateOperation
-from qm.qua import switch_, case_, declare, align, for_
+from qm.qua import switch_, case_, declare, align, for_, play, frame_rotation_2pi
 from qualang_tools.bakery.bakery import Baking, baking
 from tqdm import tqdm
 
+from .baking_cache import BakedWaveform, baking_cache_key, load_baking_cache, save_baking_cache
 from .gates import GateGenerator, gate_db
-from .verification.command_registry import CommandRegistry
+from .verification.command_registry import (
+    CommandRegistry,
+    commands_from_arrays,
+    commands_to_arrays,
+    decorate_single_qubit_generator_with_command_recording,
+    decorate_two_qubit_gate_generator_with_command_recording,
+)
+
+# The baker of a worker process, created by `_init_worker` when the process starts.
+_worker_baker: Optional["RBBaker"] = None
+
+
+def _init_worker(state: bytes):
+    global _worker_baker
+    _worker_baker = RBBaker._for_worker(*pickle.loads(state))
+
+
+def _bake_commands_in_worker(cmd_ids):
+    return _worker_baker._bake_commands(cmd_ids, record_commands=True)
 
 
 class RBBaker:
@@ -18,23 +42,101 @@ class RBBaker:
         config,
         single_qubit_gate_generator: Callable,
         two_qubit_gate_generators: Dict[str, Callable],
-        interleaving_gate: Optional[List[cirq.GateOperation]] = None,
+        interleaving_gates: Optional[List[List[cirq.GateOperation]]] = None,
         command_registry: Optional[CommandRegistry] = None,
+        cache_dir: Optional[Union[str, Path]] = None,
+        num_workers: int = 1,
     ):
-        self._command_registry = command_registry
+        """
+        Bakes the waveforms of every two-qubit Clifford command for every element it plays on.
+
+        Args:
+            interleaving_gates: Gates baked in addition to the Clifford commands, each represented as a list of cirq
+                GateOperations. The k-th one is baked as the command id `len(gate_db.commands) + k`.
+            cache_dir: If given, the baked waveforms are saved to this directory, keyed by a hash of the baked
+                configuration sections and of the waveforms which the gate generators bake for every distinct gate,
+                and are loaded from it instead of baking again when neither changed. The gate generators must only
+                depend on their arguments and on values which do not change during the baking.
+            command_registry: If given, the gates played by the gate generators for every command are recorded in it.
+            num_workers: Number of processes among which the commands are divided for baking. By default, the commands
+                are baked in the current process. The worker processes are started with the "spawn" method, which
+                requires the gate generators to be picklable (e.g. functions defined at the top level of a module),
+                and the script creating the baker to be guarded by `if __name__ == "__main__":`.
+        """
         self._config = copy.deepcopy(config)
+        self._set_gate_generators(single_qubit_gate_generator, two_qubit_gate_generators, command_registry)
+        self._interleaving_gates = list(interleaving_gates) if interleaving_gates is not None else []
+        self._symplectic_generator = GateGenerator(set(two_qubit_gate_generators.keys()))
+        self._cache_dir = cache_dir
+        self._num_workers = num_workers
+        elements, baked_gates = self._bake_gates()
+        self._baking_config = self._get_baking_config(self._config, elements)
+        self._cache_key = baking_cache_key(
+            self._baking_config,
+            baked_gates,
+            {"commands": [repr(c) for c in gate_db.commands], "interleaving_gates": repr(self._interleaving_gates)},
+        )
+        if not self._load_from_cache():
+            self._all_elements, self._cmd_to_op, self._op_to_waveform = self._bake_all_ops()
+            self._decode_elements = sorted(self._all_elements)
+            self._decode_table = self._gen_decode_table()
+            self._save_to_cache()
+
+    @classmethod
+    def _for_worker(
+        cls,
+        baking_config: dict,
+        single_qubit_gate_generator: Callable,
+        two_qubit_gate_generators: Dict[str, Callable],
+        interleaving_gates: List[List[cirq.GateOperation]],
+        record_commands: bool,
+    ) -> "RBBaker":
+        """A baker of commands only, with a command registry of its own if the commands are recorded."""
+        baker = cls.__new__(cls)
+        baker._baking_config = baking_config
+        baker._set_gate_generators(
+            single_qubit_gate_generator, two_qubit_gate_generators, CommandRegistry() if record_commands else None
+        )
+        baker._interleaving_gates = interleaving_gates
+        baker._symplectic_generator = GateGenerator(set(two_qubit_gate_generators.keys()))
+        return baker
+
+    def _set_gate_generators(
+        self,
+        single_qubit_gate_generator: Callable,
+        two_qubit_gate_generators: Dict[str, Callable],
+        command_registry: Optional[CommandRegistry],
+    ):
+        """Keeps the given gate generators for the worker processes, and decorates them to record the commands."""
+        self._command_registry = command_registry
+        self._gate_generators = (single_qubit_gate_generator, two_qubit_gate_generators)
+        if command_registry is not None:
+            single_qubit_gate_generator = decorate_single_qubit_generator_with_command_recording(
+                single_qubit_gate_generator, command_registry
+            )
+            two_qubit_gate_generators = decorate_two_qubit_gate_generator_with_command_recording(
+                two_qubit_gate_generators, command_registry
+            )
         self._single_qubit_gate_generator = single_qubit_gate_generator
         self._two_qubit_gate_generators = two_qubit_gate_generators
-        self._interleaving_gate = interleaving_gate
-        self._symplectic_generator = GateGenerator(set(two_qubit_gate_generators.keys()))
-        self._all_elements = self._collect_all_elements()
-        self._cmd_to_op = {}
-        self._op_to_baking = {}
 
     @property
     def all_elements(self):
         return self._all_elements
 
+    @property
+    def decode_elements(self) -> List[str]:
+        """The elements in the order of the rows of `decode_table`."""
+        return self._decode_elements
+
+    @property
+    def decode_table(self) -> np.ndarray:
+        """
+        The baked operation played by every command, as an array of shape (len(decode_elements), num_commands).
+        Indexing it with an array of command ids translates them for all elements at once.
+        """
+        return self._decode_table
+
     @staticmethod
     def _get_qubits(op):
         return [q.x for q in op.qubits]
@@ -50,6 +152,10 @@ class RBBaker:
     def _gen_gate(self, baker: Baking, gate_op: GateOperation):
         if type(gate_op.gate) == cirq.PhasedXZGate:
             self._single_qubit_gate_generator(baker, self._get_qubits(gate_op)[0], *self._get_phased_xz_args(gate_op))
+        elif type(gate_op.gate) == cirq.IdentityGate:
+            # an idle of the duration of a single qubit gate
+            for qubit in self._get_qubits(gate_op):
+                self._single_qubit_gate_generator(baker, qubit, 0, 0, 0)
         elif type(gate_op.gate) == cirq.ISwapPowGate and gate_op.gate.exponent == 0.5:
             self._validate_two_qubit_gate_available("sqr_iSWAP")
             self._two_qubit_gate_generators["sqr_iSWAP"](baker, *self._get_qubits(gate_op))
@@ -62,24 +168,129 @@ class RBBaker:
         else:
             raise RuntimeError("unsupported gate")
 
-    def _collect_all_elements(self):
-        config = copy.deepcopy(self._config)
-        qes = set()
-        for cmd_id, command in enumerate(gate_db.commands):
+    @property
+    def num_commands(self):
+        return len(gate_db.commands) + len(self._interleaving_gates)
+
+    @staticmethod
+    def _get_baking_config(config: dict, elements: Optional[List[str]] = None) -> dict:
+        """
+        The part of the configuration which is needed for baking: the given elements, or all the elements with an
+        analog input, and the pulses and waveforms they use. `Baking` deep-copies the configuration it is given for
+        every baked command.
+        """
+        elements = {
+            qe: element
+            for qe, element in config["elements"].items()
+            if ("mixInputs" in element or "singleInput" in element) and (elements is None or qe in elements)
+        }
+        pulses = {
+            pulse: config["pulses"][pulse]
+            for element in elements.values()
+            for pulse in element.get("operations", {}).values()
+        }
+        waveforms = {
+            waveform: config["waveforms"][waveform]
+            for pulse in pulses.values()
+            for waveform in pulse.get("waveforms", {}).values()
+        }
+        digital_waveforms = {
+            pulse["digital_marker"]: config["digital_waveforms"][pulse["digital_marker"]]
+            for pulse in pulses.values()
+            if "digital_marker" in pulse
+        }
+        return {"elements": elements, "pulses": pulses, "waveforms": waveforms, "digital_waveforms": digital_waveforms}
+
+    def _bake_gates(self) -> Tuple[List[str], Dict[str, Dict[str, str]]]:
+        """
+        Bakes every distinct gate of the commands on its own, and returns the elements on which the gate generators
+        play or rotate the frame, which are the only elements aligned and baked for every command, along with the
+        waveforms baked for every gate on these elements (see `BakedWaveform.key`), which fingerprint the gate
+        generators for the cache.
+        """
+        candidate_config = self._get_baking_config(self._config)
+        gate_ops = {gate_op for cmd_id in range(self.num_commands) for gate_op in self.gates_from_cmd_id(cmd_id)}
+        elements = set()
+        gate_waveforms = {}
+        paused = self._command_registry.paused() if self._command_registry is not None else contextlib.nullcontext()
+        with paused:
+            for gate_op in gate_ops:
+                with baking(candidate_config) as b:
+                    self._gen_gate(b, gate_op)
+                    b.update_config = False
+                elements.update(b.get_qe_set())
+                elements.update(qe for qe in candidate_config["elements"] if b._qe_dict[qe]["phase"] != 0)
+                gate_waveforms[repr(gate_op)] = {
+                    qe: BakedWaveform.from_baking(b, qe) for qe in candidate_config["elements"]
+                }
+        baked_gates = {
+            gate: {qe: waveform.key() for qe, waveform in waveforms.items() if qe in elements}
+            for gate, waveforms in gate_waveforms.items()
+        }
+        return sorted(elements), baked_gates
+
+    def _bake_commands(self, cmd_ids, record_commands=False):
+        """
+        Bakes each command separately, aligning all the elements of the baking configuration between gates, and
+        returns the baked waveform of every one of them.
+        """
+        elements = list(self._baking_config["elements"].keys())
+        results = []
+        for cmd_id in cmd_ids:
             if self._command_registry is not None:
                 self._command_registry.set_current_command_id(cmd_id)
-            with baking(config) as b:
-                self._update_baking_from_cmd_id(b, cmd_id)
-                qes.update(b.get_qe_set())
+            with baking(self._baking_config) as b:
+                self._update_baking_from_cmd_id(b, cmd_id, elements)
                 b.update_config = False
-            if self._interleaving_gate is not None:
-                with baking(config) as b:
-                    self._update_baking_from_gates(b, self._interleaving_gate)
-                    qes.update(b.get_qe_set())
-                    b.update_config = False
-        if self._command_registry is not None:
-            self._command_registry.finish()
-        return qes
+            waveforms = {qe: BakedWaveform.from_baking(b, qe) for qe in elements}
+            command = None
+            if record_commands and self._command_registry is not None and self._command_registry.has_command(cmd_id):
+                command = self._command_registry.get_command_by_id(cmd_id)
+            results.append((cmd_id, waveforms, command))
+        return results
+
+    def _bake_all_commands(self, desc):
+        """
+        Bakes all commands, dividing them among `num_workers` processes if there are several.
+        Yields (cmd_id, waveforms) in the order of the command ids.
+        """
+        cmd_ids = list(range(self.num_commands))
+        if self._num_workers <= 1:
+            for cmd_id in tqdm(cmd_ids, desc=desc, unit="command"):
+                yield self._bake_commands([cmd_id])[0][:2]
+            return
+
+        # every worker creates its own baker from these arguments, and records the commands in its own registry
+        try:
+            state = pickle.dumps(
+                (
+                    self._baking_config,
+                    *self._gate_generators,
+                    self._interleaving_gates,
+                    self._command_registry is not None,
+                )
+            )
+        except (pickle.PicklingError, AttributeError, TypeError) as e:
+            raise ValueError(
+                "baking with several workers requires gate generators which can be pickled, "
+                "e.g. functions defined at the top level of a module"
+            ) from e
+        chunks = np.array_split(cmd_ids, 4 * self._num_workers)
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=self._num_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(state,),
+        ) as executor:
+            futures = [executor.submit(_bake_commands_in_worker, chunk.tolist()) for chunk in chunks]
+            with tqdm(total=len(cmd_ids), desc=desc, unit="command") as progress:
+                # the chunks are consumed in order, so that only the chunks which finished early are held
+                for future in futures:
+                    for cmd_id, waveforms, command in future.result():
+                        if command is not None and not self._command_registry.is_finished():
+                            self._command_registry.register_command(cmd_id, command)
+                        progress.update(1)
+                        yield cmd_id, waveforms
 
     def _update_baking_from_gates(self, b: Baking, gate_ops, elements=None):
         prev_gate_qubits = []
@@ -95,8 +306,8 @@ class RBBaker:
     def gates_from_cmd_id(self, cmd_id):
         if 0 <= cmd_id < len(gate_db.commands):
             gate_ops = self._symplectic_generator.generate(cmd_id)
-        elif self._interleaving_gate is not None and cmd_id == len(gate_db.commands):  # Interleaving gate
-            gate_ops = self._interleaving_gate
+        elif 0 <= cmd_id - len(gate_db.commands) < len(self._interleaving_gates):  # Interleaving gate
+            gate_ops = self._interleaving_gates[cmd_id - len(gate_db.commands)]
         else:
             raise RuntimeError("command out of range")
         return gate_ops
@@ -105,57 +316,97 @@ class RBBaker:
         gate_ops = self.gates_from_cmd_id(cmd_id)
         return self._update_baking_from_gates(b, gate_ops, elements)
 
-    @staticmethod
-    def _unique_baker_identifier_for_qe(b: Baking, qe: str):
-        identifier = {"samples": b._samples_dict[qe], "info": b._qe_dict[qe]}
-        return json.dumps(identifier)
-
-    def _bake_all_ops(self, config: dict):
-        waveform_id_per_qe = {qe: 0 for qe in self._all_elements}
-        waveform_to_baking = {qe: {} for qe in self._all_elements}
-        cmd_to_op = {qe: {} for qe in self._all_elements}
-        op_to_baking = {qe: [] for qe in self._all_elements}
-        num_of_commands = len(gate_db.commands) + (0 if self._interleaving_gate is None else 1)
-        for cmd_id in tqdm(range(num_of_commands), desc="Pre-baking pulses for combinations of gates", unit="command"):
-            with baking(config) as b:
-                self._update_baking_from_cmd_id(b, cmd_id, self._all_elements)
-                any_qe_used = False
-                for qe in self._all_elements:
-                    key = self._unique_baker_identifier_for_qe(b, qe)
-                    if key not in waveform_to_baking[qe]:
-                        waveform_to_baking[qe][key] = waveform_id_per_qe[qe], b
-                        op_to_baking[qe].append(b)
-                        waveform_id_per_qe[qe] += 1
-                        any_qe_used = True
-                    cmd_to_op[qe][cmd_id] = waveform_to_baking[qe][key][0]
-                b.update_config = any_qe_used
-        return cmd_to_op, op_to_baking
-
-    def bake(self) -> dict:
-        config = copy.deepcopy(self._config)
-        self._cmd_to_op, self._op_to_baking = self._bake_all_ops(config)
+    def _bake_all_ops(self):
+        """
+        Bakes every command once, deduplicating the baked waveforms of each element on the fly.
+        The elements which are silent in all commands are dropped.
+        """
+        candidates = list(self._baking_config["elements"].keys())
+        waveform_to_op = {qe: {} for qe in candidates}
+        cmd_to_op = {qe: {} for qe in candidates}
+        op_to_waveform = {qe: [] for qe in candidates}
+        all_elements = set()
+        for cmd_id, waveforms in self._bake_all_commands(desc="Pre-baking pulses for combinations of gates"):
+            for qe in candidates:
+                key = waveforms[qe].key()
+                if key not in waveform_to_op[qe]:
+                    waveform_to_op[qe][key] = len(op_to_waveform[qe])
+                    op_to_waveform[qe].append(waveforms[qe])
+                    if not waveforms[qe].is_silent():
+                        all_elements.add(qe)
+                cmd_to_op[qe][cmd_id] = waveform_to_op[qe][key]
+        if self._command_registry is not None:
+            self._command_registry.finish()
+        cmd_to_op = {qe: ops for qe, ops in cmd_to_op.items() if qe in all_elements}
+        op_to_waveform = {qe: waveforms for qe, waveforms in op_to_waveform.items() if qe in all_elements}
+        return all_elements, cmd_to_op, op_to_waveform
+
+    def _load_from_cache(self) -> bool:
+        cached = load_baking_cache(self._cache_dir, self._cache_key)
+        if cached is None:
+            return False
+        self._op_to_waveform, self._decode_table, commands = cached
+        self._all_elements = set(self._op_to_waveform.keys())
+        self._decode_elements = sorted(self._all_elements)
+        self._cmd_to_op = {
+            qe: dict(enumerate(self._decode_table[i].tolist())) for i, qe in enumerate(self._decode_elements)
+        }
+        if self._command_registry is not None:
+            for cmd_id, command in commands_from_arrays(commands).items():
+                self._command_registry.register_command(cmd_id, command)
+            self._command_registry.finish()
+        return True
+
+    def _save_to_cache(self):
+        commands = self._command_registry.get_commands() if self._command_registry is not None else {}
+        save_baking_cache(
+            self._cache_dir, self._cache_key, self._op_to_waveform, self._decode_table, commands_to_arrays(commands)
+        )
+
+    def bake(self, config: Optional[dict] = None) -> dict:
+        """
+        Returns the configuration with the baked operations added. If `config` is given, they are added to it
+        instead of to a copy of the baked configuration.
+        """
+        if config is None:
+            config = copy.deepcopy(self._config)
+        for qe, waveforms in self._op_to_waveform.items():
+            for op_id, waveform in enumerate(waveforms):
+                waveform.add_to_config(config, qe, op_id)
         return config
 
+    def _gen_decode_table(self) -> np.ndarray:
+        table = np.zeros((len(self._decode_elements), self.num_commands), dtype=np.int32)
+        for i, qe in enumerate(self._decode_elements):
+            for cmd_id, op_id in self._cmd_to_op[qe].items():
+                table[i, cmd_id] = op_id
+        return table
+
     def decode(self, cmd_id, element):
         return self._cmd_to_op[element][cmd_id]
 
     @staticmethod
-    def _run_baking_for_qe(b: Baking, qe: str):
-        orig_get_qe_set = b.get_qe_set
-        b.get_qe_set = lambda: {qe}
-        b.run()
-        b.get_qe_set = orig_get_qe_set
+    def _run_baked_waveform(waveform: BakedWaveform, op_id: int, qe: str):
+        play(BakedWaveform.op_name(op_id), qe)
+        if waveform.phase != 0:
+            frame_rotation_2pi(waveform.phase / (2 * np.pi), qe)
 
-    def run(self, op_list_per_qe: dict, length, unsafe=True):
+    def run(self, op_list_per_qe: dict, length, unsafe=True, align_all=True):
+        """
+        Plays the baked operations of the commands of a sequence. If `align_all` is False, the sequence is not aligned
+        with the other elements, so that sequences of disjoint elements can be played simultaneously.
+        """
         if set(op_list_per_qe.keys()) != self._all_elements:
             raise RuntimeError(f"must specify ops for all elements: {', '.join(self._all_elements)} ")
 
-        align()
+        if align_all:
+            align()
         for qe, op_list in op_list_per_qe.items():
             cmd_i = declare(int)
             with for_(cmd_i, 0, cmd_i < length, cmd_i + 1):
                 with switch_(op_list[cmd_i], unsafe=unsafe):
-                    for op_id, b in enumerate(self._op_to_baking[qe]):
+                    for op_id, waveform in enumerate(self._op_to_waveform[qe]):
                         with case_(op_id):
-                            self._run_baking_for_qe(b, qe)
-        align()
+                            self._run_baked_waveform(waveform, op_id, qe)
+        if align_all:
+            align()
@@ -1,8 +1,44 @@
 import dataclasses
+import warnings
+from pathlib import Path
+from typing import Dict, Optional, Union
 
 import numpy as np
 import xarray as xr
 from matplotlib import pyplot as plt
+from scipy.optimize import OptimizeWarning, curve_fit
+
+
+def _exponential_decay(depth, a, p, b):
+    return a * p**depth + b
+
+
+@dataclasses.dataclass
+class RBFit:
+    """
+    The fit of the average |00> state fidelity to `a * p ** depth + b`, with the standard deviations of the
+    parameters estimated by bootstrapping the circuits of every depth (zero without bootstrapping).
+    """
+
+    a: float
+    p: float
+    b: float
+    a_err: float
+    p_err: float
+    b_err: float
+    num_circuits: int
+
+    @property
+    def error_per_clifford(self) -> float:
+        """The average error of a two-qubit Clifford, (1 - p) * (d - 1) / d with d = 4."""
+        return 0.75 * (1 - self.p)
+
+    @property
+    def error_per_clifford_err(self) -> float:
+        return 0.75 * self.p_err
+
+    def __call__(self, depth):
+        return _exponential_decay(np.asarray(depth), self.a, self.p, self.b)
 
 
 @dataclasses.dataclass
@@ -10,28 +46,290 @@ class RBResult:
     circuit_depths: list[int]
     num_repeats: int
     num_averages: int
-    state: np.ndarray
+    # None for a histogram-only result, for which only the counts of every circuit were measured
+    state: Optional[np.ndarray]
+    # the number of circuits, in the order they are run, whose states were measured. None if all of them were.
+    num_completed: Optional[int] = None
+    # the number of shots of every circuit which ended in each of the states 0, 1, 2 and 3, computed from `state` if
+    # not given
+    counts: Optional[np.ndarray] = None
 
     def __post_init__(self):
+        if self.state is None and self.counts is None:
+            raise ValueError("either the states or the counts must be given")
+        if self.num_completed is None:
+            self.num_completed = self.num_circuits
+        if self.counts is None:
+            self.counts = np.zeros((len(self.circuit_depths), self.num_repeats, 4), dtype=np.int32)
+            self._count_states(0, self.num_completed)
+        data_vars = {"counts": (["circuit_depth", "repeat", "outcome"], self.counts)}
+        if self.state is not None:
+            data_vars["state"] = (["circuit_depth", "repeat", "average"], self.state)
         self.data = xr.Dataset(
-            data_vars={"state": (["circuit_depth", "repeat", "average"], self.state)},
+            data_vars=data_vars,
             coords={
                 "circuit_depth": self.circuit_depths,
                 "repeat": range(self.num_repeats),
                 "average": range(self.num_averages),
+                "outcome": range(4),
             },
         )
+        self._circuit_fidelities = np.full((len(self.circuit_depths), self.num_repeats), np.nan)
+        self._update_circuit_fidelities(0, self.num_completed)
+        self._store = None
+        self._last_fit: Optional[RBFit] = None
+
+    @classmethod
+    def empty(
+        cls,
+        circuit_depths: list[int],
+        num_repeats: int,
+        num_averages: int,
+        path: Optional[Union[str, Path]] = None,
+        histogram_only: bool = False,
+    ) -> "RBResult":
+        """
+        Creates a result without any measured circuits, to be filled with `add_circuits` (or `add_circuit_counts` if
+        `histogram_only`) while the job runs. Unmeasured states are -1. If `path` is given, the states are also written
+        to an HDF5 file as they are added, in chunks of one circuit, so that partial results are kept on disk and can
+        be loaded with `load`.
+        """
+        counts = np.zeros((len(circuit_depths), num_repeats, 4), dtype=np.int32)
+        if histogram_only:
+            state = None
+        else:
+            state = np.full((len(circuit_depths), num_repeats, num_averages), -1, dtype=np.int8)
+        result = cls(list(circuit_depths), num_repeats, num_averages, state, num_completed=0, counts=counts)
+        if path is not None:
+            result._store = result._create_store(path)
+        return result
+
+    @property
+    def num_circuits(self) -> int:
+        return len(self.circuit_depths) * self.num_repeats
+
+    @property
+    def is_complete(self) -> bool:
+        return self.num_completed == self.num_circuits
+
+    @property
+    def histogram_only(self) -> bool:
+        return self.state is None
+
+    def add_circuits(self, states: np.ndarray):
+        """
+        Adds the measured states of the next circuits, in the order in which they are run (all repeats of the first
+        depth, then of the second, ...). `states` has shape (num_new_circuits, num_averages).
+        """
+        if self.histogram_only:
+            raise RuntimeError("the states of a histogram-only result are not kept, use `add_circuit_counts`")
+        states = np.asarray(states).reshape(-1, self.num_averages)
+        start, stop = self._next_circuits(len(states))
+        self.state.reshape(self.num_circuits, self.num_averages)[start:stop] = states
+        self._count_states(start, stop)
+        self._circuits_added(start, stop)
+
+    def add_circuit_counts(self, counts: np.ndarray):
+        """
+        Adds the number of shots which ended in each of the states 0, 1, 2 and 3 of the next circuits, in the order in
+        which they are run. `counts` has shape (num_new_circuits, 4).
+        """
+        counts = np.asarray(counts).reshape(-1, 4)
+        start, stop = self._next_circuits(len(counts))
+        self.counts.reshape(self.num_circuits, 4)[start:stop] = counts
+        self._circuits_added(start, stop)
+
+    def split(self, labels: np.ndarray) -> Dict[str, "RBResult"]:
+        """
+        Splits the circuits by their label, given as an array of shape (depths, repeats), into results of their own.
+        Every label must be given to the same number of circuits of every depth.
+        """
+        if not self.is_complete:
+            raise RuntimeError("only complete results can be split")
+        labels = np.asarray(labels)
+        depth_indices = np.arange(len(self.circuit_depths))[:, np.newaxis]
+        results = {}
+        for label in np.unique(labels).tolist():
+            is_label = labels == label
+            num_repeats = is_label.sum(axis=1)
+            if np.any(num_repeats != num_repeats[0]):
+                raise ValueError(f"label '{label}' is not given to the same number of circuits of every depth")
+            repeats = np.nonzero(is_label)[1].reshape(len(self.circuit_depths), num_repeats[0])
+            results[label] = RBResult(
+                circuit_depths=self.circuit_depths,
+                num_repeats=int(num_repeats[0]),
+                num_averages=self.num_averages,
+                state=None if self.histogram_only else self.state[depth_indices, repeats],
+                counts=self.counts[depth_indices, repeats],
+            )
+        return results
+
+    def _next_circuits(self, num_circuits: int) -> tuple[int, int]:
+        start, stop = self.num_completed, self.num_completed + num_circuits
+        if stop > self.num_circuits:
+            raise ValueError(f"got {stop} circuits, expected at most {self.num_circuits}")
+        return start, stop
+
+    def _circuits_added(self, start: int, stop: int):
+        self.num_completed = stop
+        self._update_circuit_fidelities(start, stop)
+        if self._store is not None:
+            self._write_to_store(self._store, start, stop)
+
+    def _count_states(self, start: int, stop: int):
+        states = self.state.reshape(self.num_circuits, self.num_averages)[start:stop]
+        counts = self.counts.reshape(self.num_circuits, 4)
+        counts[start:stop] = (states[:, :, np.newaxis] == np.arange(4)).sum(axis=1)
+
+    def _update_circuit_fidelities(self, start: int, stop: int):
+        circuit_fidelities = self._circuit_fidelities.reshape(-1)
+        counts = self.counts.reshape(self.num_circuits, 4)[start:stop]
+        circuit_fidelities[start:stop] = counts[:, 0] / counts.sum(axis=1)
+
+    @property
+    def circuit_fidelities(self) -> np.ndarray:
+        """The |00> state fidelity of every circuit, of shape (depths, repeats). NaN for circuits not measured yet."""
+        return self._circuit_fidelities
+
+    def fidelity(self) -> np.ndarray:
+        """The average |00> state fidelity per circuit depth, over the circuits measured so far."""
+        measured = ~np.isnan(self._circuit_fidelities)
+        with np.errstate(invalid="ignore"):
+            return np.where(measured, self._circuit_fidelities, 0).sum(axis=1) / measured.sum(axis=1)
+
+    def fit(self, num_bootstrap: int = 0, seed: Optional[int] = None) -> RBFit:
+        """
+        Fits the average |00> state fidelity to `a * p ** depth + b`, using the circuits measured so far.
+
+        The error bars are estimated by refitting `num_bootstrap` resamplings (with replacement) of the measured
+        circuits of every depth. The fit starts from the parameters of the previous fit, so fitting repeatedly as
+        circuits are added stays cheap.
+        """
+        depths = np.asarray(self.circuit_depths, dtype=float)
+        measured = ~np.isnan(self._circuit_fidelities)
+        counts = measured.sum(axis=1)
+        if np.count_nonzero(counts) < 3:
+            raise RuntimeError("fitting requires measured circuits of at least 3 depths")
+
+        fidelity = self.fidelity()
+        fitted = counts > 0
+        p0 = self._initial_fit_parameters(depths[fitted], fidelity[fitted])
+        params = self._fit_decay(depths[fitted], fidelity[fitted], p0)
+
+        errors = np.zeros(3)
+        if num_bootstrap > 0:
+            rng = np.random.default_rng(seed)
+            resampled = np.empty((num_bootstrap, len(depths)))
+            for i in np.flatnonzero(fitted):
+                circuit_fidelities = self._circuit_fidelities[i, measured[i]]
+                samples = rng.integers(0, len(circuit_fidelities), size=(num_bootstrap, len(circuit_fidelities)))
+                resampled[:, i] = circuit_fidelities[samples].mean(axis=1)
+            bootstrap_params = np.array(
+                [self._fit_decay(depths[fitted], sample[fitted], params) for sample in resampled]
+            )
+            errors = np.nanstd(bootstrap_params, axis=0)
+
+        self._last_fit = RBFit(*params, *errors, num_circuits=int(counts.sum()))
+        return self._last_fit
+
+    def _initial_fit_parameters(self, depths: np.ndarray, fidelity: np.ndarray) -> np.ndarray:
+        if self._last_fit is not None and not np.isnan(self._last_fit.p):
+            return np.array([self._last_fit.a, self._last_fit.p, self._last_fit.b])
+        # the fully depolarized two-qubit state has a |00> fidelity of 1/4
+        return np.array([max(fidelity[0] - 0.25, 0.1), 0.95, 0.25])
+
+    @staticmethod
+    def _fit_decay(depths: np.ndarray, fidelity: np.ndarray, p0: np.ndarray) -> np.ndarray:
+        try:
+            # the covariance is not used, the error bars are estimated by bootstrapping
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", OptimizeWarning)
+                params, _ = curve_fit(
+                    _exponential_decay, depths, fidelity, p0=p0, bounds=([-1, 0, -1], [2, 1, 2]), maxfev=10000
+                )
+        except RuntimeError:
+            return np.full(3, np.nan)
+        return params
+
+    def _create_store(self, path: Union[str, Path]):
+        import h5py
+
+        store = h5py.File(path, "w")
+        if self.histogram_only:
+            store.create_dataset("counts", shape=self.counts.shape, dtype=np.int32, chunks=(1, 1, 4))
+        else:
+            store.create_dataset(
+                "state",
+                shape=self.state.shape,
+                dtype=np.int8,
+                chunks=(1, 1, self.num_averages),
+                fillvalue=-1,
+            )
+        store.create_dataset("circuit_depth", data=np.asarray(self.circuit_depths))
+        store.attrs["num_repeats"] = self.num_repeats
+        store.attrs["num_averages"] = self.num_averages
+        store.attrs["num_completed"] = 0
+        return store
+
+    def _write_to_store(self, store, start: int, stop: int):
+        # the counts are derived from the states, so only one of them is stored
+        name, data = ("counts", self.counts) if self.histogram_only else ("state", self.state)
+        # the circuits from `start` to `stop` span consecutive depths, each written as a slice of repeats
+        circuit = start
+        while circuit < stop:
+            depth_index, repeat = divmod(circuit, self.num_repeats)
+            last = min(stop - depth_index * self.num_repeats, self.num_repeats)
+            store[name][depth_index, repeat:last] = data[depth_index, repeat:last]
+            circuit = depth_index * self.num_repeats + last
+        store.attrs["num_completed"] = stop
+        store.flush()
+
+    def save(self, path: Union[str, Path]):
+        """Saves the result to an HDF5 file, which can be loaded with `load`."""
+        store = self._create_store(path)
+        try:
+            self._write_to_store(store, 0, self.num_completed)
+        finally:
+            store.close()
+
+    def close(self):
+        """Closes the HDF5 file the states are written to, if any."""
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "RBResult":
+        """Loads a (possibly partial) result saved by `save` or written while running with a results path."""
+        import h5py
+
+        with h5py.File(path, "r") as store:
+            return cls(
+                circuit_depths=store["circuit_depth"][()].tolist(),
+                num_repeats=int(store.attrs["num_repeats"]),
+                num_averages=int(store.attrs["num_averages"]),
+                state=store["state"][()] if "state" in store else None,
+                num_completed=int(store.attrs["num_completed"]),
+                counts=store["counts"][()] if "counts" in store else None,
+            )
 
     def plot_hist(self, n_cols=3):
         if len(self.circuit_depths) < n_cols:
             n_cols = len(self.circuit_depths)
         n_rows = max(int(np.ceil(len(self.circuit_depths) / n_cols)), 1)
         plt.figure()
+        counts = self.data.counts.sum("repeat")
         for i, circuit_depth in enumerate(self.circuit_depths, start=1):
             ax = plt.subplot(n_rows, n_cols, i)
-            self.data.state.sel(circuit_depth=circuit_depth).plot.hist(ax=ax, xticks=range(4))
+            ax.bar(counts.outcome, counts.sel(circuit_depth=circuit_depth))
+            ax.set_xticks(range(4))
+            ax.set_title(f"circuit_depth = {circuit_depth}")
         plt.tight_layout()
 
-    def plot_fidelity(self):
-        fidelity = (self.data.state == 0).sum(("repeat", "average")) / (self.num_repeats * self.num_averages)
-        fidelity.rename("fidelity").plot.line()
+    def plot_fidelity(self, fit: Optional[RBFit] = None):
+        fidelity = xr.DataArray(self.fidelity(), coords={"circuit_depth": self.circuit_depths}, name="fidelity")
+        fidelity.plot.line(marker="o" if fit is not None else None, linestyle="" if fit is not None else "-")
+        if fit is not None:
+            depths = np.linspace(min(self.circuit_depths), max(self.circuit_depths), 200)
+            plt.plot(depths, fit(depths), label=f"p = {fit.p:.4f} ± {fit.p_err:.4f}")
+            plt.legend()
@@ -0,0 +1,76 @@
+from pathlib import Path
+from typing import Callable, Iterable, List, Union
+
+import cirq
+import numpy as np
+
+from .TwoQubitRB import TwoQubitRb
+from .rb_program import RBProgram
+
+
+class SimultaneousTwoQubitRb(RBProgram):
+    def __init__(self, pairs: List[TwoQubitRb], prep_func: Callable[[], None]):
+        """
+        Runs randomized benchmarking of several disjoint qubit pairs simultaneously, in a single program.
+
+        Every pair is set up as a `TwoQubitRb` of its own, from the same configuration, whose gate generators play on
+        the elements of that pair only. Every circuit plays an independent random sequence on every pair, all of the
+        same length, on a shared timeline: the qubits are prepared together, the sequences of all the pairs are played
+        in parallel, and then every pair is measured with its own measurement function.
+
+        `run` returns a list with the `RBResult` of every pair, and `run_campaign` a list with the results of the
+        experiments of every pair. The experiments of a campaign are the ones common to all the pairs. If a
+        `result_path` is given, the result of every pair is written to a file of its own, whose name is suffixed with
+        "_pair<index>", and the result callback is called with the results of all the pairs.
+
+        Args:
+            pairs: The benchmarks of the qubit pairs, which must play on disjoint elements.
+            prep_func: A callable used to reset all the qubits to the |0> state, replacing the preparation of the
+                individual pairs, so that e.g. the thermalization wait is shared.
+        """
+        seen_elements = set()
+        for pair in pairs:
+            shared = seen_elements & set(pair._rb_baker.all_elements)
+            if shared:
+                raise ValueError(f"the qubit pairs must play on disjoint elements, but share {', '.join(shared)}")
+            seen_elements |= set(pair._rb_baker.all_elements)
+        if len({pair._default_experiment for pair in pairs}) > 1:
+            raise ValueError("either all or none of the qubit pairs must have an interleaving gate")
+
+        config = pairs[0]._rb_baker.bake()
+        for pair in pairs[1:]:
+            pair._rb_baker.bake(config)
+        super().__init__(pairs, prep_func, config, pairs[0]._default_experiment)
+
+    @property
+    def pairs(self) -> List[TwoQubitRb]:
+        return self._pairs
+
+    def convert_sequence_to_cirq(self, sequence: List[int], pair: int = 0) -> List[cirq.GateOperation]:
+        return self._pairs[pair].convert_sequence_to_cirq(sequence)
+
+    def convert_sequences_to_cirq(self, sequences: Iterable[List[int]], pair: int = 0) -> List[cirq.Circuit]:
+        return self._pairs[pair].convert_sequences_to_cirq(sequences)
+
+    def convert_sequences_to_unitaries(self, sequences: Iterable[List[int]], pair: int = 0) -> np.ndarray:
+        return self._pairs[pair].convert_sequences_to_unitaries(sequences)
+
+    def print_command_mapping(self, pair: int = 0):
+        self._pairs[pair].print_command_mapping()
+
+    def print_sequences(self):
+        for i, pair in enumerate(self._pairs):
+            print(f"Qubit pair {i}:")
+            pair.print_sequences()
+
+    def save_command_mapping_to_file(self, path: Union[str, Path], pair: int = 0, binary: bool = False):
+        self._pairs[pair].save_command_mapping_to_file(path, binary)
+
+    def save_sequences_to_file(self, path: Union[str, Path], binary: bool = False):
+        """Saves the sequences of every pair to a file of its own, whose name is suffixed with "_pair<index>"."""
+        for i, pair in enumerate(self._pairs):
+            pair.save_sequences_to_file(self._pair_path(path, i), binary)
+
+    def verify_sequences(self):
+        for pair in self._pairs:
+            pair.verify_sequences()
@@ -1,28 +1,20 @@
+import itertools
 from pathlib import Path
-from typing import Callable, List, Literal
+from typing import Callable, Iterable, List, Literal
 import cirq
-from qm.QuantumMachinesManager import QuantumMachinesManager
-from qm.jobs.running_qm_job import RunningQmJob
 from qm.qua import *
 from qm.qua._dsl import _Expression
 
 from qualang_tools.bakery.bakery import Baking
+from . import batch_tableau
 from .RBBaker import RBBaker
-from .RBResult import RBResult
-from .gates import GateGenerator, gate_db, tableau_from_cirq
-from .simple_tableau import SimpleTableau
-from .util import run_in_thread, pbar
-from .verification.command_registry import (
-    CommandRegistry,
-    decorate_single_qubit_generator_with_command_recording,
-    decorate_two_qubit_gate_generator_with_command_recording,
-)
+from .rb_program import RBProgram
+from .gates import gate_db, tableau_from_cirq, q1, q2
+from .verification.command_registry import CommandRegistry
 from .verification.sequence_tracker import SequenceTracker
 
 
-class TwoQubitRb:
-    _buffer_length = 4096
-
+class TwoQubitRb(RBProgram):
     def __init__(
         self,
         config: dict,
@@ -32,6 +24,9 @@ class TwoQubitRb:
         measure_func: Callable[[], Tuple[_Expression, _Expression]],
         verify_generation: bool = False,
         interleaving_gate: Optional[List[cirq.GateOperation]] = None,
+        interleaving_gates: Optional[Dict[str, List[cirq.GateOperation]]] = None,
+        baking_cache_dir: Optional[Union[str, Path]] = None,
+        num_baking_workers: int = 1,
     ):
         """
         A class for running two qubit randomized benchmarking experiments.
@@ -70,9 +65,24 @@ class TwoQubitRb:
                 Callable[[], Tuple[_Expression, _Expression]]: A tuple containing the measured values of the two qubits as Qua expressions.
                 The expression must evaluate to a boolean value. False means |0>, True means |1>. The MSB is the first qubit.
 
-            verify_generation: A boolean indicating whether to verify the generated sequences. Not be used in production, as it is very slow.
+            verify_generation: A boolean indicating whether to verify the generated sequences. Every sequence is checked to
+                compose to the identity, both on the Clifford group indices and by multiplying the cached unitaries of
+                its commands, which is cheap enough to be left on.
+
+            interleaving_gate: Interleaved gate represented as list of cirq GateOperation. `run` interleaves it in every
+                circuit. In a campaign, it is the experiment "interleaved".
+
+            interleaving_gates: Named interleaved gates (e.g. {"CZ": [...], "idle": [cirq.I(q1), cirq.I(q2)]}), which
+                are baked along with the Clifford commands, to be compared with the reference in one program by
+                `run_campaign`. An identity gate is played as an idle of the duration of a single qubit gate.
 
-            interleaving_gate: Interleaved gate represented as list of cirq GateOperation
+            baking_cache_dir: A directory in which the baked waveforms are cached. The cache is keyed by a hash of the
+                configuration and of the waveforms the gate generators bake for every distinct gate, so re-running
+                with an unchanged calibration skips the baking of the commands.
+
+            num_baking_workers: The number of processes used for baking the commands in parallel, by default 1,
+                i.e. the current process. Several workers require picklable gate generators and a script guarded by
+                `if __name__ == "__main__":`, see `RBBaker`.
         """
         for i, qe in config["elements"].items():
             if "operations" not in qe:
@@ -81,23 +91,38 @@ class TwoQubitRb:
         self._command_registry = CommandRegistry()
         self._sequence_tracker = SequenceTracker(command_registry=self._command_registry)
 
-        single_qubit_gate_generator = decorate_single_qubit_generator_with_command_recording(
-            single_qubit_gate_generator, self._command_registry
-        )
-        two_qubit_gate_generators = decorate_two_qubit_gate_generator_with_command_recording(
-            two_qubit_gate_generators, self._command_registry
-        )
+        self._interleaving_gates: Dict[str, List[cirq.GateOperation]] = {}
+        if interleaving_gate is not None:
+            self._interleaving_gates["interleaved"] = interleaving_gate
+        for name, gate in (interleaving_gates or {}).items():
+            if name in self._interleaving_gates or name == self.reference_experiment:
+                raise ValueError(f"the name of the interleaving gate '{name}' is already used")
+            self._interleaving_gates[name] = gate
+        self._default_experiment = "interleaved" if interleaving_gate is not None else self.reference_experiment
+
         self._rb_baker = RBBaker(
-            config, single_qubit_gate_generator, two_qubit_gate_generators, interleaving_gate, self._command_registry
+            config,
+            single_qubit_gate_generator,
+            two_qubit_gate_generators,
+            list(self._interleaving_gates.values()),
+            self._command_registry,
+            cache_dir=baking_cache_dir,
+            num_workers=num_baking_workers,
         )
 
-        self._interleaving_gate = interleaving_gate
-        self._interleaving_tableau = tableau_from_cirq(interleaving_gate) if interleaving_gate is not None else None
-        self._config = self._rb_baker.bake()
-        self._symplectic_generator = GateGenerator(set(two_qubit_gate_generators.keys()))
-        self._prep_func = prep_func
+        self._interleaving_cmd_ids = {
+            name: gate_db.get_interleaving_gate(i) for i, name in enumerate(self._interleaving_gates)
+        }
+        self._interleaving_clifford_ids = {
+            name: int(gate_db.clifford_ids_from_tableaus(batch_tableau.stack([tableau_from_cirq(gate)]))[0])
+            for name, gate in self._interleaving_gates.items()
+        }
         self._measure_func = measure_func
         self._verify_generation = verify_generation
+        self._command_unitaries: Optional[np.ndarray] = None
+        self._command_moments: Optional[List[List[cirq.Moment]]] = None
+        # the program of this qubit pair alone, see `SimultaneousTwoQubitRb` for several pairs
+        super().__init__([self], prep_func, self._rb_baker.bake(), self._default_experiment)
 
     def convert_sequence_to_cirq(self, sequence: List[int]) -> List[cirq.GateOperation]:
         gates = []
@@ -105,158 +130,181 @@ class TwoQubitRb:
             gates.extend(self._rb_baker.gates_from_cmd_id(cmd_id))
         return gates
 
-    def _verify_rb_sequence(self, gate_ids, final_tableau: SimpleTableau):
-        if final_tableau != SimpleTableau(np.eye(4), [0, 0, 0, 0]):
+    def convert_sequences_to_cirq(self, sequences: Iterable[List[int]]) -> List[cirq.Circuit]:
+        """
+        Converts many sequences of command ids to cirq circuits. The moments of the circuit of every command are
+        built once, and the circuit of a sequence is the concatenation of the moments of its commands (so that a
+        command never shares a moment with the previous one).
+        """
+        command_moments = self._get_command_moments()
+        return [
+            cirq.Circuit.from_moments(*itertools.chain.from_iterable(command_moments[cmd_id] for cmd_id in sequence))
+            for sequence in sequences
+        ]
+
+    def convert_sequences_to_unitaries(self, sequences: Iterable[List[int]]) -> np.ndarray:
+        """
+        Computes the unitaries of many sequences of command ids (which may have different lengths) at once, by
+        multiplying the cached unitaries of their commands. Returns an array of shape (num_sequences, 4, 4), in the
+        basis of the qubits (q1, q2).
+        """
+        sequences = [np.asarray(sequence, dtype=int) for sequence in sequences]
+        unitaries = np.empty((len(sequences), 4, 4), dtype=complex)
+        lengths = np.array([len(sequence) for sequence in sequences])
+        for length in np.unique(lengths):
+            indices = np.flatnonzero(lengths == length)
+            unitaries[indices] = self._sequence_unitaries(np.stack([sequences[i] for i in indices]))
+        return unitaries
+
+    def _sequence_unitaries(self, sequences: np.ndarray) -> np.ndarray:
+        """The unitaries of the sequences of command ids of an array of shape (num_sequences, length)."""
+        command_unitaries = self._get_command_unitaries()
+        unitary = np.broadcast_to(np.eye(4, dtype=complex), (len(sequences), 4, 4))
+        for i in range(sequences.shape[1]):
+            unitary = command_unitaries[sequences[:, i]] @ unitary
+        return unitary
+
+    def _get_command_moments(self) -> List[List[cirq.Moment]]:
+        """The moments of the circuit of every command id. Computed once."""
+        if self._command_moments is None:
+            self._command_moments = [
+                list(cirq.Circuit(self._rb_baker.gates_from_cmd_id(cmd_id)).moments)
+                for cmd_id in range(self._rb_baker.num_commands)
+            ]
+        return self._command_moments
+
+    def _get_command_unitaries(self) -> np.ndarray:
+        """
+        The unitary of the gates of every command id, as an array of shape (num_commands, 4, 4). Computed once.
+        """
+        if self._command_unitaries is None:
+            qubits = [q1, q2]
+            self._command_unitaries = np.stack(
+                [
+                    cirq.Circuit(self._rb_baker.gates_from_cmd_id(cmd_id)).unitary(
+                        qubit_order=qubits, qubits_that_should_be_present=qubits
+                    )
+                    for cmd_id in range(self._rb_baker.num_commands)
+                ]
+            )
+        return self._command_unitaries
+
+    def _verify_rb_sequences(self, sequences: np.ndarray, final_clifford_ids: np.ndarray):
+        """
+        Verifies that every sequence in `sequences` (an array of command ids of shape (num_sequences, length))
+        composes to the identity: on the Clifford group indices tracked during the generation, and by multiplying the
+        unitaries of the gates of its commands.
+        """
+        if np.any(final_clifford_ids != gate_db.identity_clifford_id):
             raise RuntimeError("Verification of RB sequence failed")
-        gates = []
-        for gate_id in gate_ids:
-            if gate_id == gate_db.get_interleaving_gate():
-                gates.extend(self._interleaving_gate)
-            else:
-                gates.extend(self._symplectic_generator.generate(gate_id))
-
-        unitary = cirq.Circuit(gates).unitary()
-        fixed_phase_unitary = np.conj(np.trace(unitary) / 4) * unitary
-        if np.linalg.norm(fixed_phase_unitary - np.eye(4)) > 1e-12:
+
+        unitary = self._sequence_unitaries(sequences)
+        fixed_phase_unitary = np.conj(np.trace(unitary, axis1=1, axis2=2) / 4)[:, None, None] * unitary
+        if np.any(np.linalg.norm(fixed_phase_unitary - np.eye(4), axis=(1, 2)) > 1e-9):
             raise RuntimeError("Verification of RB sequence failed")
 
     def _gen_rb_sequence(self, depth):
-        gate_ids = []
-        tableau = SimpleTableau(np.eye(4), [0, 0, 0, 0])
+        return self._gen_rb_sequences(depth, 1)[0].tolist()
+
+    def _gen_rb_sequences(
+        self,
+        depth,
+        num_sequences,
+        experiment: Optional[str] = None,
+        rng: Optional[np.random.Generator] = None,
+    ) -> np.ndarray:
+        """
+        Generates `num_sequences` random RB sequences of the given depth at once. Every Clifford is tracked by its
+        integer index into the two-qubit Clifford group, so composing a sequence amounts to table lookups.
+        `experiment` is the name of the interleaving gate, or the reference experiment, and defaults to the
+        experiment of `run`. The random gates are drawn from `rng`, or from a freshly seeded generator.
+        Returns the gate ids as an array of shape (num_sequences, length).
+        """
+        experiment = experiment or self._default_experiment
+        interleaving_clifford_id = self._interleaving_clifford_ids.get(experiment)
+        cmd_clifford_ids = gate_db.command_clifford_ids
+        rng = rng or np.random.default_rng()
+        symplectics = gate_db.rand_symplectics((num_sequences, depth), rng)
+        paulis = gate_db.rand_paulis((num_sequences, depth), rng)
+        gate_ids = [symplectics, paulis]
+        if interleaving_clifford_id is not None:
+            gate_ids.append(np.full((num_sequences, depth), self._interleaving_cmd_ids[experiment]))
+
+        clifford = np.full(num_sequences, gate_db.identity_clifford_id)
         for i in range(depth):
-            symplectic = gate_db.rand_symplectic()
-            pauli = gate_db.rand_pauli()
-            gate_ids.append(symplectic)
-            gate_ids.append(pauli)
+            clifford = gate_db.compose_clifford_ids(clifford, cmd_clifford_ids[symplectics[:, i]])
+            clifford = gate_db.compose_clifford_ids(clifford, cmd_clifford_ids[paulis[:, i]])
+            if interleaving_clifford_id is not None:
+                clifford = gate_db.compose_clifford_ids(clifford, interleaving_clifford_id)
 
-            tableau = tableau.then(gate_db.get_tableau(symplectic)).then(gate_db.get_tableau(pauli))
+        inv_ids = gate_db.symplectic_gate_ids_from_clifford_ids(gate_db.inverse_clifford_ids(clifford))
+        after_inv_clifford = gate_db.compose_clifford_ids(clifford, cmd_clifford_ids[inv_ids])
 
-            if self._interleaving_tableau is not None:
-                gate_ids.append(gate_db.get_interleaving_gate())
-                tableau = tableau.then(self._interleaving_tableau)
+        inv_paulis = gate_db.pauli_gate_ids_from_clifford_ids(after_inv_clifford)
 
-        inv_tableau = tableau.inverse()
-        inv_id = gate_db.find_symplectic_gate_id_by_tableau_g(inv_tableau)
-        after_inv_tableau = tableau.then(gate_db.get_tableau(inv_id))
+        sequences = np.concatenate(
+            [np.stack(gate_ids, axis=2).reshape(num_sequences, -1), inv_ids[:, None], inv_paulis[:, None]], axis=1
+        )
 
-        pauli = gate_db.find_pauli_gate_id_by_tableau_alpha(after_inv_tableau)
+        if self._verify_generation:
+            final_clifford = gate_db.compose_clifford_ids(after_inv_clifford, cmd_clifford_ids[inv_paulis])
+            self._verify_rb_sequences(sequences, final_clifford)
 
-        gate_ids.append(inv_id)
-        gate_ids.append(pauli)
+        return sequences
 
-        if self._verify_generation:
-            final_tableau = after_inv_tableau.then(gate_db.get_tableau(pauli))
-            self._verify_rb_sequence(gate_ids, final_tableau)
+    def _sequence_length(self, depth: int, experiment: Optional[str] = None) -> int:
+        """The number of commands in a sequence of the given depth, including the inverse."""
+        experiment = experiment or self._default_experiment
+        return depth * (2 if experiment == self.reference_experiment else 3) + 2
 
-        return gate_ids
+    def _max_sequence_length(self, sequence_depths: List[int], experiments: Optional[Iterable[str]] = None) -> int:
+        return max(self._sequence_length(max(sequence_depths), experiment) for experiment in experiments or [None])
 
-    def _gen_qua_program(
-        self,
-        sequence_depths: list[int],
-        num_repeats: int,
-        num_averages: int,
-    ):
-        with program() as prog:
-            sequence_depth = declare(int)
-            repeat = declare(int)
-            n_avg = declare(int)
-            state = declare(int)
-            length = declare(int)
-            progress = declare(int)
-            progress_os = declare_stream()
-            state_os = declare_stream()
-            gates_len_is = declare_input_stream(int, name="__gates_len_is__", size=1)
-            gates_is = {
-                qe: declare_input_stream(int, name=f"{qe}_is", size=self._buffer_length)
-                for qe in self._rb_baker.all_elements
-            }
-
-            assign(progress, 0)
-            with for_each_(sequence_depth, sequence_depths):
-                with for_(repeat, 0, repeat < num_repeats, repeat + 1):
-                    assign(progress, progress + 1)
-                    save(progress, progress_os)
-                    advance_input_stream(gates_len_is)
-                    for gate_is in gates_is.values():
-                        advance_input_stream(gate_is)
-                    assign(length, gates_len_is[0])
-                    with for_(n_avg, 0, n_avg < num_averages, n_avg + 1):
-                        self._prep_func()
-                        self._rb_baker.run(gates_is, length)
-                        out1, out2 = self._measure_func()
-                        assign(state, (Cast.to_int(out2) << 1) + Cast.to_int(out1))
-                        save(state, state_os)
-
-            with stream_processing():
-                state_os.buffer(len(sequence_depths), num_repeats, num_averages).save("state")
-                progress_os.save("progress")
-        return prog
-
-    def _decode_sequence_for_element(self, element: str, seq: list):
-        seq = [self._rb_baker.decode(i, element) for i in seq]
-        if len(seq) > self._buffer_length:
-            RuntimeError("Buffer is too small")
-        return seq + [0] * (self._buffer_length - len(seq))
-
-    @run_in_thread
-    def _insert_all_input_stream(
-        self,
-        job: RunningQmJob,
-        sequence_depths: List[int],
-        num_repeats: int,
-        callback: Optional[Callable[[List[int]], None]] = None,
-    ):
-        for sequence_depth in sequence_depths:
-            for repeat in range(num_repeats):
-                sequence = self._gen_rb_sequence(sequence_depth)
-                if self._sequence_tracker is not None:
-                    self._sequence_tracker.make_sequence(sequence)
-                job.insert_input_stream("__gates_len_is__", len(sequence))
-                for qe in self._rb_baker.all_elements:
-                    job.insert_input_stream(f"{qe}_is", self._decode_sequence_for_element(qe, sequence))
-
-                if callback is not None:
-                    callback(sequence)
-
-    def run(
+    def _encode_sequences(self, sequences: np.ndarray, chunk_size: int) -> np.ndarray:
+        """
+        Translates the command ids of `sequences` (an array of shape (num_sequences, length)) into the baked
+        operations of every element, padded with zeros to a whole number of chunks.
+        Returns an array of shape (num_sequences, num_elements, num_chunks, chunk_size), where the elements are in the
+        order of `RBBaker.decode_elements`.
+        """
+        num_sequences, length = sequences.shape
+        num_elements = len(self._rb_baker.decode_elements)
+        num_chunks = max(-(-length // chunk_size), 1)
+        encoded = np.zeros((num_sequences, num_elements, num_chunks * chunk_size), dtype=np.int32)
+        encoded[:, :, :length] = self._rb_baker.decode_table[:, sequences].transpose(1, 0, 2)
+        return encoded.reshape(num_sequences, num_elements, num_chunks, chunk_size)
+
+    def _gen_experiment_sequences(
         self,
-        qmm: QuantumMachinesManager,
-        circuit_depths: List[int],
-        num_circuits_per_depth: int,
-        num_shots_per_circuit: int,
-        **kwargs,
+        sequence_depth: int,
+        experiments: Tuple[str, ...],
+        chunk_size: Optional[int],
+        rng: np.random.Generator,
     ):
         """
-        Runs the randomized benchmarking experiment. The experiment is sweep over Clifford circuits with varying depths.
-        For every depth, we generate a number of random circuits and run them. The number of different circuits is determined by
-        the num_circuits_per_depth parameter. The number of shots per individual circuit is determined by the num_averages parameter.
-
-        Args:
-            qmm (QuantumMachinesManager): The Quantum Machines Manager object which is used to run the experiment.
-            circuit_depths (List[int]): A list of the number of Cliffords per circuit (not including inverse).
-            num_circuits_per_depth (int): The number of different circuit randomizations per depth.
-            num_shots_per_circuit (int): The number of shots per particular circuit.
-
+        Generates the sequences of circuits of the given experiments, generating the sequences of every experiment
+        together. Returns the sequences and their encoding, in the order of the circuits.
         """
-
-        prog = self._gen_qua_program(circuit_depths, num_circuits_per_depth, num_shots_per_circuit)
-
-        qm = qmm.open_qm(self._config)
-        job = qm.execute(prog)
-
-        gen_sequence_callback = kwargs["gen_sequence_callback"] if "gen_sequence_callback" in kwargs else None
-        self._insert_all_input_stream(job, circuit_depths, num_circuits_per_depth, gen_sequence_callback)
-
-        full_progress = len(circuit_depths) * num_circuits_per_depth
-        pbar(job.result_handles, full_progress, "progress")
-        job.result_handles.wait_for_all_values()
-
-        return RBResult(
-            circuit_depths=circuit_depths,
-            num_repeats=num_circuits_per_depth,
-            num_averages=num_shots_per_circuit,
-            state=job.result_handles.get("state").fetch_all(),
-        )
+        sequences = [None] * len(experiments)
+        encoded = [None] * len(experiments)
+        for experiment in dict.fromkeys(experiments):
+            indices = [i for i, circuit_experiment in enumerate(experiments) if circuit_experiment == experiment]
+            experiment_sequences = self._gen_rb_sequences(sequence_depth, len(indices), experiment, rng)
+            experiment_encoded = None
+            if chunk_size is not None:
+                experiment_encoded = self._encode_sequences(experiment_sequences, chunk_size)
+            for j, i in enumerate(indices):
+                sequences[i] = experiment_sequences[j]
+                if experiment_encoded is not None:
+                    encoded[i] = experiment_encoded[j]
+        return sequences, encoded
+
+    def _experiments(self) -> List[str]:
+        """The experiments which can be run in a campaign."""
+        return [self.reference_experiment, *self._interleaving_gates]
+
+    def _results_of_pairs(self, results: list):
+        return results[0]
 
     def print_command_mapping(self):
         """
@@ -272,19 +320,22 @@ class TwoQubitRb:
         """
         self._sequence_tracker.print_sequences()
 
-    def save_command_mapping_to_file(self, path: Union[str, Path]):
+    def save_command_mapping_to_file(self, path: Union[str, Path], binary: bool = False):
         """
         Saves a text file containing the mapping of Command ID index, which
         is understood by the input stream, into single-qubit and two-qubit gates.
+        If `binary` is True, the file is binary instead (see `CommandRegistry.load_commands`).
         """
-        self._command_registry.save_to_file(path)
+        self._command_registry.save_to_file(path, binary)
 
-    def save_sequences_to_file(self, path: Union[str, Path]):
+    def save_sequences_to_file(self, path: Union[str, Path], binary: bool = False):
         """
         Save a text file of the break-down of all gates/commands which
-        were played in each random sequence
+        were played in each random sequence. If `binary` is True, only the
+        command ids are saved to a compact binary file instead, which can be
+        memory-mapped by `verification.load_sequences`.
         """
-        self._sequence_tracker.save_to_file(path)
+        self._sequence_tracker.save_to_file(path, binary)
 
     def verify_sequences(self):
         """
@@ -1,4 +1,31 @@
-from .TwoQubitRB import TwoQubitRb
-from .simple_tableau import SimpleTableau
-from .RBBaker import RBBaker
-from .gates import gate_db
+import importlib
+import types
+
+# The exports are imported on first access (PEP 562), so that e.g. loading results for analysis does not import
+# cirq and qm.
+_lazy_exports = {
+    "TwoQubitRb": ".TwoQubitRB",
+    "SimultaneousTwoQubitRb": ".SimultaneousTwoQubitRB",
+    "SimpleTableau": ".simple_tableau",
+    "PackedTableau": ".packed_tableau",
+    "RBBaker": ".RBBaker",
+    "gate_db": ".gates",
+}
+
+__all__ = list(_lazy_exports)
+
+
+def __getattr__(name):
+    if name not in _lazy_exports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = getattr(importlib.import_module(_lazy_exports[name], __name__), name)
+    # importing a module binds it as an attribute of the package, which replaces the export of the same name, i.e.
+    # `RBBaker` once `TwoQubitRb` is imported
+    for export in __all__:
+        if isinstance(globals().get(export), types.ModuleType):
+            globals()[export] = getattr(globals()[export], export)
+    return globals()[name]
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,147 @@
+import dataclasses
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from qualang_tools.bakery.bakery import Baking
+
+# configuration sections which are read while baking
+_baking_config_sections = ["elements", "pulses", "waveforms", "digital_waveforms"]
+
+
+@dataclasses.dataclass
+class BakedWaveform:
+    """
+    The baked samples and the final frame rotation of a single element, which is all that is needed in order
+    to add a baked operation to the configuration and play it, without keeping the `Baking` object around.
+    """
+
+    samples: Dict[str, List[float]]
+    digital_samples: list
+    phase: float
+    info: dict
+
+    @classmethod
+    def from_baking(cls, b: Baking, qe: str) -> "BakedWaveform":
+        return cls(
+            samples=b._samples_dict[qe],
+            digital_samples=b._digital_samples_dict[qe],
+            phase=b._qe_dict[qe]["phase"],
+            info=b._qe_dict[qe],
+        )
+
+    def is_silent(self) -> bool:
+        """Whether playing this waveform does nothing: all samples are zero and there is no frame rotation."""
+        return (
+            self.phase == 0
+            and all(sample == 0 for samples in self.samples.values() for sample in samples)
+            and all(value == 0 for value, _ in self.digital_samples)
+        )
+
+    def key(self) -> str:
+        return json.dumps({"samples": self.samples, "digital_samples": self.digital_samples, "info": self.info})
+
+    @staticmethod
+    def op_name(op_id: int) -> str:
+        return f"rb_baked_op_{op_id}"
+
+    def add_to_config(self, config: dict, qe: str, op_id: int):
+        """Adds the operation, pulse and waveforms of this baked waveform to `config`, like `Baking` does."""
+        pulse_name = f"{qe}_rb_baked_pulse_{op_id}"
+        config["elements"][qe]["operations"][self.op_name(op_id)] = pulse_name
+        if "I" in self.samples:
+            waveforms = {"I": f"{qe}_rb_baked_wf_I_{op_id}", "Q": f"{qe}_rb_baked_wf_Q_{op_id}"}
+        else:
+            waveforms = {"single": f"{qe}_rb_baked_wf_{op_id}"}
+        config["pulses"][pulse_name] = {
+            "operation": "control",
+            "length": len(next(iter(self.samples.values()))),
+            "waveforms": waveforms,
+        }
+        for port, waveform_name in waveforms.items():
+            config["waveforms"][waveform_name] = {
+                "type": "arbitrary",
+                "samples": self.samples[port],
+                "is_overridable": False,
+            }
+        if len(self.digital_samples) != 0:
+            digital_waveform_name = f"{qe}_rb_baked_digital_wf_{op_id}"
+            config["pulses"][pulse_name]["digital_marker"] = digital_waveform_name
+            config.setdefault("digital_waveforms", {})[digital_waveform_name] = {"samples": self.digital_samples}
+
+
+def _json_default(o):
+    return o.tolist() if isinstance(o, np.ndarray) or isinstance(o, np.generic) else repr(o)
+
+
+def baking_cache_key(baking_config: dict, baked_gates: Dict[str, Dict[str, str]], extra) -> str:
+    """
+    A hash of everything which determines the baked waveforms: the configuration sections used by the baking, the
+    waveforms baked by the gate generators for every distinct gate (see `BakedWaveform.key`) and any `extra` (JSON
+    serializable) description of the baked commands. Hashing what the gate generators bake, rather than their code,
+    also catches a change of the calibrated values they read, wherever these are stored.
+    """
+    content = {
+        "config": {section: baking_config.get(section) for section in _baking_config_sections},
+        "gates": baked_gates,
+        "extra": extra,
+    }
+    return hashlib.sha256(json.dumps(content, default=_json_default, sort_keys=True).encode()).hexdigest()
+
+
+def _cache_path(cache_dir: Union[str, Path], key: str) -> Path:
+    return Path(cache_dir) / f"rb_baking_{key}.npz"
+
+
+def load_baking_cache(
+    cache_dir: Optional[Union[str, Path]], key: str
+) -> Optional[Tuple[Dict[str, List[BakedWaveform]], np.ndarray, Dict[str, np.ndarray]]]:
+    """
+    Loads the baked waveforms of every element, the decode table and the arrays of the recorded commands saved by
+    `save_baking_cache`, or returns None if they were not saved with this key.
+    """
+    if cache_dir is None or not _cache_path(cache_dir, key).exists():
+        return None
+    with np.load(_cache_path(cache_dir, key), allow_pickle=False) as cached:
+        waveforms = json.loads(str(cached["waveforms"]))
+        op_to_waveform = {
+            qe: [
+                BakedWaveform(
+                    samples=waveform["samples"],
+                    digital_samples=[tuple(sample) for sample in waveform["digital_samples"]],
+                    phase=waveform["phase"],
+                    info=waveform["info"],
+                )
+                for waveform in waveforms[qe]
+            ]
+            for qe in cached["elements"].tolist()
+        }
+        commands = {name[len("commands_") :]: cached[name] for name in cached.files if name.startswith("commands_")}
+        return op_to_waveform, cached["decode_table"], commands
+
+
+def save_baking_cache(
+    cache_dir: Optional[Union[str, Path]],
+    key: str,
+    op_to_waveform: Dict[str, List[BakedWaveform]],
+    decode_table: np.ndarray,
+    commands: Dict[str, np.ndarray],
+):
+    """
+    Saves the baked waveforms of every element as JSON, along with the decode table, whose rows are the elements in
+    sorted order, and the arrays of the recorded commands, to an .npz file named after `key`.
+    """
+    if cache_dir is None:
+        return
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    elements = sorted(op_to_waveform.keys())
+    waveforms = {qe: [dataclasses.asdict(waveform) for waveform in op_to_waveform[qe]] for qe in elements}
+    np.savez(
+        _cache_path(cache_dir, key),
+        elements=np.array(elements, dtype=str),
+        waveforms=np.array(json.dumps(waveforms, default=_json_default)),
+        decode_table=decode_table,
+        **{f"commands_{name}": array for name, array in commands.items()},
+    )
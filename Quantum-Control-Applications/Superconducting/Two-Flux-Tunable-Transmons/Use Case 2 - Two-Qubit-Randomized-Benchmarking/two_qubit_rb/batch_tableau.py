@@ -0,0 +1,88 @@
+"""
+Batched version of the `SimpleTableau` arithmetic.
+
+A batch of n-qubit tableaus is stored as a single uint8 array of shape (batch, 2n+1, 2n), where for every
+tableau the first 2n rows hold the symplectic matrix `g` and the last row holds the phase vector `alpha`
+(the same layout as `SimpleTableau._np_repr`). All operations act on the whole batch at once using NumPy.
+"""
+from typing import Sequence
+
+import numpy as np
+
+from .simple_tableau import SimpleTableau, _lambda
+
+# same table as `simple_tableau._beta`, indexed by the Pauli code x + 2 * z
+_beta_lut = np.array([[0, 0, 0, 0], [0, 0, 3, 1], [0, 1, 0, 3], [0, 3, 1, 0]], dtype=np.uint8)
+
+
+def identity(n: int, batch: int) -> np.ndarray:
+    tableaus = np.zeros((batch, 2 * n + 1, 2 * n), dtype=np.uint8)
+    tableaus[:, :-1, :] = np.eye(2 * n, dtype=np.uint8)
+    return tableaus
+
+
+def stack(tableaus: Sequence[SimpleTableau]) -> np.ndarray:
+    return np.stack([np.vstack((t.g, t.alpha)) for t in tableaus]).astype(np.uint8)
+
+
+def to_simple(tableau: np.ndarray) -> SimpleTableau:
+    return SimpleTableau(tableau[:-1, :], tableau[-1])
+
+
+def _pauli_codes(v: np.ndarray) -> np.ndarray:
+    return v[..., 0::2] + 2 * v[..., 1::2]
+
+
+def _calc_b(g1: np.ndarray, g2: np.ndarray) -> np.ndarray:
+    """
+    Vectorized `simple_tableau._calc_b_i`, evaluated for every column i of every tableau in the batch.
+    Returns an array of shape (batch, 2n) with values mod 4.
+    """
+    # add i for every Y in the columns of g1
+    b = np.einsum("bki,bki->bi", g1[:, ::2, :], g1[:, 1::2, :], dtype=np.int64)
+
+    # terms[b, i, j, :] = g1[b, j, i] * g2[b, :, j], the j-th Pauli multiplied into column i
+    terms = g1.transpose(0, 2, 1)[:, :, :, None] * g2.transpose(0, 2, 1)[:, None, :, :]
+    # the product accumulated before multiplying the j-th term
+    current = (np.cumsum(terms, axis=2) - terms) % 2
+    b += _beta_lut[_pauli_codes(current), _pauli_codes(terms)].sum(axis=(2, 3), dtype=np.int64)
+    return b % 4
+
+
+def then(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """
+    Batched `SimpleTableau.then`: the tableau of applying `first` and then `second`, element-wise over the batch.
+    """
+    if first.shape != second.shape:
+        raise ValueError(f"shape of first={first.shape} and of second={second.shape} is incompatible")
+    g1, alpha1 = first[:, :-1, :], first[:, -1, :]
+    g2, alpha2 = second[:, :-1, :], second[:, -1, :]
+
+    result = np.empty_like(first)
+    result[:, :-1, :] = (g2 @ g1) % 2
+    two_alpha = 2 * alpha1 + 2 * np.einsum("bki,bk->bi", g1, alpha2, dtype=np.int64) + _calc_b(g1, g2)
+    result[:, -1, :] = (two_alpha % 4) // 2
+    return result
+
+
+def inverse(tableaus: np.ndarray) -> np.ndarray:
+    """
+    Batched `SimpleTableau.inverse`.
+    """
+    g, alpha = tableaus[:, :-1, :], tableaus[:, -1, :]
+    lam = _lambda(g.shape[-1] // 2).astype(np.uint8)
+
+    result = np.empty_like(tableaus)
+    inv_g = (lam @ g.transpose(0, 2, 1) @ lam) % 2
+    result[:, :-1, :] = inv_g
+    two_alpha = -np.einsum("bki,bk->bi", inv_g, 2 * alpha.astype(np.int64) + _calc_b(g, inv_g), dtype=np.int64)
+    result[:, -1, :] = (two_alpha % 4) // 2
+    return result
+
+
+def is_identity(tableaus: np.ndarray) -> np.ndarray:
+    """
+    Returns a boolean array stating for every tableau in the batch whether it is the identity.
+    """
+    n = tableaus.shape[-1] // 2
+    return np.all(tableaus == identity(n, 1), axis=(1, 2))
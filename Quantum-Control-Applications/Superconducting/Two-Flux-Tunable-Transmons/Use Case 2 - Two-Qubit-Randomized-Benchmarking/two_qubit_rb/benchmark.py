@@ -0,0 +1,251 @@
+"""
+Benchmarks of the host side of two-qubit RB, which run offline, without an OPX:
+
+    python -m two_qubit_rb.benchmark configuration.py [--quick] [--save results.json] [--compare results.json]
+
+Every benchmark reports the throughput of a stage of `TwoQubitRb`: baking the commands, generating the random
+sequences, encoding them into the baked operations of every element, composing and inverting tableaus, and inserting
+the sequences into the input streams of a job, which is faked by an object recording the `insert_input_stream` calls.
+The configuration is read from the `config` variable of the given Python file, and must define the elements "q1_xy",
+"q2_xy" and "q1_z" on which the gate generators of the benchmark play.
+Saving the results and comparing a later run to them reports the benchmarks which got slower.
+"""
+import argparse
+import dataclasses
+import importlib.util
+import json
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Union
+
+import numpy as np
+from qm.qua import declare
+from qualang_tools.bakery.bakery import Baking
+
+from .TwoQubitRB import TwoQubitRb
+from .gates import gate_db
+from .packed_tableau import PackedTableau
+
+
+@dataclasses.dataclass
+class BenchmarkResult:
+    name: str
+    count: int  # number of items processed per repetition
+    unit: str
+    seconds: float  # the fastest repetition
+
+    @property
+    def rate(self) -> float:
+        return self.count / self.seconds if self.seconds > 0 else float("inf")
+
+    def __str__(self):
+        return f"{self.name:<45} {self.rate:>14,.0f} {self.unit}/s  ({self.seconds * 1e3:.2f} ms / {self.count})"
+
+
+class FakeJob:
+    """Stands in for a running job, recording the input stream insertions."""
+
+    def __init__(self):
+        self.inserts = []
+
+    def insert_input_stream(self, name, data):
+        self.inserts.append((name, data))
+
+
+def _timeit(name: str, fn: Callable[[], None], count: int, unit: str, repeat: int) -> BenchmarkResult:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return BenchmarkResult(name, count, unit, best)
+
+
+def _bake_phased_xz(baker: Baking, q, x, z, a):
+    baker.frame_rotation_2pi(a / 2, f"q{q}_xy")
+    baker.play("x180", f"q{q}_xy", amp=x)
+    baker.frame_rotation_2pi(-(a + z) / 2, f"q{q}_xy")
+
+
+def _bake_cz(baker: Baking, q1, q2):
+    baker.play("cz", "q1_z")
+    baker.align()
+    baker.frame_rotation_2pi(0.23, "q1_xy")
+    baker.frame_rotation_2pi(0.12, "q2_xy")
+    baker.align()
+
+
+def run_benchmarks(
+    config: dict,
+    single_qubit_gate_generator: Callable = _bake_phased_xz,
+    two_qubit_gate_generators: Optional[Dict[str, Callable]] = None,
+    depths: List[int] = (1, 10, 100, 1000),
+    repeat: int = 3,
+    quick: bool = False,
+) -> List[BenchmarkResult]:
+    """
+    Runs all the benchmarks with the given configuration and gate generators, which default to the PhasedXZ and CZ
+    generators of the example, playing on the elements "q1_xy", "q2_xy" and "q1_z". Returns the results, which are
+    also printed as they are measured. `quick` runs every benchmark on less data, e.g. as a smoke test.
+    """
+    two_qubit_gate_generators = two_qubit_gate_generators or {"CZ": _bake_cz}
+    scale = 1 if not quick else 10
+    results = []
+
+    def report(result: BenchmarkResult):
+        print(result)
+        results.append(result)
+
+    start = time.perf_counter()
+    rb = TwoQubitRb(
+        config,
+        single_qubit_gate_generator,
+        two_qubit_gate_generators,
+        lambda: None,
+        lambda: (declare(bool), declare(bool)),
+    )
+    num_commands = rb._rb_baker.num_commands
+    report(BenchmarkResult("RBBaker: baking all commands", num_commands, "command", time.perf_counter() - start))
+    report(_timeit("RBBaker.bake: adding to the config", rb._rb_baker.bake, num_commands, "command", repeat))
+
+    for depth in depths:
+        n = max(1000 // depth // scale, 1)
+        report(
+            _timeit(
+                f"_gen_rb_sequence: depth {depth}",
+                lambda: [rb._gen_rb_sequence(depth) for _ in range(n)],
+                n,
+                "sequence",
+                repeat,
+            )
+        )
+        n = max(10000 // depth // scale, TwoQubitRb._sequences_per_batch)
+        report(
+            _timeit(
+                f"_gen_rb_sequences: depth {depth}",
+                lambda: rb._gen_rb_sequences(depth, n),
+                n,
+                "sequence",
+                repeat,
+            )
+        )
+
+    sequences = rb._gen_rb_sequences(100, 1000 // scale)
+    num_ids = sequences.size
+    decode_elements = rb._rb_baker.decode_elements
+    report(
+        _timeit(
+            "RBBaker.decode: per command and element",
+            lambda: [rb._rb_baker.decode(cmd_id, qe) for qe in decode_elements for cmd_id in sequences.flat],
+            num_ids * len(decode_elements),
+            "command",
+            repeat,
+        )
+    )
+    report(
+        _timeit(
+            "_encode_sequences: depth 100",
+            lambda: rb._encode_sequences(sequences, rb._buffer_length),
+            num_ids * len(decode_elements),
+            "command",
+            repeat,
+        )
+    )
+
+    rng = np.random.default_rng(0)
+    tableaus = gate_db.tableaus
+    n = 1000 // scale
+    pairs = [(tableaus[i], tableaus[j]) for i, j in rng.integers(0, len(tableaus), (n, 2))]
+    report(_timeit("SimpleTableau.then", lambda: [a.then(b) for a, b in pairs], n, "tableau", repeat))
+    report(_timeit("SimpleTableau.inverse", lambda: [a.inverse() for a, _ in pairs], n, "tableau", repeat))
+    packed_pairs = [(PackedTableau.from_simple(a), PackedTableau.from_simple(b)) for a, b in pairs]
+    report(_timeit("PackedTableau.then", lambda: [a.then(b) for a, b in packed_pairs], n, "tableau", repeat))
+    report(_timeit("PackedTableau.inverse", lambda: [a.inverse() for a, _ in packed_pairs], n, "tableau", repeat))
+    # a chain of CNOTs, whose tableaus are dense
+    wide = [PackedTableau.identity(64)]
+    for i in range(64 // scale - 1):
+        wide.append(wide[-1].then(PackedTableau.from_name("CNOT", (i, i + 1), 64)))
+    report(
+        _timeit(
+            "PackedTableau.then: 64 qubits",
+            lambda: [a.then(b) for a, b in zip(wide, wide[1:])],
+            len(wide) - 1,
+            "tableau",
+            repeat,
+        )
+    )
+    clifford_ids = rng.integers(0, gate_db.identity_clifford_id + 1, (2, 100000 // scale))
+    report(
+        _timeit(
+            "compose_clifford_ids",
+            lambda: gate_db.compose_clifford_ids(clifford_ids[0], clifford_ids[1]),
+            clifford_ids.shape[1],
+            "clifford",
+            repeat,
+        )
+    )
+
+    num_repeats = 64 // scale
+    insert_depths = [1, 10, 100]
+    for num_generators in (1, 4):
+
+        def insert():
+            pipeline = rb._insert_all_input_stream(FakeJob(), insert_depths, num_repeats, num_generators=num_generators)
+            pipeline.join()
+
+        report(
+            _timeit(
+                f"input stream insertion: {num_generators} generator(s)",
+                insert,
+                len(insert_depths) * num_repeats,
+                "sequence",
+                repeat,
+            )
+        )
+
+    return results
+
+
+def compare(results: List[BenchmarkResult], baseline: Dict[str, float], tolerance: float = 0.2) -> List[str]:
+    """Returns the names of the benchmarks whose rate is lower than their rate in `baseline` by more than `tolerance`."""
+    return [
+        result.name
+        for result in results
+        if result.name in baseline and result.rate < (1 - tolerance) * baseline[result.name]
+    ]
+
+
+def load_config(path: Union[str, Path]) -> dict:
+    """Returns the `config` variable of a Python file, e.g. the configuration.py of the example."""
+    spec = importlib.util.spec_from_file_location(Path(path).stem, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.config
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("configuration", help="a Python file defining the configuration as `config`")
+    parser.add_argument("--quick", action="store_true", help="run every benchmark on less data")
+    parser.add_argument("--repeat", type=int, default=3, help="the fastest of this many repetitions is reported")
+    parser.add_argument("--save", help="a JSON file to which the rates are saved")
+    parser.add_argument("--compare", help="a JSON file saved by a previous run, to which the rates are compared")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="the relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    results = run_benchmarks(load_config(args.configuration), repeat=args.repeat, quick=args.quick)
+    rates = {result.name: result.rate for result in results}
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(rates, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for name in regressions:
+            print(f"REGRESSION: {name}")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
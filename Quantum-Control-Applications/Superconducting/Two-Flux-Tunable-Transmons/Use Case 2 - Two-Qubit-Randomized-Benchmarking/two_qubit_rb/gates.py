@@ -1,38 +1,19 @@
+from __future__ import annotations
+
 import dataclasses
+import functools
 import os
 import pathlib
-import pickle
-import random
-from typing import Set, List
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional, Set
 
-import cirq
 import numpy as np
 
+from . import batch_tableau
 from .simple_tableau import SimpleTableau
 
-q1, q2 = cirq.LineQubit.range(1, 3)
-
-C1_reduced = [
-    cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=0, z_exponent=0),
-    cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=-0.5, z_exponent=0),
-    cirq.PhasedXZGate(axis_phase_exponent=0.5, x_exponent=-0.5, z_exponent=1),
-    cirq.PhasedXZGate(axis_phase_exponent=0.5, x_exponent=-0.5, z_exponent=-0.5),
-    cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=0.5, z_exponent=0.5),
-    cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=0, z_exponent=0.5),
-]
-
-S1 = [
-    cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=0, z_exponent=0),
-    cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=0.5, z_exponent=0.5),
-    cirq.PhasedXZGate(axis_phase_exponent=0.5, x_exponent=-0.5, z_exponent=-0.5),
-]
-
-pauli = [
-    cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=0, z_exponent=0),  # I
-    cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=1.0, z_exponent=0),  # X
-    cirq.PhasedXZGate(axis_phase_exponent=0.5, x_exponent=1.0, z_exponent=0),  # Y
-    cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=0, z_exponent=1.0),  # Z
-]
+if TYPE_CHECKING:
+    import cirq
 
 pauli_phase = [
     [0, 0],  # I
@@ -41,82 +22,131 @@ pauli_phase = [
     [1, 0],  # Z
 ]
 
-native_2_qubit_gates = {
-    "sqr_iSWAP": {
-        "CNOT": [
-            cirq.PhasedXZGate(axis_phase_exponent=0.5, x_exponent=0.5, z_exponent=-1)(q1),
-            cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=0, z_exponent=1)(q2),
-            cirq.ISWAP(q1, q2) ** 0.5,
-            cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=1, z_exponent=0)(q1),
-            cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=0, z_exponent=0)(q2),
-            cirq.ISWAP(q1, q2) ** 0.5,
-            cirq.PhasedXZGate(axis_phase_exponent=0.5, x_exponent=0.5, z_exponent=0.5)(q1),
-            cirq.PhasedXZGate(axis_phase_exponent=-1, x_exponent=0.5, z_exponent=1)(q2),
-        ],  # compilation of CNOT in terms of phased XZ and sqiSWAP
-        "iSWAP": [
-            cirq.ISWAP(q1, q2) ** 0.5,
-            cirq.ISWAP(q1, q2) ** 0.5,
-        ],  # compilation of iSWAP in terms of phased XZ and sqiSWAP
-        "SWAP": [
-            cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=0.5, z_exponent=0.5)(q1),
-            cirq.PhasedXZGate(axis_phase_exponent=0.5, x_exponent=0.5, z_exponent=0)(q2),
-            cirq.ISWAP(q1, q2) ** 0.5,
-            cirq.PhasedXZGate(axis_phase_exponent=-1, x_exponent=0.5, z_exponent=1)(q1),
-            cirq.PhasedXZGate(axis_phase_exponent=-1, x_exponent=0.5, z_exponent=1)(q2),
-            cirq.ISWAP(q1, q2) ** 0.5,
-            cirq.PhasedXZGate(axis_phase_exponent=0.5, x_exponent=0.5, z_exponent=0)(q1),
-            cirq.PhasedXZGate(axis_phase_exponent=0.5, x_exponent=0.5, z_exponent=0)(q2),
-            cirq.ISWAP(q1, q2) ** 0.5,
-            cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=0, z_exponent=-0.5)(q1),
-            cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=0, z_exponent=1)(q2),
-        ],  # compilation of SWAP in terms of phased XZ and sqiSWAP
-    },
-    # TODO: add more implementations
-    "CNOT": {
-        "CNOT": [cirq.CNOT(q1, q2)],
-        "iSWAP": [
-            cirq.PhasedXZGate(axis_phase_exponent=-1.0, x_exponent=0.5, z_exponent=-0.5)(q1),  # S + H -> PhasedXZ
-            cirq.PhasedXZGate(axis_phase_exponent=0.0, x_exponent=0.0, z_exponent=0.5)(q2),  # S
-            cirq.CNOT(q1, q2),
-            cirq.CNOT(q2, q1),
-            cirq.PhasedXZGate(axis_phase_exponent=0.0, x_exponent=0.0, z_exponent=0.0)(q1),  # I
-            cirq.PhasedXZGate(axis_phase_exponent=-0.5, x_exponent=0.5, z_exponent=-1.0)(q2),  # H -> PhasedXZ
-        ],
-        "SWAP": [cirq.CNOT(q2, q1), cirq.CNOT(q1, q2), cirq.CNOT(q2, q1)],
-    },
-    "CZ": {
-        "CNOT": [
-            cirq.PhasedXZGate(axis_phase_exponent=-0.5, x_exponent=0.5, z_exponent=-1.0)(q2),
-            cirq.PhasedXZGate(axis_phase_exponent=0.0, x_exponent=0.0, z_exponent=0.0)(q1),
-            cirq.CZ(q1, q2),
-            cirq.PhasedXZGate(axis_phase_exponent=-0.5, x_exponent=0.5, z_exponent=-1.0)(q2),
-            cirq.PhasedXZGate(axis_phase_exponent=0.0, x_exponent=0.0, z_exponent=0.0)(q1),
-        ],
-        "iSWAP": [
-            cirq.PhasedXZGate(axis_phase_exponent=-1.0, x_exponent=0.5, z_exponent=-0.5)(q1),
-            cirq.PhasedXZGate(axis_phase_exponent=-1.0, x_exponent=0.5, z_exponent=-0.5)(q2),
-            cirq.CZ(q1, q2),
-            cirq.PhasedXZGate(axis_phase_exponent=-0.5, x_exponent=0.5, z_exponent=-1.0)(q1),
-            cirq.PhasedXZGate(axis_phase_exponent=-0.5, x_exponent=0.5, z_exponent=-1.0)(q2),
-            cirq.CZ(q1, q2),
-            cirq.PhasedXZGate(axis_phase_exponent=-0.5, x_exponent=0.5, z_exponent=-1.0)(q1),
-            cirq.PhasedXZGate(axis_phase_exponent=-0.5, x_exponent=0.5, z_exponent=-1.0)(q2),
-        ],
-        "SWAP": [
-            cirq.PhasedXZGate(axis_phase_exponent=-0.5, x_exponent=0.5, z_exponent=-1.0)(q2),
-            cirq.PhasedXZGate(axis_phase_exponent=0.0, x_exponent=0.0, z_exponent=0.0)(q1),
-            cirq.CZ(q1, q2),
-            cirq.PhasedXZGate(axis_phase_exponent=-0.5, x_exponent=0.5, z_exponent=-1.0)(q1),
-            cirq.PhasedXZGate(axis_phase_exponent=-0.5, x_exponent=0.5, z_exponent=-1.0)(q2),
-            cirq.CZ(q1, q2),
-            cirq.PhasedXZGate(axis_phase_exponent=-0.5, x_exponent=0.5, z_exponent=-1.0)(q1),
-            cirq.PhasedXZGate(axis_phase_exponent=-0.5, x_exponent=0.5, z_exponent=-1.0)(q2),
-            cirq.CZ(q1, q2),
-            cirq.PhasedXZGate(axis_phase_exponent=-0.5, x_exponent=0.5, z_exponent=-1.0)(q2),
-            cirq.PhasedXZGate(axis_phase_exponent=0.0, x_exponent=0.0, z_exponent=0.0)(q1),
-        ],
-    },
-}
+
+# the cirq gates of the decomposition of the commands, which are created on first use so that importing this module
+# does not import cirq
+_cirq_table_names = {"q1", "q2", "C1_reduced", "S1", "pauli", "native_2_qubit_gates"}
+
+
+@functools.lru_cache(maxsize=None)
+def _cirq_tables() -> dict:
+    import cirq
+
+    q1, q2 = cirq.LineQubit.range(1, 3)
+
+    C1_reduced = [
+        cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=0, z_exponent=0),
+        cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=-0.5, z_exponent=0),
+        cirq.PhasedXZGate(axis_phase_exponent=0.5, x_exponent=-0.5, z_exponent=1),
+        cirq.PhasedXZGate(axis_phase_exponent=0.5, x_exponent=-0.5, z_exponent=-0.5),
+        cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=0.5, z_exponent=0.5),
+        cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=0, z_exponent=0.5),
+    ]
+
+    S1 = [
+        cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=0, z_exponent=0),
+        cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=0.5, z_exponent=0.5),
+        cirq.PhasedXZGate(axis_phase_exponent=0.5, x_exponent=-0.5, z_exponent=-0.5),
+    ]
+
+    pauli = [
+        cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=0, z_exponent=0),  # I
+        cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=1.0, z_exponent=0),  # X
+        cirq.PhasedXZGate(axis_phase_exponent=0.5, x_exponent=1.0, z_exponent=0),  # Y
+        cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=0, z_exponent=1.0),  # Z
+    ]
+
+    native_2_qubit_gates = {
+        "sqr_iSWAP": {
+            "CNOT": [
+                cirq.PhasedXZGate(axis_phase_exponent=0.5, x_exponent=0.5, z_exponent=-1)(q1),
+                cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=0, z_exponent=1)(q2),
+                cirq.ISWAP(q1, q2) ** 0.5,
+                cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=1, z_exponent=0)(q1),
+                cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=0, z_exponent=0)(q2),
+                cirq.ISWAP(q1, q2) ** 0.5,
+                cirq.PhasedXZGate(axis_phase_exponent=0.5, x_exponent=0.5, z_exponent=0.5)(q1),
+                cirq.PhasedXZGate(axis_phase_exponent=-1, x_exponent=0.5, z_exponent=1)(q2),
+            ],  # compilation of CNOT in terms of phased XZ and sqiSWAP
+            "iSWAP": [
+                cirq.ISWAP(q1, q2) ** 0.5,
+                cirq.ISWAP(q1, q2) ** 0.5,
+            ],  # compilation of iSWAP in terms of phased XZ and sqiSWAP
+            "SWAP": [
+                cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=0.5, z_exponent=0.5)(q1),
+                cirq.PhasedXZGate(axis_phase_exponent=0.5, x_exponent=0.5, z_exponent=0)(q2),
+                cirq.ISWAP(q1, q2) ** 0.5,
+                cirq.PhasedXZGate(axis_phase_exponent=-1, x_exponent=0.5, z_exponent=1)(q1),
+                cirq.PhasedXZGate(axis_phase_exponent=-1, x_exponent=0.5, z_exponent=1)(q2),
+                cirq.ISWAP(q1, q2) ** 0.5,
+                cirq.PhasedXZGate(axis_phase_exponent=0.5, x_exponent=0.5, z_exponent=0)(q1),
+                cirq.PhasedXZGate(axis_phase_exponent=0.5, x_exponent=0.5, z_exponent=0)(q2),
+                cirq.ISWAP(q1, q2) ** 0.5,
+                cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=0, z_exponent=-0.5)(q1),
+                cirq.PhasedXZGate(axis_phase_exponent=0, x_exponent=0, z_exponent=1)(q2),
+            ],  # compilation of SWAP in terms of phased XZ and sqiSWAP
+        },
+        # TODO: add more implementations
+        "CNOT": {
+            "CNOT": [cirq.CNOT(q1, q2)],
+            "iSWAP": [
+                cirq.PhasedXZGate(axis_phase_exponent=-1.0, x_exponent=0.5, z_exponent=-0.5)(q1),  # S + H -> PhasedXZ
+                cirq.PhasedXZGate(axis_phase_exponent=0.0, x_exponent=0.0, z_exponent=0.5)(q2),  # S
+                cirq.CNOT(q1, q2),
+                cirq.CNOT(q2, q1),
+                cirq.PhasedXZGate(axis_phase_exponent=0.0, x_exponent=0.0, z_exponent=0.0)(q1),  # I
+                cirq.PhasedXZGate(axis_phase_exponent=-0.5, x_exponent=0.5, z_exponent=-1.0)(q2),  # H -> PhasedXZ
+            ],
+            "SWAP": [cirq.CNOT(q2, q1), cirq.CNOT(q1, q2), cirq.CNOT(q2, q1)],
+        },
+        "CZ": {
+            "CNOT": [
+                cirq.PhasedXZGate(axis_phase_exponent=-0.5, x_exponent=0.5, z_exponent=-1.0)(q2),
+                cirq.PhasedXZGate(axis_phase_exponent=0.0, x_exponent=0.0, z_exponent=0.0)(q1),
+                cirq.CZ(q1, q2),
+                cirq.PhasedXZGate(axis_phase_exponent=-0.5, x_exponent=0.5, z_exponent=-1.0)(q2),
+                cirq.PhasedXZGate(axis_phase_exponent=0.0, x_exponent=0.0, z_exponent=0.0)(q1),
+            ],
+            "iSWAP": [
+                cirq.PhasedXZGate(axis_phase_exponent=-1.0, x_exponent=0.5, z_exponent=-0.5)(q1),
+                cirq.PhasedXZGate(axis_phase_exponent=-1.0, x_exponent=0.5, z_exponent=-0.5)(q2),
+                cirq.CZ(q1, q2),
+                cirq.PhasedXZGate(axis_phase_exponent=-0.5, x_exponent=0.5, z_exponent=-1.0)(q1),
+                cirq.PhasedXZGate(axis_phase_exponent=-0.5, x_exponent=0.5, z_exponent=-1.0)(q2),
+                cirq.CZ(q1, q2),
+                cirq.PhasedXZGate(axis_phase_exponent=-0.5, x_exponent=0.5, z_exponent=-1.0)(q1),
+                cirq.PhasedXZGate(axis_phase_exponent=-0.5, x_exponent=0.5, z_exponent=-1.0)(q2),
+            ],
+            "SWAP": [
+                cirq.PhasedXZGate(axis_phase_exponent=-0.5, x_exponent=0.5, z_exponent=-1.0)(q2),
+                cirq.PhasedXZGate(axis_phase_exponent=0.0, x_exponent=0.0, z_exponent=0.0)(q1),
+                cirq.CZ(q1, q2),
+                cirq.PhasedXZGate(axis_phase_exponent=-0.5, x_exponent=0.5, z_exponent=-1.0)(q1),
+                cirq.PhasedXZGate(axis_phase_exponent=-0.5, x_exponent=0.5, z_exponent=-1.0)(q2),
+                cirq.CZ(q1, q2),
+                cirq.PhasedXZGate(axis_phase_exponent=-0.5, x_exponent=0.5, z_exponent=-1.0)(q1),
+                cirq.PhasedXZGate(axis_phase_exponent=-0.5, x_exponent=0.5, z_exponent=-1.0)(q2),
+                cirq.CZ(q1, q2),
+                cirq.PhasedXZGate(axis_phase_exponent=-0.5, x_exponent=0.5, z_exponent=-1.0)(q2),
+                cirq.PhasedXZGate(axis_phase_exponent=0.0, x_exponent=0.0, z_exponent=0.0)(q1),
+            ],
+        },
+    }
+
+    return {
+        "q1": q1,
+        "q2": q2,
+        "C1_reduced": C1_reduced,
+        "S1": S1,
+        "pauli": pauli,
+        "native_2_qubit_gates": native_2_qubit_gates,
+    }
+
+
+def __getattr__(name):
+    if name in _cirq_table_names:
+        return _cirq_tables()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 ##### Conversion from unitary / cirq to tableau
@@ -177,13 +207,22 @@ def tableau_from_unitary(m):
 
 
 def tableau_from_cirq(gates: List[cirq.GateOperation]) -> SimpleTableau:
-    return tableau_from_unitary(np.matrix(cirq.Circuit(gates).unitary()))
+    import cirq
+
+    qubits = [_cirq_tables()["q1"], _cirq_tables()["q2"]]
+    return tableau_from_unitary(
+        np.matrix(cirq.Circuit(gates).unitary(qubit_order=qubits, qubits_that_should_be_present=qubits))
+    )
 
 
 #########################################################
 
 
+# the commands combine only a few distinct pairs of gates, whose unitaries are slow to compute
+@functools.lru_cache(maxsize=None)
 def combine_to_phased_x_z(first_gate: cirq.GateOperation, second_gate: cirq.GateOperation) -> cirq.GateOperation:
+    import cirq
+
     unitary = cirq.Circuit([first_gate, second_gate]).unitary()
     if unitary.shape != (2, 2):
         raise RuntimeError("Cannot combine multi qubit gate to PhasedXZ")
@@ -205,81 +244,261 @@ class GateCommand:
             raise RuntimeError("q should be 0 or 1")
 
 
+_package_dir = pathlib.Path(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _g_keys(tableaus: np.ndarray) -> np.ndarray:
+    """Packs the bits of the symplectic matrices of a stack of two-qubit tableaus into 16 bit integer keys."""
+    g = tableaus[..., :-1, :].reshape(*tableaus.shape[:-2], 16)
+    return g.astype(np.int64) @ (1 << np.arange(16))
+
+
+def _alpha_keys(tableaus: np.ndarray) -> np.ndarray:
+    """Packs the phase vectors of a stack of two-qubit tableaus into 4 bit integer keys."""
+    return tableaus[..., -1, :].astype(np.int64) @ (1 << np.arange(4))
+
+
+def _alpha_from_keys(keys: np.ndarray) -> np.ndarray:
+    return ((np.asarray(keys)[..., None] >> np.arange(4)) & 1).astype(np.uint8)
+
+
 class _GateDatabase:
+    """
+    Holds the two-qubit Clifford commands and their tableaus.
+
+    Besides the gate ids, every two-qubit Clifford is also identified by an integer index into the 11520 element
+    group, `clifford_id = 16 * symplectic_id + alpha_key`, where `symplectic_id` is the gate id of the symplectic
+    command with the same `g` and `alpha_key` is the packed phase vector of the tableau. Products of Cliffords are
+    computed on these indices using the precomputed tables loaded in `_load_group_tables`.
+    """
+
     def __init__(self):
-        self._commands, self._tableaus, self._symplectic_range, self._pauli_range = self._gen_commands_and_tableaus()
+        self._commands, self._tableau_stack, self._symplectic_range, self._pauli_range = self._load_compilation()
+        self._tableaus = None
+        self._symplectic_id_by_g_key, self._pauli_id_by_alpha_key = self._gen_tableau_index()
+        self._identity_clifford_id = int(self.clifford_ids_from_tableaus(batch_tableau.identity(2, 1))[0])
+        self._load_group_tables()
+        self._command_clifford_ids = self.clifford_ids_from_tableaus(self._tableau_stack)
 
     @staticmethod
-    def _gen_commands_and_tableaus():
-        compilation_path = pathlib.Path(os.path.dirname(os.path.abspath(__file__))) / "symplectic_compilation_XZ.pkl"
-        with open(compilation_path, "rb") as f:
-            compilation = pickle.load(f)
-        symplectics = compilation["symplectics"]
-        phases = compilation["phases"]
-        commands = compilation["commands"]
+    def _load_compilation():
+        """
+        Loads the commands of the symplectic compilation and the tableaus of all commands, as a (num_gates, 5, 4)
+        stack. The compilation holds, per symplectic command, its symplectic matrix, phases, type and the indices
+        of its single qubit gates (`command_args`, zero padded to 4).
+        """
+        with np.load(_package_dir / "symplectic_compilation_XZ.npz") as compilation:
+            symplectics = compilation["symplectics"]
+            phases = compilation["phases"]
+            command_types = compilation["command_types"].tolist()
+            command_args = compilation["command_args"].tolist()
 
         rb_commands = []
-        for command in commands:
-            if command[0] == "C1's":
-                rb_commands.append(GateCommand("C1", (command[1],), (command[2],)))
-            elif command[0] == "CNOT's":
-                rb_commands.append(GateCommand("CNOT", (command[1], command[3]), (command[2], command[4])))
-            elif command[0] == "iSWAP's":
-                rb_commands.append(GateCommand("iSWAP", (command[1], command[3]), (command[2], command[4])))
-            elif command[0] == "SWAP's":
-                rb_commands.append(GateCommand("SWAP", (command[1],), (command[2],)))
+        for command_type, args in zip(command_types, command_args):
+            if command_type in ["C1", "SWAP"]:
+                rb_commands.append(GateCommand(command_type, (args[0],), (args[1],)))
+            elif command_type in ["CNOT", "iSWAP"]:
+                rb_commands.append(GateCommand(command_type, (args[0], args[2]), (args[1], args[3])))
 
         # Generate Paulis:
-        for i1 in range(len(pauli)):
-            for i2 in range(len(pauli)):
+        pauli_phases = []
+        for i1 in range(len(pauli_phase)):
+            for i2 in range(len(pauli_phase)):
                 rb_commands.append(GateCommand("PAULI", (i1,), (i2,)))
+                pauli_phases.append(pauli_phase[i1] + pauli_phase[i2])
+
+        tableau_stack = np.concatenate(
+            [
+                np.concatenate([symplectics, phases[:, None, :]], axis=1),
+                batch_tableau.identity(2, len(pauli_phases)),
+            ]
+        )
+        tableau_stack[len(symplectics) :, -1, :] = pauli_phases
+
+        symplectic_range = (0, len(symplectics))
+        pauli_range = (len(symplectics), len(rb_commands))
+        return rb_commands, tableau_stack, symplectic_range, pauli_range
+
+    def _gen_tableau_index(self):
+        symplectics = self._tableau_stack[self._symplectic_range[0] : self._symplectic_range[1]]
+        symplectic_id_by_g_key = np.full(1 << 16, -1, dtype=np.int16)
+        symplectic_id_by_g_key[_g_keys(symplectics)] = np.arange(*self._symplectic_range)
+
+        paulis = self._tableau_stack[self._pauli_range[0] : self._pauli_range[1]]
+        pauli_id_by_alpha_key = np.full(1 << 4, -1, dtype=np.int16)
+        pauli_id_by_alpha_key[_alpha_keys(paulis)] = np.arange(*self._pauli_range)
+        return symplectic_id_by_g_key, pauli_id_by_alpha_key
+
+    def _gen_alpha_maps(self):
+        """The key of g^T @ alpha for every symplectic g and every alpha key, as a (num_symplectics, 16) table."""
+        g = self._tableau_stack[self._symplectic_range[0] : self._symplectic_range[1], :-1, :]
+        alpha_maps = np.einsum("ski,ak->sai", g, _alpha_from_keys(np.arange(16))) % 2
+        return (alpha_maps.astype(np.int64) @ (1 << np.arange(4))).astype(np.uint8)
+
+    def _gen_multiplication_table(self):
+        """
+        Builds the multiplication table of the symplectic commands. Entry [s1, s2] packs the symplectic id of
+        `g2 @ g1` in its lower 10 bits and the key of the phase acquired by composing `g1` and `g2` with zero
+        phases in the bits above.
+        """
+        num_symplectics = self._symplectic_range[1] - self._symplectic_range[0]
+        zero_phase = self._tableau_stack[self._symplectic_range[0] : self._symplectic_range[1]].copy()
+        zero_phase[:, -1] = 0
+
+        table = np.empty((num_symplectics, num_symplectics), dtype=np.uint16)
+        for s1 in range(num_symplectics):
+            products = batch_tableau.then(np.repeat(zero_phase[s1 : s1 + 1], num_symplectics, axis=0), zero_phase)
+            table[s1] = self._symplectic_id_by_g_key[_g_keys(products)] | (_alpha_keys(products) << 10)
+        return table
+
+    def _gen_inverse_table(self):
+        """The group index of the inverse of every Clifford, indexed by group index."""
+        num_symplectics = self._symplectic_range[1] - self._symplectic_range[0]
+        clifford_ids = np.arange(16 * num_symplectics)
+        s, a = np.divmod(clifford_ids, 16)
+        inv_s = np.argmax((self._multiplication_table & 0x3FF) == self.identity_clifford_id // 16, axis=1)[s]
+        # solves a ^ alpha_maps[s, inv_a] ^ phase(s, inv_s) == 0 for inv_a
+        inv_a = np.argsort(self._alpha_maps, axis=1)[s, a ^ (self._multiplication_table[s, inv_s] >> 10)]
+        return (16 * inv_s + inv_a).astype(np.int16)
+
+    def _load_group_tables(self):
+        """
+        Loads the multiplication and inverse tables of the group indices, which are shipped alongside
+        `symplectic_compilation_XZ.npz` and memory-mapped. A missing table is generated in memory, and never written to
+        the package directory.
+        """
+        self._alpha_maps = self._gen_alpha_maps()
+        self._multiplication_table = self._load_or_gen_table(
+            "symplectic_multiplication_table.npy", self._gen_multiplication_table
+        )
+        self._inverse_table = self._load_or_gen_table("clifford_inverse_table.npy", self._gen_inverse_table)
 
-        tableaus = []
-        for i in range(len(symplectics)):
-            tableaus.append(SimpleTableau(symplectics[i], phases[i]))
-
-        # Generate Paulis:
-        for i1 in range(len(pauli)):
-            for i2 in range(len(pauli)):
-                tableaus.append(SimpleTableau(np.eye(4), pauli_phase[i1] + pauli_phase[i2]))
-
-        symplectic_range = (0, len(commands))
-        pauli_range = (len(commands), len(rb_commands))
-        return rb_commands, tableaus, symplectic_range, pauli_range
+    @staticmethod
+    def _load_or_gen_table(file_name: str, gen_table):
+        table_path = _package_dir / file_name
+        if not table_path.exists():
+            return gen_table()
+        return np.load(table_path, mmap_mode="r")
 
     @property
     def commands(self):
         return self._commands
 
     @property
-    def tableaus(self):
+    def tableaus(self) -> List[SimpleTableau]:
+        """The tableaus of all gates as `SimpleTableau` objects, which are created on first use."""
+        if self._tableaus is None:
+            self._tableaus = [batch_tableau.to_simple(tableau) for tableau in self._tableau_stack]
         return self._tableaus
 
+    @property
+    def tableau_stack(self) -> np.ndarray:
+        """All tableaus stacked in a single (num_gates, 5, 4) array, indexed by gate id."""
+        return self._tableau_stack
+
     def get_command(self, gate_id) -> GateCommand:
         return self._commands[gate_id]
 
     def get_tableau(self, gate_id) -> SimpleTableau:
-        return self._tableaus[gate_id]
+        return self.tableaus[gate_id]
+
+    # The random gate ids are drawn from `rng` if given, and from a freshly seeded generator otherwise. Generators
+    # are not thread safe, so concurrent generation must use a generator per thread.
+
+    def rand_symplectic(self, rng: Optional[np.random.Generator] = None) -> int:
+        return int(self.rand_symplectics(None, rng))
 
-    def rand_symplectic(self):
-        return random.randrange(*self._symplectic_range)
+    def rand_pauli(self, rng: Optional[np.random.Generator] = None) -> int:
+        return int(self.rand_paulis(None, rng))
 
-    def rand_pauli(self):
-        return random.randrange(*self._pauli_range)
+    def rand_symplectics(self, size, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        return (rng or np.random.default_rng()).integers(*self._symplectic_range, size=size)
 
-    def get_interleaving_gate(self):
-        return self._pauli_range[1]
+    def rand_paulis(self, size, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        return (rng or np.random.default_rng()).integers(*self._pauli_range, size=size)
+
+    def get_interleaving_gate(self, index: int = 0):
+        """The command id of the `index`-th interleaving gate, which are baked after the Clifford commands."""
+        return self._pauli_range[1] + index
 
     def find_symplectic_gate_id_by_tableau_g(self, tableau: SimpleTableau):
-        tableaus = self._tableaus[self._symplectic_range[0] : self._symplectic_range[1]]
-        return next(i for i, x in enumerate(tableaus) if np.array_equal(x.g, tableau.g))
+        return int(self._symplectic_id_by_g_key[_g_keys(np.vstack((tableau.g, tableau.alpha)))])
 
     def find_pauli_gate_id_by_tableau_alpha(self, tableau: SimpleTableau):
-        tableaus = self._tableaus[self._pauli_range[0] : self._pauli_range[1]]
-        return self._pauli_range[0] + next(i for i, x in enumerate(tableaus) if np.array_equal(x.alpha, tableau.alpha))
+        return int(self._pauli_id_by_alpha_key[_alpha_keys(np.vstack((tableau.g, tableau.alpha)))])
+
+    def find_symplectic_gate_ids_by_tableaus_g(self, tableaus: np.ndarray) -> np.ndarray:
+        """Batched `find_symplectic_gate_id_by_tableau_g` for a stack of tableaus of shape (batch, 5, 4)."""
+        return self._symplectic_id_by_g_key[_g_keys(tableaus)]
 
+    def find_pauli_gate_ids_by_tableaus_alpha(self, tableaus: np.ndarray) -> np.ndarray:
+        """Batched `find_pauli_gate_id_by_tableau_alpha` for a stack of tableaus of shape (batch, 5, 4)."""
+        return self._pauli_id_by_alpha_key[_alpha_keys(tableaus)]
 
-gate_db = _GateDatabase()
+    @property
+    def command_clifford_ids(self) -> np.ndarray:
+        """The group index of every command, indexed by gate id."""
+        return self._command_clifford_ids
+
+    def clifford_ids_from_tableaus(self, tableaus: np.ndarray) -> np.ndarray:
+        return 16 * self.find_symplectic_gate_ids_by_tableaus_g(tableaus) + _alpha_keys(tableaus)
+
+    def tableaus_from_clifford_ids(self, clifford_ids: np.ndarray) -> np.ndarray:
+        symplectic_ids, alpha_keys = np.divmod(clifford_ids, 16)
+        tableaus = self._tableau_stack[symplectic_ids].copy()
+        tableaus[..., -1, :] = _alpha_from_keys(alpha_keys)
+        return tableaus
+
+    @property
+    def identity_clifford_id(self) -> int:
+        return self._identity_clifford_id
+
+    def symplectic_gate_ids_from_clifford_ids(self, clifford_ids: np.ndarray) -> np.ndarray:
+        """The gate id of the symplectic command with the same `g` as each Clifford."""
+        return self._symplectic_range[0] + clifford_ids // 16
+
+    def pauli_gate_ids_from_clifford_ids(self, clifford_ids: np.ndarray) -> np.ndarray:
+        """The gate id of the Pauli command with the same `alpha` as each Clifford."""
+        return self._pauli_id_by_alpha_key[clifford_ids % 16]
+
+    def compose_clifford_ids(self, first: np.ndarray, second: np.ndarray) -> np.ndarray:
+        """
+        The group index of applying `first` and then `second`, element-wise. Equivalent to `SimpleTableau.then`.
+        """
+        s1, a1 = np.divmod(first, 16)
+        s2, a2 = np.divmod(second, 16)
+        product = self._multiplication_table[s1, s2]
+        return 16 * (product & 0x3FF).astype(np.int64) + (a1 ^ self._alpha_maps[s1, a2] ^ (product >> 10))
+
+    def inverse_clifford_ids(self, clifford_ids: np.ndarray) -> np.ndarray:
+        """
+        The group index of the inverse of every Clifford, element-wise. Equivalent to `SimpleTableau.inverse`.
+        """
+        return self._inverse_table[clifford_ids].astype(np.int64)
+
+
+class _LazyGateDatabase:
+    """
+    Creates the `_GateDatabase` on first use, so that importing the package does not load the compilation and
+    the group tables.
+    """
+
+    def __init__(self):
+        self._db = None
+        self._lock = threading.Lock()
+
+    def _get(self) -> _GateDatabase:
+        if self._db is None:
+            with self._lock:
+                if self._db is None:
+                    self._db = _GateDatabase()
+        return self._db
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+
+gate_db = _LazyGateDatabase()
 
 
 class GateGenerator:
@@ -291,13 +510,15 @@ class GateGenerator:
 
     def __init__(self, native_two_qubit_gates: Set[str]):
         self._two_qubit_dict = self._generate_two_qubit_dict(native_two_qubit_gates)
+        # the reduced gates of every generated command id, as reducing them requires computing unitaries
+        self._generated: Dict[int, List[cirq.GateOperation]] = {}
 
     @staticmethod
     def _generate_two_qubit_dict(native_two_qubit_gates: Set[str]) -> dict:
         two_qubit_dict = {}
         for k, v in GateGenerator.two_qubit_imp_priority.items():
             available_imp = [x for x in v if x in native_two_qubit_gates]
-            if len(available_imp) == 0 or available_imp[0] not in native_2_qubit_gates.keys():
+            if len(available_imp) == 0 or available_imp[0] not in _cirq_tables()["native_2_qubit_gates"].keys():
                 raise RuntimeError(f"Cannot implement gate '{k}' with provided native two qubit gates")
             two_qubit_dict[k] = available_imp[0]
         return two_qubit_dict
@@ -323,7 +544,16 @@ class GateGenerator:
         append_qubit_ops()
         return output
 
-    def generate(self, cmd_id):
+    def generate(self, cmd_id) -> List[cirq.GateOperation]:
+        if cmd_id not in self._generated:
+            self._generated[cmd_id] = self._generate(cmd_id)
+        return list(self._generated[cmd_id])
+
+    def _generate(self, cmd_id):
+        tables = _cirq_tables()
+        q1, q2 = tables["q1"], tables["q2"]
+        C1_reduced, S1, pauli = tables["C1_reduced"], tables["S1"], tables["pauli"]
+        native_2_qubit_gates = tables["native_2_qubit_gates"]
         gate = []
         command = gate_db.get_command(cmd_id)
         two_qubit_imp = self._two_qubit_dict[command.type] if command.type in self._two_qubit_dict else None
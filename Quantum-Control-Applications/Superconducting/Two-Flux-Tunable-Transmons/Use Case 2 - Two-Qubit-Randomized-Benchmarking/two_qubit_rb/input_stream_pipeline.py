@@ -0,0 +1,126 @@
+"""
+A producer/consumer pipeline which feeds the input streams of a running job.
+
+A pool of generator threads prepares the input stream data of upcoming tasks ahead of time, while a single sender
+thread inserts the prepared data into the job in the order of the tasks. At most `max_pending` tasks are prepared
+ahead of the sender, which bounds the memory use and blocks the generators when the sender (or the OPX consuming the
+data) is the bottleneck. An error raised by either side stops the pipeline and is re-raised by `join`.
+"""
+import collections
+import dataclasses
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Iterable, Optional
+
+
+@dataclasses.dataclass
+class PipelineStats:
+    num_tasks: int = 0
+    generation_time: float = 0.0  # summed over the generator threads
+    insertion_time: float = 0.0
+    starved_time: float = 0.0  # time the sender waited for generated data
+    total_time: float = 0.0
+
+    def __str__(self):
+        return (
+            f"{self.num_tasks} tasks in {self.total_time:.2f}s: generation {self.generation_time:.2f}s, "
+            f"insertion {self.insertion_time:.2f}s, sender waiting for generation {self.starved_time:.2f}s"
+        )
+
+
+class InputStreamPipeline:
+    def __init__(
+        self,
+        generate: Callable[[Any], Any],
+        send: Callable[[Any], None],
+        num_generators: int = 1,
+        max_pending: int = 8,
+    ):
+        """
+        Args:
+            generate: Prepares the data of a single task. Called concurrently from the generator threads.
+            send: Inserts the prepared data of a single task. Called from the sender thread, in the order of the tasks.
+            num_generators: The number of generator threads.
+            max_pending: The maximal number of tasks that are generated ahead of the sender.
+        """
+        if max_pending < 1:
+            raise ValueError("max_pending must be at least 1")
+        self._generate = generate
+        self._send = send
+        self._num_generators = num_generators
+        self._max_pending = max_pending
+        self._stats = PipelineStats()
+        self._stats_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def stats(self) -> PipelineStats:
+        return self._stats
+
+    @property
+    def error(self) -> Optional[BaseException]:
+        return self._error
+
+    def failed(self) -> bool:
+        return self._error is not None
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, tasks: Iterable[Any]):
+        if self._thread is not None:
+            raise RuntimeError("pipeline was already started")
+        self._thread = threading.Thread(target=self._run_sender, args=(iter(tasks),), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops generating and sending data. Tasks which are already being generated are discarded."""
+        self._stop_event.set()
+
+    def join(self, timeout: Optional[float] = None):
+        """Waits for all the tasks to be sent, re-raising the first error raised by the generators or the sender."""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._error is not None:
+            raise self._error
+
+    def _timed_generate(self, task):
+        start = time.perf_counter()
+        result = self._generate(task)
+        with self._stats_lock:
+            self._stats.generation_time += time.perf_counter() - start
+        return result
+
+    def _run_sender(self, tasks):
+        start = time.perf_counter()
+        pending: Deque[Future] = collections.deque()
+        with ThreadPoolExecutor(max_workers=self._num_generators, thread_name_prefix="input-stream-generator") as pool:
+
+            def submit_next():
+                task = next(tasks, None)
+                if task is not None:
+                    pending.append(pool.submit(self._timed_generate, task))
+
+            try:
+                for _ in range(self._max_pending):
+                    submit_next()
+                while len(pending) > 0 and not self._stop_event.is_set():
+                    future = pending.popleft()
+                    wait_start = time.perf_counter()
+                    data = future.result()
+                    self._stats.starved_time += time.perf_counter() - wait_start
+                    submit_next()
+
+                    insert_start = time.perf_counter()
+                    self._send(data)
+                    self._stats.insertion_time += time.perf_counter() - insert_start
+                    self._stats.num_tasks += 1
+            except BaseException as e:
+                self._error = e
+            finally:
+                for future in pending:
+                    future.cancel()
+        self._stats.total_time = time.perf_counter() - start
@@ -0,0 +1,163 @@
+"""
+Bit-packed Clifford tableaus, which scale to tens of qubits.
+
+A tableau on n qubits is stored by the images of its 2n generators X_0, Z_0, X_1, Z_1, ... (the columns of
+`SimpleTableau.g`, in the same order), each a Hermitian Pauli string with a sign. The x and z bits of every image are
+packed into rows of uint64 words, bit `i % 64` of word `i // 64` standing for qubit i, so that multiplying Pauli strings
+takes a few XORs and popcounts per 64 qubits.
+
+The phase of a product follows from writing the Hermitian Pauli string of bits (x, z) as i^(x.z) X^x Z^z: per qubit,
+P(x1, z1) P(x2, z2) = i^(x1 z1 + x2 z2 + 2 z1 x2 - x3 z3) P(x3, z3) with x3 = x1 ^ x2 and z3 = z1 ^ z2.
+"""
+from typing import Tuple, Union
+
+import numpy as np
+
+from .simple_tableau import SimpleTableau, generate_from_name
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.int64)
+
+
+def _popcount(words: np.ndarray) -> np.ndarray:
+    """The number of set bits of every row of words, i.e. summed over the last axis."""
+    return _POPCOUNT[words.view(np.uint8)].sum(axis=-1)
+
+
+def _pack(bits: np.ndarray) -> np.ndarray:
+    """Packs an array of bits of shape (..., n) into words of shape (..., ceil(n / 64))."""
+    num_words = max(-(-bits.shape[-1] // 64), 1)
+    padded = np.zeros(bits.shape[:-1] + (64 * num_words,), dtype=np.uint8)
+    padded[..., : bits.shape[-1]] = bits
+    return np.packbits(padded, axis=-1, bitorder="little").view("<u8")
+
+
+def _unpack(words: np.ndarray, n: int) -> np.ndarray:
+    return np.unpackbits(np.ascontiguousarray(words).view(np.uint8), axis=-1, bitorder="little")[..., :n]
+
+
+class PackedTableau:
+    """
+    A Clifford tableau stored as bit-packed Pauli strings, with the API of `SimpleTableau`. `g` and `alpha` have the
+    layout of `SimpleTableau`, and are unpacked on access.
+    """
+
+    def __init__(self, g, alpha):
+        simple = SimpleTableau(g, alpha)
+        self._n = simple.n
+        self._xs = _pack(simple.g[0::2].T)
+        self._zs = _pack(simple.g[1::2].T)
+        self._signs = simple.alpha.astype(np.uint8)
+
+    @classmethod
+    def _from_packed(cls, n: int, xs: np.ndarray, zs: np.ndarray, signs: np.ndarray) -> "PackedTableau":
+        tableau = cls.__new__(cls)
+        tableau._n = n
+        tableau._xs = xs
+        tableau._zs = zs
+        tableau._signs = signs.astype(np.uint8)
+        return tableau
+
+    @classmethod
+    def from_simple(cls, tableau: SimpleTableau) -> "PackedTableau":
+        return cls(tableau.g, tableau.alpha)
+
+    @classmethod
+    def from_name(cls, name: str, target: Union[int, Tuple[int, int]], n=None) -> "PackedTableau":
+        """The tableau of a named gate, see `simple_tableau.generate_from_name`."""
+        return cls.from_simple(generate_from_name(name, target, n))
+
+    @classmethod
+    def identity(cls, n: int) -> "PackedTableau":
+        bits = np.eye(n, dtype=np.uint8)
+        zeros = np.zeros((n, n), dtype=np.uint8)
+        xs = _pack(np.stack([bits, zeros], axis=1).reshape(2 * n, n))
+        zs = _pack(np.stack([zeros, bits], axis=1).reshape(2 * n, n))
+        return cls._from_packed(n, xs, zs, np.zeros(2 * n))
+
+    def to_simple(self) -> SimpleTableau:
+        return SimpleTableau(self.g, self.alpha)
+
+    @property
+    def g(self):
+        g = np.empty((2 * self._n, 2 * self._n), dtype=np.uint8)
+        g[0::2] = _unpack(self._xs, self._n).T
+        g[1::2] = _unpack(self._zs, self._n).T
+        return g
+
+    @property
+    def alpha(self):
+        return self._signs.copy()
+
+    @property
+    def n(self):
+        return self._n
+
+    def __str__(self):
+        return str(self.to_simple())
+
+    def __repr__(self):
+        return str(self)
+
+    def __eq__(self, other):
+        return (
+            self._n == other._n
+            and np.array_equal(self._xs, other._xs)
+            and np.array_equal(self._zs, other._zs)
+            and np.array_equal(self._signs, other._signs)
+        )
+
+    def __hash__(self):
+        return hash((self._xs.tobytes(), self._zs.tobytes(), self._signs.tobytes()))
+
+    def _apply_to_images(self, xs: np.ndarray, zs: np.ndarray, signs: np.ndarray):
+        """
+        Applies this tableau to the Pauli strings of the rows of xs and zs (with the given signs), by multiplying the
+        images of the generators of every string. Returns the bits and signs of the images.
+        """
+        num_rows = len(xs)
+        out_xs = np.zeros_like(self._xs, shape=(num_rows, self._xs.shape[1]))
+        out_zs = np.zeros_like(out_xs)
+        # the phase exponent of i, from i^(x.z) of the decomposition and from the signs
+        phases = _popcount(xs & zs) + 2 * signs.astype(np.int64)
+        x_bits = _unpack(xs, self._n).astype(bool)
+        z_bits = _unpack(zs, self._n).astype(bool)
+        for qubit in range(self._n):
+            for generator, bits in ((2 * qubit, x_bits), (2 * qubit + 1, z_bits)):
+                rows = bits[:, qubit]
+                if not rows.any():
+                    continue
+                gen_xs, gen_zs = self._xs[generator], self._zs[generator]
+                acc_xs, acc_zs = out_xs[rows], out_zs[rows]
+                new_xs, new_zs = acc_xs ^ gen_xs, acc_zs ^ gen_zs
+                phases[rows] += (
+                    _popcount(acc_xs & acc_zs)
+                    + _popcount(gen_xs & gen_zs)
+                    + 2 * _popcount(acc_zs & gen_xs)
+                    - _popcount(new_xs & new_zs)
+                    + 2 * int(self._signs[generator])
+                )
+                out_xs[rows], out_zs[rows] = new_xs, new_zs
+        phases %= 4
+        assert np.all(phases % 2 == 0), "the image of a Hermitian Pauli string must be Hermitian"
+        return out_xs, out_zs, (phases // 2).astype(np.uint8)
+
+    def then(self, other: "PackedTableau") -> "PackedTableau":
+        if self.n != other.n:
+            raise ValueError(f"number of qubits of self={self.n} and of other={other.n} is incompatible")
+        return PackedTableau._from_packed(self._n, *other._apply_to_images(self._xs, self._zs, self._signs))
+
+    def inverse(self) -> "PackedTableau":
+        lam = np.zeros((2 * self._n, 2 * self._n), dtype=np.uint8)
+        lam[np.arange(0, 2 * self._n, 2), np.arange(1, 2 * self._n, 2)] = 1
+        lam = lam + lam.T
+        g_inv = lam @ self.g.T @ lam % 2
+        unsigned = PackedTableau._from_packed(
+            self._n, _pack(g_inv[0::2].T), _pack(g_inv[1::2].T), np.zeros(2 * self._n)
+        )
+        # applying the unsigned inverse and then self maps every generator to itself, up to the sign of the inverse
+        _, _, signs = self._apply_to_images(unsigned._xs, unsigned._zs, unsigned._signs)
+        unsigned._signs = signs
+        return unsigned
+
+    def is_identity(self):
+        return self == PackedTableau.identity(self._n)
@@ -0,0 +1,97 @@
+import dataclasses
+import time
+from typing import Callable, Iterator, Optional
+
+from tqdm import tqdm
+
+
+@dataclasses.dataclass
+class ProgressUpdate:
+    done: int  # number of completed circuits
+    total: int
+    elapsed: float  # seconds since the tracking started
+    circuits_per_second: float
+    shots_per_second: float
+    eta: Optional[float]  # estimated seconds until all circuits are completed, None before any progress
+
+    @property
+    def fraction(self) -> float:
+        return self.done / self.total if self.total > 0 else 1.0
+
+    @property
+    def finished(self) -> bool:
+        return self.done >= self.total
+
+
+def iter_progress(
+    handle,
+    total: int,
+    shots_per_circuit: int = 1,
+    abort: Optional[Callable[[], bool]] = None,
+    is_running: Optional[Callable[[], bool]] = None,
+    min_interval: float = 0.1,
+    max_interval: float = 5.0,
+    timeout: Optional[float] = None,
+) -> Iterator[ProgressUpdate]:
+    """
+    Yields a `ProgressUpdate` whenever the number of values saved to the stream of `handle` (a `save_all` stream with a
+    single value per completed circuit) increases, until it reaches `total`.
+
+    The count is queried with an adaptive interval instead of a fixed busy loop: it doubles, up to `max_interval`,
+    every time no progress was made, and is reset to the measured time per circuit (but at least `min_interval`)
+    once progress is made.
+
+    Args:
+        handle: The result handle of the progress stream.
+        total: The number of circuits in the program.
+        shots_per_circuit: The number of shots per circuit, used for the reported shot rate.
+        abort: Stops the iteration when it returns True.
+        is_running: Whether the job is still running, e.g. `job.result_handles.is_processing`. The iteration stops
+            when the job stopped (it was halted or failed) and no more progress was made since.
+        min_interval: The minimal interval between queries, in seconds.
+        max_interval: The maximal interval between queries, in seconds.
+        timeout: If given, raises a `TimeoutError` if no progress was made for this number of seconds.
+    """
+    start = time.monotonic()
+    last_progress = start
+    interval = min_interval
+    done = 0
+    while done < total:
+        if abort is not None and abort():
+            return
+        # queried before the count, so that the progress made until the job stopped is reported
+        stopped = is_running is not None and not is_running()
+        count = min(handle.count_so_far(), total)
+        now = time.monotonic()
+        if count > done:
+            done = count
+            last_progress = now
+            elapsed = now - start
+            circuits_per_second = done / elapsed if elapsed > 0 else 0.0
+            yield ProgressUpdate(
+                done=done,
+                total=total,
+                elapsed=elapsed,
+                circuits_per_second=circuits_per_second,
+                shots_per_second=circuits_per_second * shots_per_circuit,
+                eta=(total - done) / circuits_per_second if circuits_per_second > 0 else None,
+            )
+            interval = min(max(1 / circuits_per_second if circuits_per_second > 0 else 0, min_interval), max_interval)
+            if done >= total:
+                return
+        else:
+            if stopped:
+                return
+            if timeout is not None and now - last_progress > timeout:
+                raise TimeoutError(f"no progress was made for {timeout} seconds")
+            interval = min(2 * interval, max_interval)
+        time.sleep(interval)
+
+
+def progress_bar(updates: Iterator[ProgressUpdate], total: int, desc: str = "progress", unit: str = "circuit"):
+    """Displays the updates of `iter_progress` as a tqdm progress bar, including the shot rate."""
+    with tqdm(total=total, desc=desc, unit=unit) as bar:
+        for update in updates:
+            bar.update(update.done - bar.n)
+            bar.set_postfix(shots_per_s=f"{update.shots_per_second:.1f}")
+            yield update
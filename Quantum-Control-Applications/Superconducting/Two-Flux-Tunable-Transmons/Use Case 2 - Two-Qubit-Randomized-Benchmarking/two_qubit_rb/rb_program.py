@@ -0,0 +1,576 @@
+import functools
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+from qm.QuantumMachinesManager import QuantumMachinesManager
+from qm.jobs.running_qm_job import RunningQmJob
+from qm.qua import *
+
+from .RBResult import RBResult
+from .input_stream_pipeline import InputStreamPipeline, PipelineStats
+from .progress import ProgressUpdate, iter_progress, progress_bar
+
+if TYPE_CHECKING:
+    from .TwoQubitRB import TwoQubitRb
+
+
+class RBProgram:
+    """
+    The QUA program of randomized benchmarking of one or several disjoint qubit pairs, whose sequences are played
+    simultaneously, and the runs of this program. `TwoQubitRb` runs the program of its own qubit pair, and
+    `SimultaneousTwoQubitRb` the program of several of them.
+    """
+
+    _buffer_length = 4096
+    _sequences_per_batch = 16
+    reference_experiment = "reference"
+
+    def __init__(self, pairs: List["TwoQubitRb"], prep_func: Callable[[], None], config: dict, default_experiment: str):
+        """
+        Args:
+            pairs: The benchmarks of the qubit pairs, whose baked commands and measurement functions are played.
+            prep_func: A callable used to reset all the qubits to the |0> state.
+            config: The configuration with the baked operations of all the pairs.
+            default_experiment: The experiment of `run`, i.e. the reference or the interleaved experiment.
+        """
+        self._pairs = list(pairs)
+        self._prep_func = prep_func
+        self._config = config
+        self._default_experiment = default_experiment
+        self._input_stream_stats: Optional[PipelineStats] = None
+        self._last_seed: Optional[int] = None
+
+    def _experiments(self) -> List[str]:
+        """The experiments which can be run in a campaign, i.e. the ones common to all the pairs."""
+        experiments = self._pairs[0]._experiments()
+        return [e for e in experiments if all(e in pair._experiments() for pair in self._pairs[1:])]
+
+    def _max_sequence_length(self, sequence_depths: List[int], experiments: Optional[Iterable[str]] = None) -> int:
+        return max(pair._max_sequence_length(sequence_depths, experiments) for pair in self._pairs)
+
+    @staticmethod
+    def _read_input_stream_chunks(gates_is: dict, gates: dict, length, chunk_size: int):
+        """
+        Reads `length` commands per element into the `gates` arrays, from as many chunks of the input streams as
+        needed.
+        """
+        offset = declare(int)
+        i = declare(int)
+        with for_(offset, 0, offset < length, offset + chunk_size):
+            for qe, gate_is in gates_is.items():
+                advance_input_stream(gate_is)
+                with for_(i, 0, (i < chunk_size) & (offset + i < length), i + 1):
+                    assign(gates[qe][offset + i], gate_is[i])
+
+    def _gen_qua_program(
+        self,
+        sequence_depths: list[int],
+        num_repeats: int,
+        num_averages: int,
+        chunk_size: Optional[int] = None,
+        histogram_only: bool = False,
+        experiments: Optional[Iterable[str]] = None,
+    ):
+        """
+        If `chunk_size` is given, the commands of every sequence are transferred in chunks of that size and
+        collected into arrays long enough for the deepest sequence, instead of in a single buffer of fixed length.
+        If `histogram_only`, the measured states are counted on the OPX and only the four counts of every circuit are
+        streamed (as "counts_<pair>"), instead of the state of every shot (as "state_<pair>").
+        `experiments` are the experiments of the circuits, which determine the maximal sequence length.
+        The sequences of all the qubit pairs have the same length, and are played simultaneously.
+        """
+        with program() as prog:
+            sequence_depth = declare(int)
+            repeat = declare(int)
+            n_avg = declare(int)
+            state = declare(int)
+            length = declare(int)
+            progress = declare(int)
+            progress_os = declare_stream()
+            state_os = [declare_stream() for _ in self._pairs]
+            if histogram_only:
+                counts = [declare(int, size=4) for _ in self._pairs]
+            gates_len_is = declare_input_stream(int, name="__gates_len_is__", size=1)
+            gates_is = [
+                {
+                    qe: declare_input_stream(int, name=f"{qe}_is", size=chunk_size or self._buffer_length)
+                    for qe in pair._rb_baker.all_elements
+                }
+                for pair in self._pairs
+            ]
+            if chunk_size is None:
+                gates = gates_is
+            else:
+                max_length = self._max_sequence_length(sequence_depths, experiments)
+                gates = [{qe: declare(int, size=max_length) for qe in pair_gates_is} for pair_gates_is in gates_is]
+
+            assign(progress, 0)
+            with for_each_(sequence_depth, sequence_depths):
+                with for_(repeat, 0, repeat < num_repeats, repeat + 1):
+                    advance_input_stream(gates_len_is)
+                    assign(length, gates_len_is[0])
+                    for pair_gates_is, pair_gates in zip(gates_is, gates):
+                        if chunk_size is None:
+                            for gate_is in pair_gates_is.values():
+                                advance_input_stream(gate_is)
+                        else:
+                            self._read_input_stream_chunks(pair_gates_is, pair_gates, length, chunk_size)
+                    if histogram_only:
+                        for pair_counts in counts:
+                            for i in range(4):
+                                assign(pair_counts[i], 0)
+                    with for_(n_avg, 0, n_avg < num_averages, n_avg + 1):
+                        self._prep_func()
+                        align()
+                        for pair, pair_gates in zip(self._pairs, gates):
+                            pair._rb_baker.run(pair_gates, length, align_all=False)
+                        align()
+                        for k, pair in enumerate(self._pairs):
+                            out1, out2 = pair._measure_func()
+                            assign(state, (Cast.to_int(out2) << 1) + Cast.to_int(out1))
+                            if histogram_only:
+                                assign(counts[k][state], counts[k][state] + 1)
+                            else:
+                                save(state, state_os[k])
+                    if histogram_only:
+                        for k, pair_counts in enumerate(counts):
+                            for i in range(4):
+                                save(pair_counts[i], state_os[k])
+                    assign(progress, progress + 1)
+                    save(progress, progress_os)
+
+            with stream_processing():
+                for k, pair_state_os in enumerate(state_os):
+                    if histogram_only:
+                        pair_state_os.buffer(4).save_all(f"counts_{k}")
+                    else:
+                        pair_state_os.buffer(num_averages).save_all(f"state_{k}")
+                progress_os.save_all("progress")
+        return prog
+
+    def _gen_input_stream_batch(
+        self, chunk_size: Optional[int], task: Tuple[int, Tuple[str, ...], np.random.SeedSequence]
+    ):
+        """
+        Generates the sequences of consecutive circuits of the same depth, whose experiments are given by `task`, for
+        every qubit pair. Every task has a random generator of its own, seeded by the task, so that the sequences do
+        not depend on the number of generator threads or on which of them runs the task.
+        Returns the sequences and their encoding (None if `chunk_size` is None) of every pair, in the order of the
+        circuits.
+        """
+        sequence_depth, experiments, seed_sequence = task
+        rng = np.random.default_rng(seed_sequence)
+        return [pair._gen_experiment_sequences(sequence_depth, experiments, chunk_size, rng) for pair in self._pairs]
+
+    def _insert_input_stream_batch(
+        self,
+        job: RunningQmJob,
+        callback: Optional[Callable[[List[int]], None]],
+        batch: List[Tuple[List[np.ndarray], List[np.ndarray]]],
+    ):
+        sequences, _ = batch[0]
+        for i in range(len(sequences)):
+            job.insert_input_stream("__gates_len_is__", len(sequences[i]))
+            for pair, (pair_sequences, pair_encoded) in zip(self._pairs, batch):
+                sequence = pair_sequences[i].tolist()
+                if pair._sequence_tracker is not None:
+                    pair._sequence_tracker.make_sequence(sequence)
+                # `insert_input_stream` expects lists
+                for qe, chunks in zip(pair._rb_baker.decode_elements, pair_encoded[i].tolist()):
+                    for chunk in chunks:
+                        job.insert_input_stream(f"{qe}_is", chunk)
+
+                if callback is not None:
+                    callback(sequence)
+
+    def _insert_all_input_stream(
+        self,
+        job: RunningQmJob,
+        sequence_depths: List[int],
+        num_repeats: int,
+        callback: Optional[Callable[[List[int]], None]] = None,
+        num_generators: int = 1,
+        max_pending_batches: int = 8,
+        chunk_size: Optional[int] = None,
+        experiments: Optional[np.ndarray] = None,
+        seed_sequence: Optional[np.random.SeedSequence] = None,
+    ) -> InputStreamPipeline:
+        """
+        Starts generating the random sequences in `num_generators` threads and inserting them into the input streams
+        of `job`, in the order in which the program reads them. Returns the running pipeline.
+        `experiments` gives the experiment of every circuit, as an array of shape (len(sequence_depths), num_repeats),
+        and defaults to the experiment of `run`.
+        """
+        tasks = self._sequence_tasks(sequence_depths, num_repeats, experiments, seed_sequence)
+        pipeline = InputStreamPipeline(
+            functools.partial(self._gen_input_stream_batch, chunk_size or self._buffer_length),
+            lambda batch: self._insert_input_stream_batch(job, callback, batch),
+            num_generators=num_generators,
+            max_pending=max_pending_batches,
+        )
+        pipeline.start(tasks)
+        return pipeline
+
+    def _sequence_tasks(
+        self,
+        sequence_depths: List[int],
+        num_repeats: int,
+        experiments: Optional[np.ndarray],
+        seed_sequence: Optional[np.random.SeedSequence],
+    ) -> List[Tuple[int, Tuple[str, ...], np.random.SeedSequence]]:
+        """
+        Divides the circuits into batches of consecutive circuits of the same depth, each with the experiments of its
+        circuits and a seed of its own, spawned from `seed_sequence`.
+        """
+        if experiments is None:
+            experiments = np.full((len(sequence_depths), num_repeats), self._default_experiment)
+        batches = [
+            (sequence_depth, tuple(experiments[i, start : start + self._sequences_per_batch].tolist()))
+            for i, sequence_depth in enumerate(sequence_depths)
+            for start in range(0, num_repeats, self._sequences_per_batch)
+        ]
+        seeds = (seed_sequence or np.random.SeedSequence()).spawn(len(batches))
+        return [(sequence_depth, batch, seed) for (sequence_depth, batch), seed in zip(batches, seeds)]
+
+    def _plan_circuits(
+        self,
+        circuit_depths: List[int],
+        num_circuits_per_depth: int,
+        experiments: Optional[List[str]],
+        seed: Optional[int],
+    ) -> Tuple[int, Optional[np.ndarray], np.random.SeedSequence]:
+        """
+        Returns the number of circuits per depth, the experiment of every circuit (None for `run`) and the seed
+        sequence of the random sequences of a run with the given seed. For a campaign, the experiments of every depth
+        are in a random order drawn from the seed.
+        """
+        experiments_seed, sequences_seed = np.random.SeedSequence(seed).spawn(2)
+        if experiments is None:
+            return num_circuits_per_depth, None, sequences_seed
+        rng = np.random.default_rng(experiments_seed)
+        circuit_experiments = np.array(
+            [rng.permutation(np.repeat(experiments, num_circuits_per_depth)) for _ in circuit_depths]
+        )
+        return len(experiments) * num_circuits_per_depth, circuit_experiments, sequences_seed
+
+    def generate_sequences(
+        self,
+        circuit_depths: List[int],
+        num_circuits_per_depth: int,
+        seed: int,
+        experiments: Optional[List[str]] = None,
+    ) -> List[List[int]]:
+        """
+        Regenerates the sequences of command ids of a run with the given seed (see `last_seed`), in the order in which
+        they were run, instead of storing them. If `experiments` is given, the sequences of the campaign of these
+        experiments are regenerated.
+        """
+        num_repeats, circuit_experiments, seed_sequence = self._plan_circuits(
+            circuit_depths, num_circuits_per_depth, experiments, seed
+        )
+        sequences = [[] for _ in self._pairs]
+        for task in self._sequence_tasks(circuit_depths, num_repeats, circuit_experiments, seed_sequence):
+            for pair_sequences, (batch_sequences, _) in zip(sequences, self._gen_input_stream_batch(None, task)):
+                pair_sequences.extend(sequence.tolist() for sequence in batch_sequences)
+        return self._results_of_pairs(sequences)
+
+    @property
+    def last_seed(self) -> Optional[int]:
+        """
+        The seed of the last run, drawn from the OS entropy if none was given, with which its sequences can be
+        regenerated by `generate_sequences`.
+        """
+        return self._last_seed
+
+    def run(
+        self,
+        qmm: QuantumMachinesManager,
+        circuit_depths: List[int],
+        num_circuits_per_depth: int,
+        num_shots_per_circuit: int,
+        *,
+        seed: Optional[int] = None,
+        gen_sequence_callback: Optional[Callable[[List[int]], None]] = None,
+        num_sequence_generators: int = 1,
+        max_pending_sequence_batches: int = 8,
+        input_stream_chunk_size: Optional[int] = None,
+        progress_callback: Optional[Callable[[ProgressUpdate], None]] = None,
+        show_progress: bool = True,
+        progress_timeout: Optional[float] = None,
+        result_path: Optional[Union[str, Path]] = None,
+        result_callback: Optional[Callable[[RBResult], None]] = None,
+        histogram_only: bool = False,
+    ):
+        """
+        Runs the randomized benchmarking experiment. The experiment is sweep over Clifford circuits with varying depths.
+        For every depth, we generate a number of random circuits and run them. The number of different circuits is determined by
+        the num_circuits_per_depth parameter. The number of shots per individual circuit is determined by the num_averages parameter.
+
+        Args:
+            qmm (QuantumMachinesManager): The Quantum Machines Manager object which is used to run the experiment.
+            circuit_depths (List[int]): A list of the number of Cliffords per circuit (not including inverse).
+            num_circuits_per_depth (int): The number of different circuit randomizations per depth.
+            num_shots_per_circuit (int): The number of shots per particular circuit.
+
+        Keyword Args:
+            seed (int): The seed of the random sequences. Runs with the same seed, parameters and gates play the same
+                sequences, regardless of the number of generator threads. Defaults to a seed drawn from the OS entropy,
+                available as `last_seed` after the run.
+            gen_sequence_callback (Callable[[List[int]], None]): Called with every sequence inserted to the job.
+            num_sequence_generators (int): The number of threads generating the random sequences. Defaults to 1.
+            max_pending_sequence_batches (int): The maximal number of batches of sequences generated ahead of their
+                insertion into the input streams. Defaults to 8.
+            input_stream_chunk_size (int): If given, every sequence is transferred in as many chunks of this size
+                as it needs, instead of in a single buffer of 4096 commands per element. This reduces the transferred
+                data for short sequences and allows sequences longer than 4096 commands.
+            progress_callback (Callable[[ProgressUpdate], None]): Called with the number of completed circuits, the
+                throughput and the estimated remaining time whenever circuits are completed.
+            show_progress (bool): Whether to display a progress bar. Defaults to True.
+            progress_timeout (float): If given, raises a `TimeoutError` when no circuit was completed for this number
+                of seconds.
+            result_path (str | Path): If given, the measured states are written to this HDF5 file as the circuits are
+                completed, so that a partial result can be loaded with `RBResult.load`.
+            result_callback (Callable[[RBResult], None]): Called with the partial result whenever circuits are
+                completed, e.g. to update a fit with `RBResult.fit` while the job runs.
+            histogram_only (bool): If True, the outcomes of the shots are counted on the OPX and only the four counts
+                of every circuit are streamed to the host, instead of every single-shot state. The result then has
+                `counts` but no `state`. Defaults to False.
+        """
+        num_repeats, _, seed_sequence = self._plan_circuits(circuit_depths, num_circuits_per_depth, None, seed)
+        results = self._run(
+            qmm,
+            circuit_depths,
+            num_repeats,
+            num_shots_per_circuit,
+            None,
+            seed_sequence,
+            gen_sequence_callback=gen_sequence_callback,
+            num_sequence_generators=num_sequence_generators,
+            max_pending_sequence_batches=max_pending_sequence_batches,
+            input_stream_chunk_size=input_stream_chunk_size,
+            progress_callback=progress_callback,
+            show_progress=show_progress,
+            progress_timeout=progress_timeout,
+            result_path=result_path,
+            result_callback=result_callback,
+            histogram_only=histogram_only,
+        )
+        return self._results_of_pairs(results)
+
+    def run_campaign(
+        self,
+        qmm: QuantumMachinesManager,
+        circuit_depths: List[int],
+        num_circuits_per_depth: int,
+        num_shots_per_circuit: int,
+        experiments: Optional[List[str]] = None,
+        *,
+        seed: Optional[int] = None,
+        gen_sequence_callback: Optional[Callable[[List[int]], None]] = None,
+        num_sequence_generators: int = 1,
+        max_pending_sequence_batches: int = 8,
+        input_stream_chunk_size: Optional[int] = None,
+        progress_callback: Optional[Callable[[ProgressUpdate], None]] = None,
+        show_progress: bool = True,
+        progress_timeout: Optional[float] = None,
+        result_path: Optional[Union[str, Path]] = None,
+        result_callback: Optional[Callable[[RBResult], None]] = None,
+        histogram_only: bool = False,
+    ) -> Dict[str, RBResult]:
+        """
+        Runs the reference experiment and the interleaved experiments of several interleaving gates in a single
+        program. For every depth, `num_circuits_per_depth` circuits of every experiment are run in a random order, so
+        that drifts during the run affect all the experiments alike.
+
+        Args:
+            qmm (QuantumMachinesManager): The Quantum Machines Manager object which is used to run the experiment.
+            circuit_depths (List[int]): A list of the number of Cliffords per circuit (not including inverse).
+            num_circuits_per_depth (int): The number of different circuit randomizations per depth and experiment.
+            num_shots_per_circuit (int): The number of shots per particular circuit.
+            experiments (List[str]): The experiments to run: `TwoQubitRb.reference_experiment` and the names of the
+                interleaving gates. Defaults to all of them.
+
+        Keyword Args:
+            The keyword arguments of `run`. The progress and the partial results (and the result file) cover the
+            circuits of all the experiments, in the order in which they are run. The seed determines this order too.
+
+        Returns:
+            The result of every experiment.
+        """
+        if experiments is None:
+            experiments = self._experiments()
+        unknown = set(experiments) - set(self._experiments())
+        if unknown:
+            raise ValueError(f"unknown experiments: {', '.join(sorted(unknown))}")
+
+        num_repeats, circuit_experiments, seed_sequence = self._plan_circuits(
+            circuit_depths, num_circuits_per_depth, experiments, seed
+        )
+        results = self._run(
+            qmm,
+            circuit_depths,
+            num_repeats,
+            num_shots_per_circuit,
+            circuit_experiments,
+            seed_sequence,
+            gen_sequence_callback=gen_sequence_callback,
+            num_sequence_generators=num_sequence_generators,
+            max_pending_sequence_batches=max_pending_sequence_batches,
+            input_stream_chunk_size=input_stream_chunk_size,
+            progress_callback=progress_callback,
+            show_progress=show_progress,
+            progress_timeout=progress_timeout,
+            result_path=result_path,
+            result_callback=result_callback,
+            histogram_only=histogram_only,
+        )
+        experiment_results = []
+        for result in results:
+            split = result.split(circuit_experiments)
+            experiment_results.append({experiment: split[experiment] for experiment in experiments})
+        return self._results_of_pairs(experiment_results)
+
+    def _results_of_pairs(self, results: list):
+        """The result returned to the user from the results of every qubit pair."""
+        return results
+
+    def _run(
+        self,
+        qmm: QuantumMachinesManager,
+        circuit_depths: List[int],
+        num_circuits_per_depth: int,
+        num_shots_per_circuit: int,
+        experiments: Optional[np.ndarray],
+        seed_sequence: np.random.SeedSequence,
+        *,
+        gen_sequence_callback: Optional[Callable[[List[int]], None]],
+        num_sequence_generators: int,
+        max_pending_sequence_batches: int,
+        input_stream_chunk_size: Optional[int],
+        progress_callback: Optional[Callable[[ProgressUpdate], None]],
+        show_progress: bool,
+        progress_timeout: Optional[float],
+        result_path: Optional[Union[str, Path]],
+        result_callback: Optional[Callable[[RBResult], None]],
+        histogram_only: bool,
+    ) -> List[RBResult]:
+        # the sequences seed is spawned from the seed of the run, and has the same entropy
+        self._last_seed = seed_sequence.entropy
+        experiment_names = None if experiments is None else np.unique(experiments).tolist()
+        if (
+            input_stream_chunk_size is None
+            and self._max_sequence_length(circuit_depths, experiment_names) > self._buffer_length
+        ):
+            raise RuntimeError(
+                f"Buffer is too small for circuit depth {max(circuit_depths)}, use `input_stream_chunk_size` to "
+                f"transfer longer sequences"
+            )
+
+        prog = self._gen_qua_program(
+            circuit_depths,
+            num_circuits_per_depth,
+            num_shots_per_circuit,
+            input_stream_chunk_size,
+            histogram_only,
+            experiment_names,
+        )
+
+        qm = qmm.open_qm(self._config)
+        job = qm.execute(prog)
+
+        pipeline = self._insert_all_input_stream(
+            job,
+            circuit_depths,
+            num_circuits_per_depth,
+            gen_sequence_callback,
+            num_generators=num_sequence_generators,
+            max_pending_batches=max_pending_sequence_batches,
+            chunk_size=input_stream_chunk_size,
+            experiments=experiments,
+            seed_sequence=seed_sequence,
+        )
+
+        full_progress = len(circuit_depths) * num_circuits_per_depth
+        results = [
+            RBResult.empty(
+                circuit_depths,
+                num_circuits_per_depth,
+                num_shots_per_circuit,
+                path=self._pair_path(result_path, k) if result_path is not None else None,
+                histogram_only=histogram_only,
+            )
+            for k in range(len(self._pairs))
+        ]
+        state_handles = [
+            job.result_handles.get(f"counts_{k}" if histogram_only else f"state_{k}") for k in range(len(self._pairs))
+        ]
+        try:
+            updates = iter_progress(
+                job.result_handles.get("progress"),
+                full_progress,
+                num_shots_per_circuit,
+                abort=pipeline.failed,
+                is_running=job.result_handles.is_processing,
+                timeout=progress_timeout,
+            )
+            if show_progress:
+                updates = progress_bar(updates, full_progress)
+            for update in updates:
+                if progress_callback is not None:
+                    progress_callback(update)
+                fetched = [
+                    self._fetch_new_circuits(state_handle, result, update.done)
+                    for state_handle, result in zip(state_handles, results)
+                ]
+                if any(fetched) and result_callback is not None:
+                    result_callback(self._results_of_pairs(results))
+            if pipeline.failed():
+                job.halt()
+            elif not job.result_handles.is_processing():
+                # the job stopped, e.g. it was halted, so the sequences which are left are not sent
+                pipeline.stop()
+            pipeline.join()
+            job.result_handles.wait_for_all_values()
+            for state_handle, result in zip(state_handles, results):
+                self._fetch_new_circuits(state_handle, result, full_progress)
+        finally:
+            pipeline.stop()
+            self._input_stream_stats = pipeline.stats
+            for result in results:
+                result.close()
+
+        return results
+
+    def _pair_path(self, path: Union[str, Path], pair: int) -> Path:
+        """
+        The file to which the result of the given qubit pair is written: `path` itself for a single pair, and otherwise
+        `path` with its name suffixed with "_pair<index>".
+        """
+        path = Path(path)
+        if len(self._pairs) == 1:
+            return path
+        return path.with_name(f"{path.stem}_pair{pair}{path.suffix}")
+
+    @staticmethod
+    def _fetch_new_circuits(state_handle, result: RBResult, done: int) -> bool:
+        """
+        Adds the states (or counts, for a histogram-only result) of the circuits completed since the last fetch, up
+        to `done`, to `result`. Returns whether any were added.
+        """
+        done = min(done, state_handle.count_so_far())
+        if done <= result.num_completed:
+            return False
+        new_circuits = state_handle.fetch(slice(result.num_completed, done), flat_struct=True)
+        if result.histogram_only:
+            result.add_circuit_counts(new_circuits)
+        else:
+            result.add_circuits(new_circuits)
+        return True
+
+    @property
+    def input_stream_stats(self) -> Optional[PipelineStats]:
+        """
+        The time spent generating the random sequences and inserting them into the input streams during the last run.
+        """
+        return self._input_stream_stats
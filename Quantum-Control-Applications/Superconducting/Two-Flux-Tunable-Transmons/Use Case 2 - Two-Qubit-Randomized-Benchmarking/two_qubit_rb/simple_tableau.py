@@ -199,19 +199,13 @@ def _is_symplectic(mat, n):
     return np.all(lhs == _lambda(n))
 
 
-_int_bit_map = {0: [0, 0], 1: [1, 0], 2: [1, 1], 3: [0, 1]}
-
-
 def stim_to_simple(tableau) -> SimpleTableau:
     n = len(tableau)
-    g = np.zeros((2 * n, 2 * n), dtype=np.uint8)
-    alpha = np.zeros(2 * n, dtype=np.uint8)
-    for j in range(0, 2 * n, 2):
-        pauli_string_x = tableau.x_output(j // 2)
-        pauli_string_z = tableau.z_output(j // 2)
-        alpha[j] = pauli_string_x.sign.real < 0
-        alpha[j + 1] = pauli_string_z.sign.real < 0
-        for i in range(0, 2 * n, 2):
-            g[i : i + 2, j] = _int_bit_map[pauli_string_x[i // 2]]
-            g[i : i + 2, j + 1] = _int_bit_map[pauli_string_z[i // 2]]
+    outputs = [output for k in range(n) for output in (tableau.x_output(k), tableau.z_output(k))]
+    # the x and z bits of every output, as arrays of shape (2n, n)
+    xs, zs = (np.array(bits, dtype=np.uint8) for bits in zip(*(output.to_numpy() for output in outputs)))
+    g = np.empty((2 * n, 2 * n), dtype=np.uint8)
+    g[0::2] = xs.T
+    g[1::2] = zs.T
+    alpha = np.array([output.sign.real < 0 for output in outputs], dtype=np.uint8)
     return SimpleTableau(g, alpha)
@@ -0,0 +1,109 @@
+import copy
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from configuration import config
+from ..RBBaker import RBBaker
+from .helpers import bake_cz, bake_phased_xz
+from ..verification.command_registry import CommandRegistry
+
+# bakes with gate generators reading calibrated values from a module-level object, as the gate generators of the
+# example do, and prints the cache key
+_key_script = f"""
+import sys
+import types
+
+from configuration import config
+from {RBBaker.__module__} import RBBaker
+
+calibration = types.SimpleNamespace(x180_amp=float(sys.argv[2]), cz_amp=0.2, q1_cz_phase=0.23, q2_cz_phase=0.12)
+
+
+def bake_phased_xz(baker, q, x, z, a):
+    baker.frame_rotation_2pi(a / 2, f"q{{q}}_xy")
+    baker.play("x180", f"q{{q}}_xy", amp=x * calibration.x180_amp)
+    baker.frame_rotation_2pi(-(a + z) / 2, f"q{{q}}_xy")
+
+
+def bake_cz(baker, q1, q2):
+    baker.play("cz", "q1_z", amp=calibration.cz_amp)
+    baker.align()
+    baker.frame_rotation_2pi(calibration.q1_cz_phase, "q1_xy")
+    baker.frame_rotation_2pi(calibration.q2_cz_phase, "q2_xy")
+    baker.align()
+
+
+print(RBBaker(config, bake_phased_xz, {{"CZ": bake_cz}}, cache_dir=sys.argv[1])._cache_key)
+"""
+
+
+def _key_in_new_interpreter(cache_dir: Path, hash_seed: str, x180_amp: float = 0.1) -> str:
+    env = dict(os.environ, PYTHONHASHSEED=hash_seed, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+    return subprocess.run(
+        [sys.executable, "-c", _key_script, str(cache_dir), str(x180_amp)],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.splitlines()[-1]
+
+
+def test_cache_key_is_stable_across_interpreters(tmp_path):
+    """
+    Tests that the cache key of the same configuration and gate generators does not depend on the hash seed of the
+    interpreter, so that the cached waveforms are found by the next run, and that it changes with a calibrated value
+    read by a gate generator, although the value is an attribute of an object.
+    """
+    key = _key_in_new_interpreter(tmp_path, "1")
+    assert _key_in_new_interpreter(tmp_path, "2") == key
+    assert len(list(tmp_path.iterdir())) == 1
+    assert _key_in_new_interpreter(tmp_path, "1", x180_amp=0.11) != key
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_only_the_elements_of_the_gates_are_baked(tmp_path):
+    """
+    Tests that the elements on which no gate plays, e.g. the readout resonators, are neither baked nor part of the
+    cache key, so that changing their pulses does not bake the commands again.
+    """
+    baker = RBBaker(config, bake_phased_xz, {"CZ": bake_cz}, cache_dir=tmp_path)
+    assert baker.all_elements == {"q1_xy", "q2_xy", "q1_z"}
+    assert set(baker._baking_config["elements"]) == baker.all_elements
+
+    changed_config = copy.deepcopy(config)
+    changed_config["pulses"]["readout_pulse_q1"]["length"] *= 2
+    for i in range(5):
+        changed_config["elements"][f"extra_{i}"] = copy.deepcopy(config["elements"]["rr1"])
+    changed_baker = RBBaker(changed_config, bake_phased_xz, {"CZ": bake_cz}, cache_dir=tmp_path)
+    assert changed_baker._cache_key == baker._cache_key
+    assert len(list(tmp_path.iterdir())) == 1
+    assert (changed_baker.decode_table == baker.decode_table).all()
+    assert changed_baker.bake(copy.deepcopy(config)) == baker.bake(copy.deepcopy(config))
+
+
+def test_baking_in_worker_processes():
+    """
+    Tests that baking the commands in spawned worker processes gives the same waveforms and records the same commands
+    as baking them in the current process, and that gate generators which cannot be pickled are rejected.
+    """
+    registry = CommandRegistry()
+    baker = RBBaker(config, bake_phased_xz, {"CZ": bake_cz}, command_registry=registry)
+    parallel_registry = CommandRegistry()
+    parallel_baker = RBBaker(config, bake_phased_xz, {"CZ": bake_cz}, command_registry=parallel_registry, num_workers=2)
+    assert (parallel_baker.decode_table == baker.decode_table).all()
+    assert parallel_baker.bake() == baker.bake()
+    assert parallel_registry.get_commands() == registry.get_commands()
+
+    with pytest.raises(ValueError):
+        RBBaker(config, lambda *args: bake_phased_xz(*args), {"CZ": bake_cz}, num_workers=2)
+
+
+if __name__ == "__main__":
+    test_cache_key_is_stable_across_interpreters(Path(tempfile.mkdtemp()))
+    test_only_the_elements_of_the_gates_are_baked(Path(tempfile.mkdtemp()))
+    test_baking_in_worker_processes()
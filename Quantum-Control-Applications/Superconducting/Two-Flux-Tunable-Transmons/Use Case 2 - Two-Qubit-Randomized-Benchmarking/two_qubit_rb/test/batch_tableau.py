@@ -0,0 +1,60 @@
+import random
+
+import numpy as np
+
+from .. import batch_tableau
+from .. import gates
+from ..gates import gate_db
+
+
+def test_batch_tableau_matches_simple_tableau():
+    """
+    Tests that composing and inverting a batch of random two-qubit Clifford tableaus gives the same
+    result as doing it one by one with `SimpleTableau`.
+    """
+    batch = 100
+    first = [random.choice(gate_db.tableaus) for _ in range(batch)]
+    second = [random.choice(gate_db.tableaus) for _ in range(batch)]
+
+    composed = batch_tableau.then(batch_tableau.stack(first), batch_tableau.stack(second))
+    inverse = batch_tableau.inverse(composed)
+
+    for i in range(batch):
+        expected = first[i].then(second[i])
+        assert batch_tableau.to_simple(composed[i]) == expected
+        assert batch_tableau.to_simple(inverse[i]) == expected.inverse()
+    assert batch_tableau.is_identity(batch_tableau.then(composed, inverse)).all()
+
+
+def test_clifford_ids_match_tableaus():
+    """
+    Tests that composing and inverting Cliffords on their integer group indices agrees with the tableau arithmetic.
+    """
+    first = np.random.randint(0, 11520, size=1000)
+    second = np.random.randint(0, 11520, size=1000)
+    first_tableaus = gate_db.tableaus_from_clifford_ids(first)
+    second_tableaus = gate_db.tableaus_from_clifford_ids(second)
+
+    assert np.array_equal(gate_db.clifford_ids_from_tableaus(first_tableaus), first)
+    composed = batch_tableau.then(first_tableaus, second_tableaus)
+    assert np.array_equal(gate_db.clifford_ids_from_tableaus(composed), gate_db.compose_clifford_ids(first, second))
+    inverse = batch_tableau.inverse(first_tableaus)
+    assert np.array_equal(gate_db.clifford_ids_from_tableaus(inverse), gate_db.inverse_clifford_ids(first))
+
+
+def test_missing_group_tables_are_generated_in_memory():
+    """
+    Tests that the group tables generated when a shipped table is missing equal the shipped ones, and that the
+    generated tables are not written to the package directory.
+    """
+    files = set(gates._package_dir.iterdir())
+    multiplication_table = gate_db._load_or_gen_table("missing_table.npy", gate_db._gen_multiplication_table)
+    assert np.array_equal(multiplication_table, gate_db._multiplication_table)
+    assert np.array_equal(gate_db._gen_inverse_table(), gate_db._inverse_table)
+    assert set(gates._package_dir.iterdir()) == files
+
+
+if __name__ == "__main__":
+    test_batch_tableau_matches_simple_tableau()
+    test_clifford_ids_match_tableaus()
+    test_missing_group_tables_are_generated_in_memory()
@@ -0,0 +1,20 @@
+from configuration import config
+from ..benchmark import BenchmarkResult, compare, run_benchmarks
+
+
+def test_benchmarks_report_throughput():
+    results = run_benchmarks(config, depths=[1, 10], repeat=1, quick=True)
+
+    assert len({result.name for result in results}) == len(results)
+    assert all(result.rate > 0 for result in results)
+
+
+def test_compare_reports_regressions():
+    results = [BenchmarkResult("fast", 100, "item", 1.0), BenchmarkResult("slow", 100, "item", 2.0)]
+
+    assert compare(results, {"fast": 100, "slow": 100, "removed": 1}) == ["slow"]
+
+
+if __name__ == "__main__":
+    test_benchmarks_report_throughput()
+    test_compare_reports_regressions()
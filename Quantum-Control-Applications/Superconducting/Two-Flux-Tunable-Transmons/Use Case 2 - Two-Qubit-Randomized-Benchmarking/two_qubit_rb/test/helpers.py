@@ -0,0 +1,26 @@
+"""The fake job and the gate generators shared by the tests, playing on the elements of `configuration.py`."""
+from qualang_tools.bakery.bakery import Baking
+
+
+class FakeJob:
+    """Stands in for a running job, recording the input stream insertions."""
+
+    def __init__(self):
+        self.inserts = []
+
+    def insert_input_stream(self, name, data):
+        self.inserts.append((name, data))
+
+
+def bake_phased_xz(baker: Baking, q, x, z, a):
+    baker.frame_rotation_2pi(a / 2, f"q{q}_xy")
+    baker.play("x180", f"q{q}_xy", amp=x)
+    baker.frame_rotation_2pi(-(a + z) / 2, f"q{q}_xy")
+
+
+def bake_cz(baker: Baking, q1, q2):
+    baker.play("cz", "q1_z")
+    baker.align()
+    baker.frame_rotation_2pi(0.23, "q1_xy")
+    baker.frame_rotation_2pi(0.12, "q2_xy")
+    baker.align()
@@ -0,0 +1,48 @@
+import time
+
+import pytest
+
+from ..input_stream_pipeline import InputStreamPipeline
+
+
+def test_pipeline_sends_in_order():
+    """
+    Tests that data generated concurrently, with tasks finishing out of order, is sent in the order of the tasks.
+    """
+    sent = []
+
+    def generate(task):
+        time.sleep(0.01 * (task % 3))
+        return task * 2
+
+    pipeline = InputStreamPipeline(generate, sent.append, num_generators=4, max_pending=5)
+    pipeline.start(range(50))
+    pipeline.join()
+
+    assert sent == [2 * task for task in range(50)]
+    assert pipeline.stats.num_tasks == 50
+
+
+def test_pipeline_propagates_errors():
+    """
+    Tests that an error raised while generating stops the pipeline and is re-raised by `join`.
+    """
+    sent = []
+
+    def generate(task):
+        if task == 10:
+            raise ValueError("generation failed")
+        return task
+
+    pipeline = InputStreamPipeline(generate, sent.append, num_generators=2, max_pending=3)
+    pipeline.start(range(50))
+    with pytest.raises(ValueError, match="generation failed"):
+        pipeline.join()
+
+    assert pipeline.failed()
+    assert sent == list(range(10))
+
+
+if __name__ == "__main__":
+    test_pipeline_sends_in_order()
+    test_pipeline_propagates_errors()
@@ -0,0 +1,56 @@
+import random
+
+from ..gates import gate_db
+from ..packed_tableau import PackedTableau
+from ..simple_tableau import generate_from_name
+
+_two_qubit_names = ["CNOT", "CZ", "SWAP"]
+_single_qubit_names = ["H", "S", "X", "Y", "Z", "SX", "SY", "-SX", "-SY"]
+
+
+def _random_circuit(n, num_gates, from_name):
+    gates = []
+    for _ in range(num_gates):
+        if random.random() < 0.5:
+            gates.append(from_name(random.choice(_two_qubit_names), tuple(random.sample(range(n), 2)), n))
+        else:
+            gates.append(from_name(random.choice(_single_qubit_names), random.randrange(n), n))
+    return gates
+
+
+def test_packed_tableau_matches_simple_tableau():
+    """
+    Tests that composing and inverting random two- and three-qubit Clifford tableaus gives the same result as
+    `SimpleTableau`.
+    """
+    for _ in range(100):
+        first, second = random.choice(gate_db.tableaus), random.choice(gate_db.tableaus)
+        composed = PackedTableau.from_simple(first).then(PackedTableau.from_simple(second))
+        assert composed.to_simple() == first.then(second)
+        assert composed.inverse().to_simple() == first.then(second).inverse()
+
+    for _ in range(10):
+        expected = generate_from_name("I", 0, 3)
+        packed = PackedTableau.identity(3)
+        for gate in _random_circuit(3, 10, generate_from_name):
+            expected = expected.then(gate)
+            packed = packed.then(PackedTableau.from_simple(gate))
+        assert packed.to_simple() == expected
+        assert packed.inverse().to_simple() == expected.inverse()
+
+
+def test_packed_tableau_many_qubits():
+    """Tests that a random Clifford on more qubits than fit in a word composes with its inverse to the identity."""
+    tableau = PackedTableau.identity(70)
+    for gate in _random_circuit(70, 100, PackedTableau.from_name):
+        tableau = tableau.then(gate)
+
+    assert not tableau.is_identity()
+    assert tableau.then(tableau.inverse()).is_identity()
+    assert tableau.inverse().then(tableau).is_identity()
+    assert PackedTableau(tableau.g, tableau.alpha) == tableau
+
+
+if __name__ == "__main__":
+    test_packed_tableau_matches_simple_tableau()
+    test_packed_tableau_many_qubits()
@@ -0,0 +1,66 @@
+import pytest
+
+from ..progress import iter_progress
+
+
+class _CountingHandle:
+    """A progress stream to which one more circuit is saved every time it is queried."""
+
+    def __init__(self):
+        self.count = 0
+
+    def count_so_far(self):
+        self.count += 1
+        return self.count
+
+
+class _StuckHandle:
+    def count_so_far(self):
+        return 0
+
+
+class _HaltedJobHandle:
+    """The progress stream of a job which is halted after the given number of circuits."""
+
+    def __init__(self, halted_after: int):
+        self.count = 0
+        self.halted_after = halted_after
+
+    def count_so_far(self):
+        self.count = min(self.count + 1, self.halted_after)
+        return self.count
+
+    def is_running(self):
+        return self.count < self.halted_after
+
+
+def test_progress_reports_every_completed_circuit():
+    updates = list(iter_progress(_CountingHandle(), total=5, shots_per_circuit=10, min_interval=0.001))
+
+    assert [update.done for update in updates] == [1, 2, 3, 4, 5]
+    assert updates[-1].finished
+    assert updates[-1].shots_per_second == pytest.approx(10 * updates[-1].circuits_per_second)
+
+
+def test_progress_timeout():
+    with pytest.raises(TimeoutError):
+        list(iter_progress(_StuckHandle(), total=5, min_interval=0.01, max_interval=0.05, timeout=0.2))
+
+
+def test_progress_abort():
+    assert list(iter_progress(_StuckHandle(), total=5, abort=lambda: True)) == []
+
+
+def test_progress_stops_with_the_job():
+    assert list(iter_progress(_StuckHandle(), total=5, is_running=lambda: False)) == []
+
+    handle = _HaltedJobHandle(halted_after=3)
+    updates = list(iter_progress(handle, total=5, is_running=handle.is_running, min_interval=0.001))
+    assert [update.done for update in updates] == [1, 2, 3]
+
+
+if __name__ == "__main__":
+    test_progress_reports_every_completed_circuit()
+    test_progress_timeout()
+    test_progress_abort()
+    test_progress_stops_with_the_job()
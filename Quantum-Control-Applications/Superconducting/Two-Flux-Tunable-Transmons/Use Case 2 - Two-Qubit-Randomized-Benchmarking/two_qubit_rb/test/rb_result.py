@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from ..RBResult import RBResult
+
+
+def _measure(rng, depth, num_circuits, num_averages, p=0.97):
+    fidelity = 0.7 * p**depth + 0.25
+    return np.where(
+        rng.random((num_circuits, num_averages)) < fidelity, 0, rng.integers(1, 4, (num_circuits, num_averages))
+    )
+
+
+def test_incremental_result_matches_full_result(tmp_path):
+    """
+    Tests that a result built from partial fetches, and written to disk while doing so, matches the full result.
+    """
+    rng = np.random.default_rng(0)
+    depths, num_repeats, num_averages = [1, 5, 10, 20], 6, 50
+    state = np.concatenate([_measure(rng, depth, num_repeats, num_averages) for depth in depths])
+
+    result = RBResult.empty(depths, num_repeats, num_averages, path=tmp_path / "result.h5")
+    for batch in np.array_split(state, 7):
+        result.add_circuits(batch)
+    result.close()
+
+    full_result = RBResult(depths, num_repeats, num_averages, state.reshape(len(depths), num_repeats, num_averages))
+    loaded = RBResult.load(tmp_path / "result.h5")
+    assert loaded.is_complete
+    assert np.array_equal(loaded.state, full_result.state)
+    assert np.allclose(loaded.fidelity(), (full_result.data.state == 0).mean(["repeat", "average"]))
+
+
+def test_histogram_only_result_matches_full_result(tmp_path):
+    """
+    Tests that a result built from the counts of every circuit has the same fidelities as one built from the states.
+    """
+    rng = np.random.default_rng(3)
+    depths, num_repeats, num_averages = [1, 5, 10], 4, 30
+    state = np.concatenate([_measure(rng, depth, num_repeats, num_averages) for depth in depths])
+    counts = (state[:, :, np.newaxis] == np.arange(4)).sum(axis=1)
+
+    result = RBResult.empty(depths, num_repeats, num_averages, path=tmp_path / "result.h5", histogram_only=True)
+    for batch in np.array_split(counts, 5):
+        result.add_circuit_counts(batch)
+    result.close()
+
+    full_result = RBResult(depths, num_repeats, num_averages, state.reshape(len(depths), num_repeats, num_averages))
+    loaded = RBResult.load(tmp_path / "result.h5")
+    assert loaded.histogram_only
+    assert np.array_equal(loaded.counts, full_result.counts)
+    assert np.allclose(loaded.fidelity(), full_result.fidelity())
+
+
+def test_split_result_by_experiment():
+    """
+    Tests that the circuits of a campaign, run in a random order, are split into the results of their experiments.
+    """
+    rng = np.random.default_rng(4)
+    depths, num_repeats, num_averages = [1, 5], 3, 10
+    labels = np.array([rng.permutation(np.repeat(["reference", "CZ"], num_repeats)) for _ in depths])
+    state = rng.integers(0, 4, (len(depths), 2 * num_repeats, num_averages))
+
+    results = RBResult(depths, 2 * num_repeats, num_averages, state).split(labels)
+
+    assert set(results) == {"reference", "CZ"}
+    for label, result in results.items():
+        assert result.num_repeats == num_repeats
+        for i in range(len(depths)):
+            assert np.array_equal(result.state[i], state[i, labels[i] == label])
+
+
+def test_fit_partial_result():
+    """
+    Tests that the decay is fitted from the circuits measured so far, with bootstrapped error bars.
+    """
+    rng = np.random.default_rng(1)
+    depths, num_repeats, num_averages = [1, 5, 10, 20, 50, 100], 20, 200
+    result = RBResult.empty(depths, num_repeats, num_averages)
+
+    result.add_circuits(_measure(rng, depths[0], num_repeats, num_averages))
+    with pytest.raises(RuntimeError):
+        result.fit()
+
+    for depth in depths[1:]:
+        result.add_circuits(_measure(rng, depth, num_repeats, num_averages))
+    fit = result.fit(num_bootstrap=50, seed=2)
+
+    assert fit.p == pytest.approx(0.97, abs=3 * fit.p_err + 1e-3)
+    assert 0 < fit.p_err < 0.01
+    assert fit.num_circuits == result.num_circuits
+
+
+if __name__ == "__main__":
+    test_fit_partial_result()
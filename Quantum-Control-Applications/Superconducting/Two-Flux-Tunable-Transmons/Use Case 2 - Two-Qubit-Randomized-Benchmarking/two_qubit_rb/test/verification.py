@@ -1,7 +1,18 @@
+import copy
 import os
+import tempfile
+
+import cirq
+import numpy as np
+import pytest
+from qm import generate_qua_script
+from qm.qua import declare
 from qualang_tools.bakery.bakery import Baking
 from configuration import *
-from .. import TwoQubitRb
+from .. import SimultaneousTwoQubitRb, TwoQubitRb
+from . import helpers
+from ..gates import q1, q2
+from ..verification import CommandRegistry, load_sequences
 
 
 def test_all_verification():
@@ -55,5 +66,187 @@ def test_all_verification():
         rb.verify_sequences()
 
 
+def test_batched_sequence_conversion():
+    """
+    Tests that the batched conversion of sequences of different lengths to circuits and unitaries agrees with the
+    conversion of every sequence on its own.
+    """
+
+    def bake_phased_xz(baker: Baking, q, x, z, a):
+        pass
+
+    def bake_cz(baker: Baking, q1, q2):
+        pass
+
+    rb = TwoQubitRb(config, bake_phased_xz, {"CZ": bake_cz}, lambda: None, lambda: None)
+    sequences = [rb._gen_rb_sequence(depth) for depth in [1, 4, 1, 7, 4]]
+
+    unitaries = rb.convert_sequences_to_unitaries(sequences)
+    circuits = rb.convert_sequences_to_cirq(sequences)
+
+    for sequence, unitary, circuit in zip(sequences, unitaries, circuits):
+        expected = cirq.Circuit(rb.convert_sequence_to_cirq(sequence)).unitary(qubit_order=[q1, q2])
+        assert np.allclose(unitary, expected)
+        assert np.allclose(circuit.unitary(qubit_order=[q1, q2]), expected)
+        # every sequence recovers the identity, up to a global phase
+        assert np.allclose(np.abs(np.trace(unitary)), 4)
+
+
+def test_seeded_sequences_are_reproducible():
+    """
+    Tests that the sequences of a seed are regenerated identically, batch by batch in any order, and that the
+    sequences of a campaign differ between seeds.
+    """
+
+    def bake_phased_xz(baker: Baking, q, x, z, a):
+        pass
+
+    def bake_cz(baker: Baking, q1, q2):
+        pass
+
+    rb = TwoQubitRb(
+        config, bake_phased_xz, {"CZ": bake_cz}, lambda: None, lambda: None, interleaving_gate=[cirq.CZ(q1, q2)]
+    )
+    depths = [1, 3, 5]
+
+    sequences = rb.generate_sequences(depths, 10, seed=1234)
+    assert len(sequences) == 30
+    assert sequences == rb.generate_sequences(depths, 10, seed=1234)
+
+    # the generator threads may run the batches in any order
+    _, _, seed_sequence = rb._plan_circuits(depths, 10, None, 1234)
+    tasks = rb._sequence_tasks(depths, 10, None, seed_sequence)
+    batches = {i: rb._gen_input_stream_batch(None, tasks[i])[0][0] for i in reversed(range(len(tasks)))}
+    assert [s.tolist() for i in range(len(tasks)) for s in batches[i]] == sequences
+
+    experiments = ["reference", "interleaved"]
+    campaign = rb.generate_sequences(depths, 4, seed=5, experiments=experiments)
+    assert campaign == rb.generate_sequences(depths, 4, seed=5, experiments=experiments)
+    assert campaign != rb.generate_sequences(depths, 4, seed=6, experiments=experiments)
+
+
+def test_binary_sequence_log(tmp_path):
+    """
+    Tests that the sequences and the command mapping saved in the binary format are loaded back unchanged.
+    """
+
+    def bake_phased_xz(baker: Baking, q, x, z, a):
+        pass
+
+    def bake_cnot(baker: Baking, q1, q2):
+        pass
+
+    rb = TwoQubitRb(config, bake_phased_xz, {"CNOT": bake_cnot}, lambda: None, lambda: None)
+    sequences = [rb._gen_rb_sequence(depth) for depth in [3, 1, 8, 3]]
+    for sequence in sequences:
+        rb._sequence_tracker.make_sequence(sequence)
+
+    rb.save_sequences_to_file(tmp_path / "sequences.bin", binary=True)
+    command_ids, offsets = load_sequences(tmp_path / "sequences.bin")
+    assert [command_ids[start:end].tolist() for start, end in zip(offsets[:-1], offsets[1:])] == sequences
+    assert rb._sequence_tracker.get_sequence(2).tolist() == sequences[2]
+
+    rb.save_command_mapping_to_file(tmp_path / "commands.bin", binary=True)
+    commands = CommandRegistry.load_commands(tmp_path / "commands.bin")
+    assert commands == rb._command_registry.get_commands()
+
+
+def _measure():
+    return declare(bool), declare(bool)
+
+
+def _pair_generators(xy_elements, z_element, z_operation):
+    """Gate generators playing the gates of qubits 1 and 2 on the given elements."""
+
+    def bake_phased_xz(baker: Baking, q, x, z, a):
+        qe = xy_elements[q - 1]
+        baker.frame_rotation_2pi(a / 2, qe)
+        baker.play("x180", qe, amp=x)
+        baker.frame_rotation_2pi(-(a + z) / 2, qe)
+
+    def bake_cz(baker: Baking, q1, q2):
+        baker.play(z_operation, z_element)
+        baker.align()
+
+    return bake_phased_xz, {"CZ": bake_cz}
+
+
+def test_simultaneous_pairs():
+    """
+    Tests that the program of two qubit pairs on disjoint elements is generated with a stream per pair, in the
+    full-buffer and in the chunked histogram-only modes, that the sequences of every pair are generated, that the
+    result of every pair is written to a file of its own, and that pairs sharing elements are rejected.
+    """
+    pairs_config = copy.deepcopy(config)
+    pairs_config["elements"]["q3_xy"] = copy.deepcopy(config["elements"]["q1_xy"])
+    pairs_config["elements"]["q4_xy"] = copy.deepcopy(config["elements"]["q2_xy"])
+    first = TwoQubitRb(pairs_config, *_pair_generators(["q1_xy", "q2_xy"], "q1_z", "cz"), lambda: None, _measure)
+    second = TwoQubitRb(pairs_config, *_pair_generators(["q3_xy", "q4_xy"], "q2_z", "const"), lambda: None, _measure)
+    assert first._rb_baker.all_elements == {"q1_xy", "q2_xy", "q1_z"}
+    assert second._rb_baker.all_elements == {"q3_xy", "q4_xy", "q2_z"}
+
+    rb = SimultaneousTwoQubitRb([first, second], lambda: None)
+    script = generate_qua_script(rb._gen_qua_program([1, 4], 2, 3))
+    assert 'save_all("state_0")' in script and 'save_all("state_1")' in script
+    script = generate_qua_script(rb._gen_qua_program([1, 4], 2, 3, chunk_size=5, histogram_only=True))
+    assert 'save_all("counts_0")' in script and 'save_all("counts_1")' in script
+    for qe in first._rb_baker.all_elements | second._rb_baker.all_elements:
+        assert f"declare_input_stream(int, '{qe}_is', size=5)" in script
+
+    sequences = rb.generate_sequences([1, 4], 3, seed=7)
+    assert len(sequences) == 2
+    assert [len(pair_sequences) for pair_sequences in sequences] == [6, 6]
+    assert sequences[0] != sequences[1]
+    assert rb.input_stream_stats is None and rb.last_seed is None
+    assert rb._pair_path("result.h5", 1).name == "result_pair1.h5"
+    assert first._pair_path("result.h5", 0).name == "result.h5"
+
+    with pytest.raises(ValueError):
+        SimultaneousTwoQubitRb([first, first], lambda: None)
+
+
+def test_chunked_input_streams():
+    """
+    Tests that the program reads sequences longer than a chunk from chunks of the input streams, and that the chunks
+    inserted for every element decode back to the operations of the command ids of every sequence.
+    """
+    rb = TwoQubitRb(config, helpers.bake_phased_xz, {"CZ": helpers.bake_cz}, lambda: None, _measure)
+    depths = [1, 9]
+    chunk_size = 5
+    assert rb._sequence_length(min(depths)) < chunk_size < rb._sequence_length(max(depths))
+
+    script = generate_qua_script(rb._gen_qua_program(depths, 3, 2, chunk_size=chunk_size))
+    for qe in rb._rb_baker.all_elements:
+        assert f"declare_input_stream(int, '{qe}_is', size={chunk_size})" in script
+
+    job = helpers.FakeJob()
+    rb._insert_all_input_stream(job, depths, 3, chunk_size=chunk_size).join()
+    streams = {}
+    for name, data in job.inserts:
+        streams.setdefault(name, []).append(data)
+    lengths = streams.pop("__gates_len_is__")
+    assert len(lengths) == rb._sequence_tracker.num_sequences == 6
+    assert set(streams) == {f"{qe}_is" for qe in rb._rb_baker.decode_elements}
+
+    offsets = {qe: 0 for qe in rb._rb_baker.decode_elements}
+    for i, length in enumerate(lengths):
+        sequence = rb._sequence_tracker.get_sequence(i).tolist()
+        assert len(sequence) == length
+        num_chunks = -(-length // chunk_size)
+        for qe in rb._rb_baker.decode_elements:
+            chunks = streams[f"{qe}_is"][offsets[qe] : offsets[qe] + num_chunks]
+            offsets[qe] += num_chunks
+            assert all(len(chunk) == chunk_size for chunk in chunks)
+            operations = [op for chunk in chunks for op in chunk]
+            assert operations[:length] == [rb._rb_baker.decode(cmd_id, qe) for cmd_id in sequence]
+            assert not any(operations[length:])
+    assert all(offsets[qe] == len(streams[f"{qe}_is"]) for qe in offsets)
+
+
 if __name__ == "__main__":
     test_all_verification()
+    test_batched_sequence_conversion()
+    test_seeded_sequences_are_reproducible()
+    test_binary_sequence_log(Path(tempfile.mkdtemp()))
+    test_simultaneous_pairs()
+    test_chunked_input_streams()
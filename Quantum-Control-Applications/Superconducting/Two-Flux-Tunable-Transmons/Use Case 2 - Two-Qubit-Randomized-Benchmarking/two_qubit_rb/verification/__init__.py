@@ -1,3 +1,3 @@
 from . import gates
 from .command_registry import CommandRegistry
-from .sequence_tracker import SequenceTracker
+from .sequence_tracker import SequenceTracker, load_sequences
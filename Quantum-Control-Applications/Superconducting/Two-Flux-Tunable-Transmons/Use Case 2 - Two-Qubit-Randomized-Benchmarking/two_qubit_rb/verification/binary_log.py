@@ -0,0 +1,54 @@
+from pathlib import Path
+from typing import Dict, Union
+
+import numpy as np
+
+# A file of named arrays, each written in the .npy format one after the other, so that (unlike in an .npz archive)
+# every array can be memory-mapped. Ragged arrays are stored as the concatenation of their rows and the offsets of the
+# rows, i.e. row `i` is `values[offsets[i]:offsets[i + 1]]`.
+_MAGIC = b"QMRBLOG1"
+
+
+def save_arrays(path: Union[str, Path], **arrays: np.ndarray):
+    """Writes the given arrays to a single file, in the order they are given."""
+    with open(path, "wb") as f:
+        f.write(_MAGIC)
+        for name, array in arrays.items():
+            encoded_name = name.encode()
+            f.write(len(encoded_name).to_bytes(1, "little") + encoded_name)
+            np.lib.format.write_array(f, np.ascontiguousarray(array), allow_pickle=False)
+
+
+def load_arrays(path: Union[str, Path], mmap: bool = True) -> Dict[str, np.ndarray]:
+    """Loads the arrays of a file written by `save_arrays`, memory-mapped (read-only) if `mmap` is True."""
+    arrays = {}
+    with open(path, "rb") as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError(f"{path} is not a binary RB log")
+        while True:
+            name_length = f.read(1)
+            if not name_length:
+                break
+            name = f.read(name_length[0]).decode()
+            if not mmap:
+                arrays[name] = np.lib.format.read_array(f, allow_pickle=False)
+                continue
+            if np.lib.format.read_magic(f) == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            offset = f.tell()
+            size = int(np.prod(shape)) * dtype.itemsize
+            if size == 0:
+                arrays[name] = np.empty(shape, dtype)
+            else:
+                order = "F" if fortran_order else "C"
+                arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape, order=order)
+            f.seek(offset + size)
+    return arrays
+
+
+def ragged_rows(values: np.ndarray, offsets: np.ndarray):
+    """Iterates over the rows of a ragged array."""
+    for start, end in zip(offsets[:-1], offsets[1:]):
+        yield values[start:end]
@@ -1,12 +1,58 @@
+import contextlib
 from pathlib import Path
-from typing import Union, Callable, Literal
+from typing import Dict, Union, Callable, Literal, Optional
 
+import numpy as np
 from qualang_tools.bakery.bakery import Baking
 
+from .binary_log import load_arrays, ragged_rows, save_arrays
 from .gates import PhasedXZ, CZ, CNOT, Gate
 
 Command = list[Gate]
 
+# the record of a gate in the binary format, where `kind` is the index of the gate class in `_GATE_KINDS`, and the
+# fields which a gate does not have are zero
+_GATE_DTYPE = np.dtype([("kind", np.uint8), ("q", np.int8), ("x", np.float64), ("z", np.float64), ("a", np.float64)])
+_GATE_KINDS = [PhasedXZ, CZ, CNOT]
+
+
+def _gate_to_record(gate: Gate) -> tuple:
+    return (
+        _GATE_KINDS.index(type(gate)),
+        getattr(gate, "q", 0),
+        getattr(gate, "x", 0),
+        getattr(gate, "z", 0),
+        getattr(gate, "a", 0),
+    )
+
+
+def _gate_from_record(record: np.void) -> Gate:
+    gate_class = _GATE_KINDS[record["kind"]]
+    if gate_class is PhasedXZ:
+        return PhasedXZ(q=int(record["q"]), x=float(record["x"]), z=float(record["z"]), a=float(record["a"]))
+    if gate_class is CNOT:
+        return CNOT(q=int(record["q"]))
+    return gate_class()
+
+
+def commands_to_arrays(commands: Dict[int, Command]) -> Dict[str, np.ndarray]:
+    """The gates of every command as a ragged array of gate records, with the id of every command."""
+    gates = [_gate_to_record(gate) for command in commands.values() for gate in command]
+    offsets = np.cumsum([0] + [len(command) for command in commands.values()])
+    return {
+        "command_ids": np.array(list(commands.keys()), dtype=np.int64),
+        "gates": np.array(gates, dtype=_GATE_DTYPE),
+        "offsets": offsets.astype(np.int64),
+    }
+
+
+def commands_from_arrays(arrays: Dict[str, np.ndarray]) -> Dict[int, Command]:
+    """The inverse of `commands_to_arrays`."""
+    return {
+        command_id: [_gate_from_record(record) for record in records]
+        for command_id, records in zip(arrays["command_ids"].tolist(), ragged_rows(arrays["gates"], arrays["offsets"]))
+    }
+
 
 class CommandRegistry:
     """
@@ -17,6 +63,7 @@ class CommandRegistry:
     def __init__(self):
         self._current_command_id = 0
         self._commands: dict[int, Command] = {}
+        self._command_matrices: Optional[np.ndarray] = None
         self._is_finished = False
 
     def register_phase_xz(self, q, x, z, a):
@@ -40,28 +87,67 @@ class CommandRegistry:
             command_list = []
             self._commands[self._current_command_id] = command_list
         command_list.append(gate)
+        self._command_matrices = None
 
     def get_command_by_id(self, command_id: int):
         return self._commands[command_id]
 
+    def has_command(self, command_id: int) -> bool:
+        return command_id in self._commands
+
+    def get_commands(self) -> dict[int, Command]:
+        return self._commands
+
+    def register_command(self, command_id: int, command: Command):
+        """registers all gates of a command at once, e.g. when they were recorded by another process."""
+        if self.is_finished():
+            return
+        self._commands[command_id] = list(command)
+        self._command_matrices = None
+
+    def get_command_matrices(self) -> np.ndarray:
+        """
+        The 4x4 matrix of every command, i.e. the product of the matrices of its gates in the order they are played,
+        as an array indexed by the command id. Computed once and cached until another gate is registered.
+        """
+        if self._command_matrices is None:
+            num_commands = max(self._commands.keys(), default=-1) + 1
+            matrices = np.full((num_commands, 4, 4), np.nan, dtype=complex)
+            for command_id, command in self._commands.items():
+                matrix = np.eye(4, dtype=complex)
+                for gate in command:
+                    matrix = gate.matrix() @ matrix
+                matrices[command_id] = matrix
+            self._command_matrices = matrices
+        return self._command_matrices
+
     def set_current_command_id(self, command_id: int):
         self._current_command_id = command_id
 
-    def _serialize_commands(self):
-        result = ""
-        for i in self._commands.keys():
-            result += f"Command {i}:\n"
-            for j, gate in enumerate(self._commands[i]):
-                result += f"\t{j}: {gate}\n"
-            result += "\n"
-        return result
+    def _iter_serialized_commands(self):
+        for i, command in self._commands.items():
+            lines = [f"Command {i}:"] + [f"\t{j}: {gate}" for j, gate in enumerate(command)]
+            yield "\n".join(lines) + "\n\n"
 
     def print_commands(self):
-        print(self._serialize_commands())
-
-    def save_to_file(self, path: Union[str, Path]):
+        for serialized in self._iter_serialized_commands():
+            print(serialized, end="")
+
+    def save_to_file(self, path: Union[str, Path], binary: bool = False):
+        """
+        Saves the gates of every command as text, or if `binary` is True, as a ragged array in the binary format of the
+        sequence log (see `load_commands`).
+        """
+        if binary:
+            save_arrays(path, **commands_to_arrays(self._commands))
+            return
         with open(path, "w+") as f:
-            f.write(self._serialize_commands())
+            f.writelines(self._iter_serialized_commands())
+
+    @staticmethod
+    def load_commands(path: Union[str, Path]) -> dict[int, Command]:
+        """Loads the gates of every command from a file written by `save_to_file(path, binary=True)`."""
+        return commands_from_arrays(load_arrays(path, mmap=False))
 
     def finish(self):
         """disable the incidental recording of any more commands."""
@@ -70,6 +156,16 @@ class CommandRegistry:
     def is_finished(self):
         return self._is_finished
 
+    @contextlib.contextmanager
+    def paused(self):
+        """disable the recording of commands within the context, e.g. while baking gates outside of any command."""
+        was_finished = self._is_finished
+        self._is_finished = True
+        try:
+            yield
+        finally:
+            self._is_finished = was_finished
+
 
 PhasedXZGeneratorFunc = Callable[[Baking, int, float, float, float], None]
 SingleQubitGateGeneratorFunc = Union[PhasedXZGeneratorFunc]
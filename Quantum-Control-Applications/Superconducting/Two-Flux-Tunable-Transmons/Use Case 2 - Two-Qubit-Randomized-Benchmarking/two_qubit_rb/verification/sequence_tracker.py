@@ -1,72 +1,116 @@
-from typing import Union
+from typing import Iterator, Union
 
 import numpy as np
 
+from .binary_log import load_arrays, ragged_rows, save_arrays
 from .command_registry import *
 
 
 class SequenceTracker:
     """
-    Tracks a randomly-generated sequence by recording both a list of qubit gates
-    corresponding to the sequence, and the raw command IDs which are used as
-    input to the input stream to map into baked pulses.
+    Tracks the randomly-generated sequences by recording the raw command IDs which
+    are used as input to the input stream to map into baked pulses, in an
+    append-only ragged array: the command ids of all the sequences one after the
+    other, and the offset at which every sequence starts. The gates of a sequence
+    are looked up in the command registry when needed.
     """
 
     def __init__(self, command_registry: CommandRegistry):
         self.command_registry: CommandRegistry = command_registry
-        self._sequences_as_gates: list[Command] = []
-        self._sequences_as_command_ids: list[list[int]] = []
+        self._command_ids = np.empty(1024, dtype=np.int16)
+        self._offsets = np.zeros(129, dtype=np.int64)
+        self._num_sequences = 0
 
     def make_sequence(self, command_ids: list[int]):
         """
-        Adds a new sequence to the tracker, recorded as both a list
-        of gates and command ids
+        Appends a new sequence of command ids to the tracker.
         """
-        self._record_sequence_as_list_of_command_ids(command_ids)
-        self._record_sequence_as_list_of_gates(command_ids)
-
-    def _record_sequence_as_list_of_command_ids(self, command_ids: list[int]):
-        self._sequences_as_command_ids.append([])
-        for command_id in command_ids:
-            self._sequences_as_command_ids[-1].append(command_id)
-
-    def _record_sequence_as_list_of_gates(self, command_ids: list[int]):
-        self._sequences_as_gates.append([])
-        for command_id in command_ids:
-            command = self.command_registry.get_command_by_id(command_id)
-            for gate in command:
-                self._sequences_as_gates[-1].append(gate)
-
-    def _serialize_sequences(self):
-        result = ""
-        for i, sequence in enumerate(self._sequences_as_gates):
-            result += f"Sequence {i}:\n"
-            result += f"\tCommand IDs: {self._sequences_as_command_ids[i]}\n"
-            result += f"\tGates:\n"
-            for j, operation in enumerate(sequence):
-                result += f"\t\t{j}: {operation}\n"
-            result += "\n"
-        return result
+        start = self._offsets[self._num_sequences]
+        end = start + len(command_ids)
+        if end > len(self._command_ids):
+            self._command_ids = np.resize(self._command_ids, max(end, 2 * len(self._command_ids)))
+        if self._num_sequences + 2 > len(self._offsets):
+            self._offsets = np.resize(self._offsets, 2 * len(self._offsets))
+        self._command_ids[start:end] = command_ids
+        self._num_sequences += 1
+        self._offsets[self._num_sequences] = end
+
+    @property
+    def num_sequences(self) -> int:
+        return self._num_sequences
+
+    @property
+    def command_ids(self) -> np.ndarray:
+        """The command ids of all the sequences, one after the other."""
+        return self._command_ids[: self._offsets[self._num_sequences]]
+
+    @property
+    def offsets(self) -> np.ndarray:
+        """The offset of every sequence in `command_ids`, followed by the total number of command ids."""
+        return self._offsets[: self._num_sequences + 1]
+
+    def get_sequence(self, index: int) -> np.ndarray:
+        return self._command_ids[self._offsets[index] : self._offsets[index + 1]]
+
+    def get_sequence_gates(self, index: int) -> Command:
+        """Expands the sequence into the gates of its commands."""
+        return [
+            gate
+            for command_id in self.get_sequence(index).tolist()
+            for gate in self.command_registry.get_command_by_id(command_id)
+        ]
+
+    def _iter_serialized_sequences(self) -> Iterator[str]:
+        for i, command_ids in enumerate(ragged_rows(self.command_ids, self.offsets)):
+            lines = [f"Sequence {i}:", f"\tCommand IDs: {command_ids.tolist()}", "\tGates:"]
+            lines += [f"\t\t{j}: {operation}" for j, operation in enumerate(self.get_sequence_gates(i))]
+            yield "\n".join(lines) + "\n\n"
 
     def verify_sequences(self):
         """
         Checks that the application of all gates in a sequence to the |00>
         state correctly recovers to the |00> state at the end.
+
+        The state is propagated using the cached matrix of every command,
+        for all sequences of the same length at once.
         """
-        for i, sequence in enumerate(self._sequences_as_gates):
-            ground_state = np.kron(np.array([1, 0]), np.array([1, 0]))
-            ground_state_rho = np.outer(ground_state, ground_state.conj())
-            rho = ground_state_rho
-            for gate in sequence:
-                rho = gate.matrix() @ rho @ gate.matrix().conj().T
+        command_matrices = self.command_registry.get_command_matrices()
+        offsets = self.offsets
+        lengths = np.diff(offsets)
+        for length in np.unique(lengths):
+            starts = offsets[:-1][lengths == length]
+            command_ids = self._command_ids[starts[:, np.newaxis] + np.arange(length)]
+            state = np.zeros((len(starts), 4), dtype=complex)
+            state[:, 0] = 1
+            for i in range(length):
+                state = np.einsum("nij,nj->ni", command_matrices[command_ids[:, i]], state)
 
-            assert np.allclose(rho, ground_state_rho), f"expected to recover to at {ground_state_rho}, got {rho}"
+            recovered = np.isclose(np.abs(state[:, 0]), 1)
+            assert recovered.all(), f"expected to recover to |00>, got {state[~recovered][0]}"
 
-        print(f"Verification passed for all {len(self._sequences_as_gates)} sequence(s).")
+        print(f"Verification passed for all {self._num_sequences} sequence(s).")
 
     def print_sequences(self):
-        print(self._serialize_sequences())
+        for serialized in self._iter_serialized_sequences():
+            print(serialized, end="")
 
-    def save_to_file(self, path: Union[str, Path]):
-        with open(path, "w+") as f:
-            f.write(self._serialize_sequences())
+    def save_to_file(self, path: Union[str, Path], binary: bool = False):
+        """
+        Saves a text break-down of the gates of every sequence, or if `binary` is True, the command ids of the sequences
+        in the binary format of `load_sequences`.
+        """
+        if binary:
+            save_arrays(path, command_ids=self.command_ids, offsets=self.offsets)
+        else:
+            with open(path, "w+") as f:
+                f.writelines(self._iter_serialized_sequences())
+
+
+def load_sequences(path: Union[str, Path], mmap: bool = True) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Loads the sequences saved by `SequenceTracker.save_to_file(path, binary=True)`, memory-mapped by default. Returns
+    the command ids of all the sequences one after the other and the offsets of the sequences, so that sequence `i` is
+    `command_ids[offsets[i]:offsets[i + 1]]`.
+    """
+    arrays = load_arrays(path, mmap)
+    return arrays["command_ids"], arrays["offsets"]
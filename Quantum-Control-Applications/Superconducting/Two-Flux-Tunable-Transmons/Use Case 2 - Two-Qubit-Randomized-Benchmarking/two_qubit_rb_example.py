@@ -124,4 +124,4 @@ rb.save_sequences_to_file("sequences.txt")  # saves the gates used in each rando
 # rb.save_command_mapping_to_file('commands.txt')  # saves mapping from "command id" to sequence
 # rb.print_sequences()
 # rb.print_command_mapping()
-# rb.verify_sequences() # simulates random sequences to ensure they recover to ground state. takes a while...
+# rb.verify_sequences()  # simulates random sequences to ensure they recover to ground state